@@ -0,0 +1,114 @@
+# TempController: per-call cost and allocations against the v002 controller,
+# that the D term still behaves as tuned, and that two controllers keep
+# their own state. Usage: python3 host/bench_control.py
+import hostenv
+from hostenv import perCall, allocs, EXACT_ALLOCS
+from control import TempController
+
+
+class LegacyTempController:
+    # The controller we shipped with v002, minus its prints: class level
+    # history list, appended and popped twice per call
+    __pidRangeMin__ = 20
+    __pidRangeMax__ = 10
+    P = .12
+    I = 0.01
+    D = 0.4
+    __iAccumulator__ = 0.0
+    __iMax__ = 0.3
+    __dLast__ = [0.0, 0.0, 0.0, 0.0]
+
+    def iLimit(self, num):
+        return max(min(num, self.__iMax__), self.__iMax__ * -1.0)
+
+    def getDemand(self, setValue, processValue):
+        self.__dLast__.append(processValue)
+        self.__dLast__.pop(0)
+        diffs = [self.__dLast__[i+1]-self.__dLast__[i] for i in range(len(self.__dLast__)-1)]
+        if processValue < setValue - self.__pidRangeMin__ :
+            return 1.0
+        if processValue > setValue + self.__pidRangeMax__ :
+            return 0.0
+        error = setValue - processValue
+        i = error * self.I
+        self.__iAccumulator__ = self.iLimit(i + self.__iAccumulator__)
+        self.__dLast__.append(processValue)
+        self.__dLast__.pop(0)
+        diffs = [self.__dLast__[i+1]-self.__dLast__[i] for i in range(len(self.__dLast__)-1)]
+        d = self.D * (sum(diffs)/len(diffs)) * -1.0
+        p = error * self.P
+        demand =  p + self.__iAccumulator__ + d
+        if demand > 1.0:
+            demand = 1.0
+        if demand < 0.0:
+            demand = 0.0
+        return demand
+
+
+def quiet(controller):
+    controller.debug = False
+    return controller
+
+
+def checkNoSharedState():
+    a = quiet(TempController())
+    b = quiet(TempController())
+    for pv in (340.0, 342.0, 344.0, 346.0):
+        a.getDemand(350, pv)
+    b.getDemand(350, 300.0)
+    before = a.getDemand(350, 348.0)
+    fresh = quiet(TempController())
+    for pv in (340.0, 342.0, 344.0, 346.0):
+        fresh.getDemand(350, pv)
+    assert before == fresh.getDemand(350, 348.0), "controllers share state"
+    assert a.__dLast__ is not b.__dLast__
+
+    # and the v002 one really did share it
+    x = LegacyTempController()
+    y = LegacyTempController()
+    x.getDemand(350, 340.0)
+    assert x.__dLast__ is y.__dLast__ and y.__dLast__[-1] == 340.0
+    print("two controllers keep separate state (v002's shared its history)")
+
+
+def checkSameD():
+    # on a steady ramp the D term matches what v002 actually did once its
+    # history has filled
+    old = LegacyTempController()
+    new = quiet(TempController())
+    for n in range(20):
+        pv = 330.0 + 0.8 * n
+        expected = old.getDemand(350, pv)
+        got = new.getDemand(350, pv)
+        if n >= 4:
+            assert abs(expected - got) < 1e-5, (n, expected, got)
+    print("D term matches v002 on a steady ramp")
+
+
+def bench():
+    old = LegacyTempController()
+    new = quiet(TempController())
+    state = [0]
+
+    def step(controller):
+        state[0] = (state[0] + 1) & 7
+        return controller.getDemand(350, 345.0 + state[0])
+
+    print("v002:    {:.2f}us per getDemand()".format(perCall(lambda: step(old))))
+    print("ring:    {:.2f}us per getDemand()".format(perCall(lambda: step(new))))
+    oldBytes = allocs(lambda: step(old))
+    newBytes = allocs(lambda: step(new))
+    if EXACT_ALLOCS:
+        print("v002:    {:.1f} bytes allocated per call".format(oldBytes / 1000))
+        print("ring:    {:.1f} bytes allocated per call (boxed floats)".format(newBytes / 1000))
+    else:
+        # CPython recycles floats, so this only sees the lists v002 built
+        print("v002:    {} bytes peak over 1000 calls".format(oldBytes))
+        print("ring:    {} bytes peak over 1000 calls".format(newBytes))
+    assert newBytes < oldBytes
+
+
+if __name__ == "__main__":
+    checkNoSharedState()
+    checkSameD()
+    bench()
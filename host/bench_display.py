@@ -0,0 +1,293 @@
+# Microbenchmarks for the display refresh path, run on the host against the
+# stand-in machine.Pin. Usage: python3 host/bench_display.py
+import hostenv
+from hostenv import perCall, allocs
+from machine import Pin, mem32
+import display
+from display import Display, MAX_DIGITS
+import display_sio
+from display_sio import SioDisplay
+
+
+# The dict font we shipped with v002
+characterLUT = {
+    " ": 0x0, "0": 0x3f, "1": 0x06, "2": 0x5b, "3": 0x4f, "4": 0x66, "5": 0x6d, "6": 0x7d,
+    "7": 0x07, "8": 0x7f, "9": 0x6f, "a": 0x77, "b": 0x0, "c": 0x0, "d": 0x0, "e": 0x0,
+    "f": 0x0, "l": 0x30, "o": 0b01011100, "-": 0x40
+}
+
+
+class LegacyDisplay:
+    # The nextDigit() we shipped with v002: LUT lookup and per-bit Pin.init every tick
+    def __init__(self, sv, pv):
+        d = Display()
+        self.ledSegments = d.ledSegments
+        self.ledDigits = d.ledDigits
+        self.ledDE = d.ledDE
+        self.SV = sv
+        self.PV = pv
+        self.stateDisplay = False
+        self.stateDigit = 0
+
+    def getDigit(self, char):
+        index = char[0]
+        if index in characterLUT:
+            return characterLUT[index]
+        return 0x0
+
+    def nextDigit(self):
+        self.stateDigit += int(1)
+        if self.stateDigit >= MAX_DIGITS:
+            self.stateDigit = 0
+            self.stateDisplay = not self.stateDisplay
+
+        if self.stateDisplay == False:
+            bitmap = self.getDigit(self.SV[self.stateDigit])
+            if bitmap == 0:
+                self.ledDE.low()
+                return
+            self.ledDE.high()
+            for idx, digit in enumerate(self.ledDigits):
+                if idx == self.stateDigit:
+                    digit.low()
+                else:
+                    digit.high()
+            counter = 0
+            for segment in self.ledSegments:
+                value = 1 if bitmap & (1 << counter) > 0 else 0
+                pinState = Pin.OUT if value == 1 else Pin.IN
+                segment.init(mode=pinState, value=value, pull=None)
+                counter += 1
+        else:
+            bitmap = self.getDigit(self.PV[self.stateDigit])
+            if bitmap == 0:
+                self.ledDE.low()
+                return
+            self.ledDE.high()
+            for idx, digit in enumerate(self.ledDigits):
+                if idx == self.stateDigit:
+                    digit.high()
+                else:
+                    digit.low()
+            counter = 0
+            for segment in self.ledSegments:
+                value = 0 if bitmap & (1 << counter) > 0 else 1
+                pinState = Pin.OUT if value == 0 else Pin.IN
+                segment.init(mode=pinState, value=value, pull=None)
+                counter += 1
+
+
+def pinStates(d):
+    return [(p.mode, p.value()) for p in d.ledSegments] + [p.value() for p in d.ledDigits] + [d.ledDE.value()]
+
+
+def checkSameOutput():
+    # Both paths have to leave the pins in the same state after every tick
+    for sv, pv in (("350", "275"), (" lo", "---"), ("  5", "a01")):
+        old = LegacyDisplay(sv, pv)
+        new = Display()
+        new.setSV(sv)
+        new.setPV(pv)
+        # line the scans up: legacy starts at SV digit 0 and advances first
+        for _ in range(12):
+            old.nextDigit()
+            new.nextDigit()
+            assert pinStates(old) == pinStates(new), (sv, pv)
+
+
+def sioStates(d):
+    # Same shape as pinStates(), read back from the modelled SIO registers.
+    # Only driven lines have a meaningful level
+    out = mem32[display_sio.SIO_BASE + 0x010]
+    oe = mem32[display_sio.SIO_BASE + 0x020]
+    def state(pin):
+        return (oe >> pin.id) & 1, (out >> pin.id) & 1
+    segments = [(m, v if m else None) for m, v in map(state, d.ledSegments)]
+    return segments + [state(p)[1] for p in d.ledDigits] + [state(d.ledDE)[1]]
+
+
+def checkSio():
+    assert display_sio.SEGMENT_MASK == (1 << 5) | (0x7f << 16)
+    assert display_sio.DIGIT_MASK == 0b111 << 13
+    assert display_sio.ENABLE_MASK == 1 << 12
+
+    for sv, pv in (("350", "275"), (" lo", "---"), ("  5", "abc")):
+        ref = Display()
+        sio = SioDisplay()
+        for d in (ref, sio):
+            d.setSV(sv)
+            d.setPV(pv)
+        mem32.regs.clear()
+        for _ in range(12):
+            ref.nextDigit()
+            mem32.log = []
+            mem32.recording = True
+            sio.nextDigit()
+            mem32.recording = False
+            # enable always goes low first and, if lit, high in the last write
+            assert mem32.log[0][0] == display_sio.GPIO_OUT_CLR and mem32.log[0][1] & display_sio.ENABLE_MASK
+            assert [a for a, v in mem32.log] == [display_sio.GPIO_OUT_CLR, display_sio.GPIO_OE_CLR,
+                display_sio.GPIO_OUT_SET, display_sio.GPIO_OE_SET, display_sio.GPIO_OUT_SET]
+            assert all(v & display_sio.ENABLE_MASK == 0 for a, v in mem32.log[1:4])
+            if ref.ledDE.value() == 0:
+                assert mem32[display_sio.SIO_BASE + 0x010] & display_sio.ENABLE_MASK == 0
+                continue
+            expected = [(m, v if m else None) for m, v in pinStates(ref)[:8]] + pinStates(ref)[8:]
+            assert sioStates(sio) == expected, (sv, pv, ref.slot)
+
+
+def checkFont():
+    # every glyph the dict had still looks the same, and the holes are filled
+    for char, bitmap in characterLUT.items():
+        assert bitmap == 0 or display.glyph(char) == bitmap, char
+    for char in "0123456789abcdefABCDEF" + "ErrOPnShHot-":
+        assert display.glyph(char) != 0, char
+    assert display.glyph(" ") == 0 and display.glyph("\u00b0") == 0
+    assert allocs(lambda: display.glyph("5")) == 0
+
+
+def recordScan(d, ticks):
+    # Which slot the pins show after each tick: SV lights the one low digit
+    # line, PV the one high digit line. None when the commons are off
+    shown = []
+    for _ in range(ticks):
+        d.nextDigit()
+        if not d.ledDE.value():
+            shown.append(None)
+            continue
+        levels = [p.value() for p in d.ledDigits]
+        if levels.count(0) == 1:
+            shown.append(levels.index(0))
+        else:
+            shown.append(MAX_DIGITS + levels.index(1))
+    return shown
+
+
+def checkSchedule():
+    d = Display()
+    d.setSV(350)
+    d.setPV(275)
+    scans = display.MAX_BRIGHTNESS
+    assert recordScan(d, 6 * scans) == [1, 2, 3, 4, 5, 0] * scans
+
+    # PV at 1/4: lit on one scan in four. SV at 2/4: every other scan
+    d.setBrightness(d.DISPLAY_PV, 1)
+    d.setBrightness(d.DISPLAY_SV, 2)
+    shown = recordScan(d, 6 * scans)
+    shown = shown[-1:] + shown[:-1]  # recordScan starts one tick in
+    perScan = [shown[i * 6:(i + 1) * 6] for i in range(scans)]
+    assert [sum(1 for s in scan if s is not None and s >= 3) for scan in perScan] == [0, 0, 0, 3]
+    assert [sum(1 for s in scan if s is not None and s < 3) for scan in perScan] == [0, 3, 0, 3]
+
+    # SV blinking: lit for blinkPeriod cycles, then dark for as many. PV untouched
+    d.setBrightness(d.DISPLAY_SV, display.MAX_BRIGHTNESS)
+    d.setBrightness(d.DISPLAY_PV, display.MAX_BRIGHTNESS)
+    d.blink(d.DISPLAY_SV)
+    half = len(d.schedule) // 2
+    assert half == 6 * scans * d.blinkPeriod
+    shown = recordScan(d, len(d.schedule))
+    shown = shown[-1:] + shown[:-1]
+    assert all(s is not None for s in shown[:half])
+    assert all(s is None for s in shown[half:][0::6]) and all(s is not None for s in shown[half:][3::6])
+    d.blink(d.DISPLAY_SV, False)
+    assert len(d.schedule) == 6 * scans
+
+    # brightness costs the tick nothing
+    assert allocs(d.nextDigit) == 0
+
+
+def checkStats():
+    # 1ms ticks on a fake clock, with one 25ms stall (a GC pause, a long print)
+    now = [0]
+    display.ticks_us = lambda: now[0]
+    try:
+        d = Display()
+        d.setSV(350)
+        d.setPV(" lo")
+        d.enableStats()
+        for tick in range(6000):
+            now[0] += 25000 if tick == 3000 else 1000
+            d.nextDigit()
+        st = d.stats.snapshot()
+    finally:
+        display.ticks_us = hostenv.time.ticks_us
+    assert st.ticks == 6000 and st.maxGap == 25000
+    assert 1000 <= st.p99Gap <= 1000 + (1 << display.GAP_SHIFT)
+    assert st.blanks == 1000  # the blank PV digit, once a scan
+    assert st.fps == 6000 * 1000 // 6 // 6024
+    print("stats: {} fps, max gap {}us, p99 gap {}us, {} blank".format(st.fps, st.maxGap, st.p99Gap, st.blanks))
+
+
+def benchStats(n=20000):
+    d = Display()
+    d.setSV(350)
+    d.setPV(275)
+    without = perCall(d.nextDigit, n)
+    d.enableStats()
+    withStats = perCall(d.nextDigit, n)
+    print("ScanStats cost: {:.2f}us per nextDigit() ({:.2f}us -> {:.2f}us)".format(withStats - without, without, withStats))
+    assert withStats - without < 3
+
+
+def benchGlyph(n=20000):
+    legacy = LegacyDisplay("   ", "   ")
+    text = "350 lo"
+    def before():
+        for char in text:
+            legacy.getDigit(char)
+    def after():
+        for char in text:
+            display.glyph(char)
+    b = perCall(before, n) / len(text)
+    a = perCall(after, n) / len(text)
+    print("glyph lookup: dict {:.3f}us, FONT {:.3f}us per char".format(b, a))
+
+
+def benchNextDigit(n=20000):
+    old = LegacyDisplay("350", "275")
+    new = Display()
+    new.setSV(350)
+    new.setPV(275)
+    before = perCall(old.nextDigit, n)
+    after = perCall(new.nextDigit, n)
+    print("nextDigit: before {:.2f}us, after {:.2f}us per call ({:.1f}x)".format(before, after, before / after))
+    # on the host this mostly measures the Mem32 stand-in, not the SIO writes
+    sio = SioDisplay()
+    sio.setSV(350)
+    sio.setPV(275)
+    print("SioDisplay.nextDigit: {:.2f}us per call".format(perCall(sio.nextDigit, n)))
+
+
+def checkTimerRefresh():
+    for cls in (Display, SioDisplay):
+        d = cls(scanHz=2000)
+        assert d.selfRefresh
+        d.setSV(350)
+        d.setPV(" lo")
+        d.start()
+        assert d.timer.freq == 2000
+        d.timer.fire(len(d.schedule))
+        assert d.isStarting()
+        # a plain dict as the register sink: the Mem32 model does int maths
+        # of its own, which CPython would count against nextDigit()
+        display_sio.mem32 = {}
+        used = allocs(d.timer.fire)
+        display_sio.mem32 = mem32
+        print("{} timer refresh: {} bytes allocated over 1000 callbacks".format(cls.__name__, used))
+        assert used == 0
+        timer = d.timer
+        d.off()
+        assert d.timer is None and timer.callback is None
+    assert not Display().selfRefresh
+
+
+if __name__ == "__main__":
+    checkSameOutput()
+    checkSio()
+    checkTimerRefresh()
+    checkFont()
+    checkSchedule()
+    checkStats()
+    benchGlyph()
+    benchNextDigit()
+    benchStats()
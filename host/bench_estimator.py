@@ -0,0 +1,120 @@
+# Temperature/rate estimator accuracy on synthetic traces, against the rate
+# the old controller saw (readings 5s apart) and a plain 20Hz difference.
+# Usage: python3 host/bench_estimator.py
+import hostenv
+import math
+import random
+from estimator import TempEstimator
+from hostenv import perCall
+
+PERIOD_MS = 50
+NOISE_F = 0.5 # reading noise, sd
+DROP_RATE = 0.02 # fraction of readings that never arrive (no quiet window)
+
+
+def heating(t):
+    # cold oil to 350F, first order with a 4 minute time constant
+    return 350 - 280 * math.exp(-t / 240), 280 / 240 * math.exp(-t / 240)
+
+
+def quench(t):
+    # holding 350F, a basket goes in at 30s: 40F down over ~15s, then it
+    # claws back over a couple of minutes
+    if t < 30:
+        return 350.0, 0.0
+    u = t - 30
+    drop = 40 * (math.exp(-u / 100) - math.exp(-u / 6)) / (1 - 6 / 100)
+    rate = 40 * (-math.exp(-u / 100) / 100 + math.exp(-u / 6) / 6) / (1 - 6 / 100)
+    return 350 - drop, -rate
+
+
+def readings(trace, seconds, seed):
+    rng = random.Random(seed)
+    ms = 0
+    while ms <= seconds * 1000:
+        ms += PERIOD_MS + rng.randint(-3, 3) # scheduling jitter
+        if rng.random() < DROP_RATE:
+            continue
+        temp, rate = trace(ms / 1000)
+        yield ms, round(temp + rng.gauss(0, NOISE_F), 1), temp, rate
+
+
+class Legacy:
+    # what TempController saw: one reading per 5s control period, rate from
+    # the mean difference of the last four
+    def __init__(self):
+        self.history = []
+        self.next = 0
+        self.rate = 0.0
+        self.temp = 0.0
+
+    def update(self, reading, ms):
+        if ms < self.next:
+            return
+        self.next += 5000
+        self.temp = reading
+        self.history = (self.history + [reading])[-4:]
+        if len(self.history) > 1:
+            self.rate = (self.history[-1] - self.history[0]) / (len(self.history) - 1) / 5
+
+
+class Difference:
+    # every reading, rate from the last two
+    def __init__(self):
+        self.last = None
+        self.rate = 0.0
+        self.temp = 0.0
+
+    def update(self, reading, ms):
+        if self.last is not None:
+            self.rate = (reading - self.last[0]) * 1000 / (ms - self.last[1])
+        self.last = (reading, ms)
+        self.temp = reading
+
+
+def score(make, trace, seconds, settle, seed=1):
+    est = make()
+    tempErr = rateErr = 0.0
+    n = 0
+    detected = None
+    for ms, reading, temp, rate in readings(trace, seconds, seed):
+        est.update(reading, ms)
+        if ms < settle * 1000:
+            continue
+        tempErr += (est.temp - temp) ** 2
+        rateErr += (est.rate - rate) ** 2
+        n += 1
+        if detected is None and est.rate < -1.0:
+            detected = ms / 1000
+    return math.sqrt(tempErr / n), math.sqrt(rateErr / n), detected
+
+
+if __name__ == "__main__":
+    estimators = (("5s history", Legacy), ("20Hz difference", Difference), ("Kalman", TempEstimator))
+    results = {}
+    for traceName, trace, seconds in (("heating", heating, 600), ("quench", quench, 180)):
+        print(traceName)
+        for name, make in estimators:
+            tempRms, rateRms, detected = score(make, trace, seconds, settle=20)
+            results[traceName, name] = rateRms, detected
+            line = "  {:16} temp rms {:5.2f}F  rate rms {:6.3f}F/s".format(name, tempRms, rateRms)
+            if trace is quench:
+                line += "  falling >1F/s seen at {}s".format(
+                    "never" if detected is None else "{:.2f}".format(detected))
+            print(line)
+
+    est = TempEstimator()
+    est.update(350.0, 0)
+    stamp = [0]
+
+    def step():
+        stamp[0] += PERIOD_MS
+        est.update(350.2, stamp[0])
+    print("Kalman update: {:.1f}us per reading on this host".format(perCall(step)))
+
+    for traceName in ("heating", "quench"):
+        assert results[traceName, "Kalman"][0] < results[traceName, "5s history"][0]
+        assert results[traceName, "Kalman"][0] < results[traceName, "20Hz difference"][0]
+    # the quench starts at 30s and passes 1F/s falling within about a second
+    assert results["quench", "Kalman"][1] < 31.5
+    assert results["heating", "Kalman"][1] is None
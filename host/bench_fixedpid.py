@@ -0,0 +1,99 @@
+# Fixed-point PID against the float TempController: the same demand (within
+# TOLERANCE of full power) on random walks through and around the PID band,
+# with the stock and some tuned gains, then cost per call, and allocations
+# per call under the unix port (the only place they mean anything).
+# Usage: python3 host/bench_fixedpid.py (or under the unix port)
+import hostenv
+from hostenv import perCall, allocs, EXACT_ALLOCS
+from control import TempController
+from fixedpid import FixedPid, ONE
+
+# gains round to 2**-24 per tenth F and the float ring is single precision,
+# so the two differ by far less than this
+TOLERANCE = 1e-4
+
+GAINS = (
+    (TempController.P, TempController.I, TempController.D),
+    (0.0230, 0.00120, 0.2900), # what sim_autotune comes up with
+    (0.5, 0.05, 1.0), # hot, to get the clamps working
+)
+
+
+class Lcg:
+    # the unix port's random has no Random class; the walks only need to be
+    # the same every run, and the same under both
+    def __init__(self, seed):
+        self.state = seed
+
+    def randint(self, lo, hi):
+        self.state = (self.state * 1103515245 + 12345) & 0x7FFFFFFF
+        return lo + (self.state >> 8) % (hi - lo + 1)
+
+
+def quiet(controller):
+    controller.debug = False
+    return controller
+
+
+def walk(rng, n):
+    # tenths of F, wandering from below the band to above it
+    pv = 3200
+    for _ in range(n):
+        pv += rng.randint(-8, 12) if pv < 3450 else rng.randint(-12, 8)
+        yield pv
+
+
+def checkEquivalent():
+    worst = 0.0
+    calls = 0
+    for seed in range(20):
+        for gains in GAINS:
+            rng = Lcg(seed)
+            floating = quiet(TempController())
+            floating.setGains(*gains)
+            fixed = FixedPid(*gains)
+            for pv in walk(rng, 500):
+                expected = floating.getDemand(350, pv / 10)
+                got = fixed.demand(3500, pv) / ONE
+                worst = max(worst, abs(expected - got))
+                calls += 1
+    print("{} calls, worst difference {:.2e} of full power".format(calls, worst))
+    assert worst < TOLERANCE, worst
+
+    # and the conversions the float call does on the way
+    assert FixedPid().getDemand(350, 345.7) == FixedPid().demand(3500, 3457) / ONE
+    P, I, D = FixedPid().gains()
+    assert abs(P - TempController.P) < 1e-6 and abs(I - TempController.I) < 1e-6 and abs(D - TempController.D) < 1e-6
+    print("getDemand() and gains() round trip")
+
+
+def bench():
+    floating = quiet(TempController())
+    fixed = FixedPid()
+    state = [0]
+
+    def stepFloat():
+        state[0] = (state[0] + 1) & 7
+        return floating.getDemand(350, 345.0 + state[0])
+
+    def stepFixed():
+        state[0] = (state[0] + 1) & 7
+        return fixed.demand(3500, 3450 + 10 * state[0])
+
+    print("float:   {:.2f}us per getDemand()".format(perCall(stepFloat)))
+    print("fixed:   {:.2f}us per demand()".format(perCall(stepFixed)))
+    if EXACT_ALLOCS:
+        floatBytes = allocs(stepFloat)
+        fixedBytes = allocs(stepFixed)
+        print("float:   {:.1f} bytes allocated per call".format(floatBytes / 1000))
+        print("fixed:   {:.1f} bytes allocated per call".format(fixedBytes / 1000))
+        assert fixedBytes == 0
+    else:
+        # CPython boxes ints above 256 and recycles floats, so its counts
+        # would say the opposite of what happens on the Pico
+        print("allocations: run under the unix port")
+
+
+if __name__ == "__main__":
+    checkEquivalent()
+    bench()
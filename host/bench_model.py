@@ -0,0 +1,92 @@
+# Heat-up and hold from cold on the simulated fryer, the controller as it
+# was against the same controller with a plant model identified during that
+# preheat driving feedforward and predictive cutoff, with the stock gains and
+# with autotuned ones. Reports rise time, time to settle within +-2F,
+# overshoot and IAE over an hour. The probe pins below about 123F, as on the
+# fryer, so the fit only sees the preheat from there up. Rise time is the
+# same both ways: full heat until the last 20F or so either way, and the
+# model can't make the element any stronger. What it buys is the arrival.
+# Usage: python3 host/bench_model.py
+import hostenv
+import uasyncio as asyncio
+from control import TempController
+from estimator import TempEstimator
+from model import FopdtIdentifier
+from plant import score
+from sim_autotune import Rig, autotune, SETPOINT, WINDOW_MS, READ_MS
+
+SECONDS = 3600
+SETTLE_F = 2.0
+
+
+def settle(samples, setpointF):
+    # last time the temperature was outside +-SETTLE_F
+    last = 0.0
+    for t, f in samples:
+        if abs(f - setpointF) > SETTLE_F:
+            last = t
+    return last
+
+
+def heat(rig, useModel, gains=None):
+    found = []
+
+    async def control(rig):
+        controller = TempController()
+        controller.debug = False
+        if gains is not None:
+            controller.setGains(*gains)
+        estimator = TempEstimator()
+        identifier = FopdtIdentifier()
+        estimator.update(rig.read(), asyncio.ticks_ms())
+        if useModel:
+            identifier.start(estimator.temp, asyncio.ticks_ms())
+        duty = 1.0
+        while True:
+            for _ in range(WINDOW_MS // READ_MS):
+                await asyncio.sleep_ms(READ_MS)
+                estimator.update(rig.read(), asyncio.ticks_ms())
+                if identifier.running() and duty == 1.0:
+                    identifier.update(estimator.temp, estimator.rate, asyncio.ticks_ms())
+            if identifier.running():
+                if duty == 1.0:
+                    model = identifier.result()
+                    if model is not None:
+                        controller.model = model
+                else:
+                    # preheat over, the model stays as it was
+                    identifier.reset()
+                    found.append(controller.model)
+            duty = controller.getDemand(SETPOINT, estimator.temp, estimator.rate)
+            rig.relay.setDuty(duty)
+
+    rig.run(control, SECONDS)
+    rise, overshoot, iae = score(rig.trace, SETPOINT)
+    return rise, settle(rig.trace, SETPOINT), overshoot, iae, found[0] if found else None
+
+
+if __name__ == "__main__":
+    plant = Rig(0).plant
+    tuned = autotune(Rig(1)).gains(TempController.periodS)
+    results = {}
+    for gainsName, gains in (("stock", None), ("tuned", tuned)):
+        for name, useModel in (("current", False), ("model", True)):
+            rise, settled, overshoot, iae, model = heat(Rig(2), useModel, gains)
+            results[gainsName, name] = rise, settled, overshoot, iae
+            print("{} gains, {:7} rise {:4.0f}s, within +-{:.0f}F after {:4.0f}s, overshoot {:4.1f}F, IAE {:6.0f}F*s".format(
+                gainsName, name, rise, SETTLE_F, settled, overshoot, iae))
+    print("identified gain {:.0f}F, tau {:.0f}s, dead time {:.0f}s, ambient {:.0f}F (the setting)".format(
+        model.gainF, model.tauS, model.deadS, model.ambientF))
+    print("plant gain {:.0f}F, tau {:.0f}s, lags {:.0f}s + {:.0f}s + dead {:.0f}s".format(
+        plant.gainF, plant.oilTauS, plant.heaterTauS, plant.probeTauS, plant.deadS))
+
+    for gainsName in ("stock", "tuned"):
+        cur, new = results[gainsName, "current"], results[gainsName, "model"]
+        assert new[0] <= cur[0], "slower to rise"
+        assert new[2] < cur[2], "more overshoot"
+        assert new[2] <= TempController.overshootF, "overshoot past the limit"
+        assert new[3] < cur[3], "IAE got worse"
+        assert new[1] <= cur[1], "takes longer to settle"
+    # the stock gains limit cycle at setpoint either way, the tuned ones settle
+    cur, new = results["tuned", "current"], results["tuned", "model"]
+    assert new[1] < cur[1], "takes longer to settle"
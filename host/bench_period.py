@@ -0,0 +1,86 @@
+# Fixed 5s control period against the adaptive one (src/period.py) on the
+# simulated fryer: a preheat from cold to each set value, then an hour of
+# holding. Ripple is the oil's peak to peak and RMS about the set value over
+# the last half hour, when it has settled; relay switches are counted over
+# the whole run and over the hold alone, each averaged over a few noise
+# seeds. Both run the autotuned gains, the controller once per relay window
+# as in regulate().
+# Usage: python3 host/bench_period.py
+import hostenv
+import uasyncio as asyncio
+from control import TempController
+from estimator import TempEstimator
+from period import FixedPeriod, AdaptivePeriod
+from sim_autotune import Rig, READ_MS
+
+TUNED = (0.0230, 0.00120, 0.2900) # what sim_autotune comes up with
+SETPOINTS = (250, 300, 350, 375)
+SEEDS = (1, 2, 3)
+PREHEAT_S = 3600
+HOLD_S = 3600
+SAMPLE_MS = 500
+
+
+def run(policy, setValue, seed=2):
+    rig = Rig(seed)
+    rig.relay.policy = policy
+    switches = []
+    oil = []
+
+    def relayOn():
+        if not rig.on:
+            switches.append(rig.plant.timeS)
+        rig.on = True
+    rig.relay.on = relayOn
+
+    async def sample():
+        while True:
+            await asyncio.sleep_ms(SAMPLE_MS)
+            oil.append((rig.plant.timeS, rig.plant.oilF))
+
+    async def control(rig):
+        asyncio.create_task(sample())
+        controller = TempController()
+        controller.debug = False
+        controller.setGains(*TUNED)
+        estimator = TempEstimator()
+        estimator.update(rig.read(), asyncio.ticks_ms())
+        while True:
+            ms = asyncio.ticks_ms()
+            duty = controller.getDemand(setValue, estimator.temp, estimator.rate, ms)
+            rig.relay.setDuty(duty)
+            end = ms + policy.windowMs(duty)
+            while asyncio.ticks_ms() < end:
+                await asyncio.sleep_ms(min(READ_MS, end - asyncio.ticks_ms()))
+                estimator.update(rig.read(), asyncio.ticks_ms())
+
+    rig.run(control, PREHEAT_S + HOLD_S)
+    settled = [f for t, f in oil if t >= PREHEAT_S + HOLD_S / 2]
+    ripple = max(settled) - min(settled)
+    rms = (sum((f - setValue) ** 2 for f in settled) / len(settled)) ** 0.5
+    holding = len([t for t in switches if t >= PREHEAT_S])
+    return ripple, rms, len(switches), holding
+
+
+def average(policy, setValue):
+    runs = [run(policy, setValue, seed) for seed in SEEDS]
+    return [sum(r[k] for r in runs) / len(runs) for k in range(4)]
+
+
+if __name__ == "__main__":
+    policies = (("fixed 5s", FixedPeriod(5000)), ("adaptive", AdaptivePeriod(500)))
+    totals = {}
+    for setValue in SETPOINTS:
+        for name, policy in policies:
+            result = average(policy, setValue)
+            total = totals.setdefault(name, [0.0] * 4)
+            for k in range(4):
+                total[k] += result[k]
+            print("{}F {:9} oil ripple {:.2f}F p-p, {:.2f}F RMS; {:4.0f} relay switches, {:4.0f} in the hour's hold".format(
+                setValue, name + ":", *result))
+    n = len(SETPOINTS)
+    for name, _ in policies:
+        print("mean {:9} oil ripple {:.2f}F p-p, {:.2f}F RMS; {:4.0f} relay switches, {:4.0f} in the hour's hold".format(
+            name + ":", *[x / n for x in totals[name]]))
+    fixed, adaptive = totals["fixed 5s"], totals["adaptive"]
+    assert adaptive[0] < fixed[0] and adaptive[1] < fixed[1], "no less ripple"
@@ -0,0 +1,78 @@
+# The reworked PID (real time steps, filtered derivative, conditional
+# integration, bumpless band changes) against the one before it, on the
+# simulated fryer: from cold, 90 minutes at 350F. Reports when the
+# temperature last left +-2F and the size of the oscillation over the last
+# half hour, with the stock and autotuned gains, with the estimator's rate
+# for D and without one. Usage: python3 host/bench_pid.py
+import hostenv
+import uasyncio as asyncio
+from control import TempController
+from estimator import TempEstimator
+from sim_autotune import Rig, autotune, SETPOINT, WINDOW_MS, READ_MS
+
+SECONDS = 5400
+TAIL_S = 1800
+SETTLE_F = 2.0
+
+
+class PreviousTempController(TempController):
+    # getDemand() as it was, without the model: fixed steps, the clamp as
+    # the only anti-windup, integrator left as it was across bands
+    def getDemand(self, setValue, processValue, rate=None, ms=None):
+        self.track(processValue)
+        if processValue < setValue - self.__pidRangeMin__:
+            return 1.0
+        if processValue > setValue + self.__pidRangeMax__:
+            return 0.0
+        error = setValue - processValue
+        self.__iAccumulator__ = self.iLimit(error * self.I + self.__iAccumulator__)
+        if rate is None:
+            d = self.D * self.meanChange() * -1.0
+        else:
+            d = self.D * rate * self.periodS * -1.0
+        demand = error * self.P + self.__iAccumulator__ + d
+        return min(max(demand, 0.0), 1.0)
+
+
+def hold(cls, gains, useRate, seed=2):
+    async def control(rig):
+        controller = cls()
+        controller.debug = False
+        if gains is not None:
+            controller.setGains(*gains)
+        estimator = TempEstimator()
+        estimator.update(rig.read(), asyncio.ticks_ms())
+        while True:
+            for _ in range(WINDOW_MS // READ_MS):
+                await asyncio.sleep_ms(READ_MS)
+                estimator.update(rig.read(), asyncio.ticks_ms())
+            if useRate:
+                demand = controller.getDemand(SETPOINT, estimator.temp, estimator.rate, asyncio.ticks_ms())
+            else:
+                demand = controller.getDemand(SETPOINT, rig.read(), None, asyncio.ticks_ms())
+            rig.relay.setDuty(demand)
+
+    rig = Rig(seed)
+    rig.run(control, SECONDS)
+    settled = 0.0
+    for t, f in rig.trace:
+        if abs(f - SETPOINT) > SETTLE_F:
+            settled = t
+    tail = [f for t, f in rig.trace if t > SECONDS - TAIL_S]
+    swing = max(tail) - min(tail)
+    meanError = sum(abs(f - SETPOINT) for f in tail) / len(tail)
+    return settled, swing, meanError
+
+
+if __name__ == "__main__":
+    tuned = autotune(Rig(1)).gains(TempController.periodS)
+    for gainsName, gains in (("stock", None), ("tuned", tuned)):
+        for useRate, dName in ((True, "estimator rate"), (False, "no rate")):
+            results = {}
+            for name, cls in (("previous", PreviousTempController), ("reworked", TempController)):
+                settled, swing, meanError = results[name] = hold(cls, gains, useRate)
+                print("{} gains, {}, {:8} within +-{:.0f}F after {:4.0f}s, last {}min: {:5.2f}F peak to peak, mean |error| {:.2f}F".format(
+                    gainsName, dName, name, SETTLE_F, settled, TAIL_S // 60, swing, meanError))
+            old, new = results["previous"], results["reworked"]
+            assert new[0] <= old[0], "settles later"
+            assert new[1] <= old[1] * 1.05, "swings more"
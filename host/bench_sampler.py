@@ -0,0 +1,80 @@
+# AdcSampler averaging and decimation against a noisy stand-in ADC.
+# Usage: python3 host/bench_sampler.py
+import hostenv
+from hostenv import perCall
+from machine import ADC, mem32
+from array import array
+import sampler
+from sampler import AdcSampler
+
+
+def capture(s, adc, n):
+    # What the ADC + DMA do on the Pico: write 12 bit samples round the ring
+    # and leave the data channel's write address after the last one
+    reg = sampler.DMA_BASE + s.dma[0].channel * sampler.DMA_CH_STRIDE + sampler.DMA_WRITE_ADDR
+    i = s.position() if mem32[reg] else 0
+    for _ in range(n):
+        s.ring[i] = adc.read_u16() >> 4
+        i = (i + 1) % len(s.ring)
+    mem32[reg] = s.ringAddress[0] + i * 2
+
+
+def checkAverage():
+    # 8 reads (what regulate() did) against the sampler's 512, same noise
+    s = AdcSampler()
+    s.start()
+    spread = {}
+    for n in (8, 64, 512):
+        errors = []
+        for trial in range(200):
+            adc = ADC(28, counts=20577, noise=400, seed=trial)
+            capture(s, adc, 1024)
+            errors.append(s.average(n) - 20577)
+        mean = sum(errors) / len(errors)
+        spread[n] = (sum((e - mean) ** 2 for e in errors) / len(errors)) ** 0.5
+        print("average of {:4} samples: error sd {:6.1f} counts, bias {:6.1f}".format(n, spread[n], mean))
+    # noise falls as 1/sqrt(n): 64x the samples is about 8x less spread
+    assert spread[512] < spread[8] / 5
+    s.stop()
+    assert s.dma is None
+
+
+def checkScale():
+    s = AdcSampler(ringSize=64)
+    s.start()
+    for counts in (0, 20577, 65535):
+        adc = ADC(28, counts=counts)
+        capture(s, adc, 64)
+        assert s.average(64) == adc.read_u16(), counts
+
+
+def checkDecimate():
+    # a slow ramp: each block mean is the middle of its block
+    s = AdcSampler(ringSize=256)
+    s.start()
+    adc = ADC(28, counts=0)
+    reg = sampler.DMA_BASE + s.dma[0].channel * sampler.DMA_CH_STRIDE + sampler.DMA_WRITE_ADDR
+    for i in range(300):  # wraps the ring
+        s.ring[i % 256] = i
+    mem32[reg] = s.ringAddress[0] + (300 % 256) * 2
+    out = array("H", [0] * 8)
+    s.decimate(out, 16)
+    # block k holds start..start+15, mean start+7.5, kept to 1/16 of a 12 bit count
+    expected = [sampler.toU16(((300 - 16 * (8 - k)) * 16 + 120 << 4) // 16) for k in range(8)]
+    assert list(out) == expected, (list(out), expected)
+
+
+def bench():
+    s = AdcSampler()
+    s.start()
+    capture(s, ADC(28, counts=20577, noise=400), 1024)
+    out = array("H", [0] * 16)
+    print("average(256): {:.1f}us, decimate 16x16: {:.1f}us".format(
+        perCall(lambda: s.average(256), 500), perCall(lambda: s.decimate(out, 16), 500)))
+
+
+if __name__ == "__main__":
+    checkScale()
+    checkDecimate()
+    checkAverage()
+    bench()
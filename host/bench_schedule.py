@@ -0,0 +1,93 @@
+# Gain schedule against fixed gains across the set value range, on a
+# simulated fryer whose losses grow with temperature. The schedule comes from
+# autotuning at a few breakpoints, with the band that does best there out of
+# a few; the fixed gains are an autotune at 350F with the stock band, which
+# is what the fryer runs today. Each run heats from cold; IAE counts
+# from when the temperature first gets within 20F of the set value, for an
+# hour. Usage: python3 host/bench_schedule.py
+import hostenv
+import uasyncio as asyncio
+from control import TempController
+from estimator import TempEstimator
+from schedule import GainSchedule
+from sim_autotune import Rig, autotune, WINDOW_MS, READ_MS
+
+# losses double 250F above ambient, and 350F takes about a third of full power
+PLANT = {"hotLossF": 250.0, "gainF": 1800.0}
+BREAKPOINTS = (150, 250, 375)
+SETPOINTS = (150, 200, 250, 300, 350, 375)
+BAND_F = 20 # for the fixed gains, and where IAE starts counting
+BANDS = (10, 20, 30, 40)
+SECONDS = 3600
+
+
+def tune(setValue):
+    # the autotuner's window-locked periods sometimes miss its tolerance,
+    # another noise seed gets through
+    for seed in range(1, 6):
+        tuner = autotune(Rig(seed, **PLANT), setValue)
+        if not tuner.failed:
+            return tuner.gains(TempController.periodS)
+    raise RuntimeError("autotune failed at {}F".format(setValue))
+
+
+def breakpoint(setValue):
+    gains = tune(setValue)
+    best = None
+    for band in BANDS:
+        row = (setValue,) + gains + (band,)
+        iae = hold(setValue, schedule=GainSchedule([row]))[0]
+        if best is None or iae < best[0]:
+            best = iae, row
+    return best[1]
+
+
+def hold(setValue, gains=None, schedule=None):
+    async def control(rig):
+        controller = TempController(schedule=schedule)
+        controller.debug = False
+        if gains is not None:
+            controller.setGains(*gains)
+        estimator = TempEstimator()
+        estimator.update(rig.read(), asyncio.ticks_ms())
+        while True:
+            for _ in range(WINDOW_MS // READ_MS):
+                await asyncio.sleep_ms(READ_MS)
+                estimator.update(rig.read(), asyncio.ticks_ms())
+            ms = asyncio.ticks_ms()
+            rig.relay.setDuty(controller.getDemand(setValue, estimator.temp, estimator.rate, ms))
+
+    rig = Rig(2, **PLANT)
+    rig.run(control, SECONDS * 2)
+    start = None
+    iae = 0.0
+    peak = -1e9
+    for (t0, f0), (t1, f1) in zip(rig.trace, rig.trace[1:]):
+        if start is None:
+            if f0 < setValue - BAND_F:
+                continue
+            start = t0
+        if t0 > start + SECONDS:
+            break
+        iae += abs(setValue - f0) * (t1 - t0)
+        peak = max(peak, f1)
+    return iae, peak - setValue
+
+
+if __name__ == "__main__":
+    fixed = tune(350)
+    schedule = GainSchedule([breakpoint(sv) for sv in BREAKPOINTS])
+    print("fixed: P {:.4f} I {:.5f} D {:.4f}".format(*fixed))
+    for row in schedule.rows():
+        print("{:.0f}F: P {:.4f} I {:.5f} D {:.4f} band {:.0f}F".format(*row))
+
+    totals = [0.0, 0.0]
+    for setValue in SETPOINTS:
+        fixedIae, fixedOver = hold(setValue, gains=fixed)
+        schedIae, schedOver = hold(setValue, schedule=schedule)
+        totals[0] += fixedIae
+        totals[1] += schedIae
+        print("{}F: fixed IAE {:6.0f}F*s peak {:+5.1f}F, scheduled IAE {:6.0f}F*s peak {:+5.1f}F ({:+.0f}%)".format(
+            setValue, fixedIae, fixedOver, schedIae, schedOver, 100 * (schedIae / fixedIae - 1)))
+    print("all set values: fixed {:.0f}F*s, scheduled {:.0f}F*s".format(*totals))
+    assert totals[1] < totals[0], "the schedule doesn't help"
@@ -0,0 +1,46 @@
+# Accuracy and cost of the ADC -> temperature conversion.
+# Usage: python3 host/bench_thermistor.py
+import hostenv
+from hostenv import perCall, allocs, EXACT_ALLOCS
+from thermistor import samplesToTemp, cToF, countsToTenthsF
+
+
+def closedForm(counts):
+    return cToF(samplesToTemp(counts))
+
+
+def checkAccuracy(lowF=140, highF=375, limit=0.2):
+    # every count that lands in the fryer's range
+    worst = 0
+    worstCounts = 0
+    checked = 0
+    for counts in range(1, 65536):
+        exact = closedForm(counts)
+        if not lowF <= exact <= highF:
+            continue
+        checked += 1
+        error = abs(countsToTenthsF(counts) / 10 - exact)
+        if error > worst:
+            worst, worstCounts = error, counts
+    print("LUT accuracy {}-{}F: max error {:.3f}F at {} counts ({} counts checked)".format(
+        lowF, highF, worst, worstCounts, checked))
+    assert worst < limit
+
+
+def bench(n=20000):
+    counts = 20577
+    closed = perCall(lambda: closedForm(counts), n)
+    lut = perCall(lambda: countsToTenthsF(counts), n)
+    print("closed form: {:.2f}us per call".format(closed))
+    print("LUT:         {:.2f}us per call".format(lut))
+    if EXACT_ALLOCS:
+        print("allocated per 1000 calls: closed form {} bytes, LUT {} bytes".format(
+            allocs(lambda: closedForm(counts)), allocs(lambda: countsToTenthsF(counts))))
+        assert allocs(lambda: countsToTenthsF(counts)) == 0
+    else:
+        print("allocation counts need the unix port (CPython boxes ints and pools floats)")
+
+
+if __name__ == "__main__":
+    checkAccuracy()
+    bench()
@@ -0,0 +1,215 @@
+# Fits the thermistor model to Calibration.md and writes src/calibration.py:
+# Steinhart-Hart coefficients, the current source, and a ready-made lookup
+# table so the Pico doesn't build one at boot.
+#
+# The ADC only sees V_REF/I_SOURCE (counts = R * I_SOURCE / V_REF * 65535),
+# so V_REF stays at its nominal value and I_SOURCE is fitted. The raw
+# resistance measurements pin down that ratio; without them it would trade
+# off against the coefficients. Residuals are in F at every point.
+#
+# A cubic fitted over a narrow range goes wild outside it, so nothing gets
+# written unless the points reach the top of the fryer's range (--force to
+# override). --fix-c pins SH_C and fits only A and B, which extrapolates far
+# more tamely when the points are all at the cool end.
+#
+# Usage: python3 host/calibrate.py [Calibration.md] [--out src/calibration.py]
+#                                  [--fix-c C] [--check] [--force]
+# Needs numpy.
+import hostenv
+import argparse
+import math
+import re
+import numpy as np
+import thermistor
+
+ROOT = hostenv._here + "/.."
+T_AZ = thermistor.T_AZ
+C_MAX = thermistor.C_MAX
+
+
+def fToK(f):
+    return (f - 32) * 5 / 9 - T_AZ
+
+
+def kToF(k):
+    return (k + T_AZ) * 9 / 5 + 32
+
+
+def parse(text):
+    # (F, [readings], note) for every table row, (F, ohms) for every raw
+    # resistance line
+    readings = []
+    resistances = []
+    for line in text.splitlines():
+        cells = [c.strip() for c in line.strip().strip("|").split("|")]
+        if len(cells) > 1 and re.fullmatch(r"[\d.]+", cells[0]):
+            values = [float(c) for c in cells[1:] if re.fullmatch(r"[\d.]+", c)]
+            notes = [c for c in cells[1:] if c and not re.fullmatch(r"[\d.]+", c)]
+            readings.append((float(cells[0]), values, " ".join(notes)))
+            continue
+        m = re.match(r"\s*-\s*([\d.]+)F\s*-\s*[\d.]+C\s*-\s*([\d.]+)([kM]?)", line)
+        if m:
+            scale = {"": 1, "k": 1e3, "M": 1e6}[m.group(3)]
+            resistances.append((float(m.group(1)), float(m.group(2)) * scale))
+    return readings, resistances
+
+
+class Data:
+    # one row per calibration point, as numpy arrays
+    def __init__(self, readings, resistances):
+        self.tempF = np.array([r[0] for r in readings] + [r[0] for r in resistances])
+        self.counts = np.array([np.mean(r[1]) for r in readings] + [np.nan] * len(resistances))
+        self.ohms = np.array([np.nan] * len(readings) + [r[1] for r in resistances])
+        self.fromAdc = ~np.isnan(self.counts)
+        self.labels = ["{:.0f}F adc".format(r[0]) for r in readings] + \
+                      ["{:.0f}F ohms".format(r[0]) for r in resistances]
+
+    def logR(self, iSource, vRef):
+        r = np.where(self.fromAdc, np.nan_to_num(self.counts) / C_MAX * vRef / iSource, np.nan_to_num(self.ohms))
+        return np.log(r)
+
+
+def modelF(coeffs, logR):
+    a, b, c = coeffs
+    return kToF(1 / (a + b * logR + c * logR ** 3))
+
+
+def solveCoeffs(data, iSource, vRef, fixC=None):
+    # linear least squares in 1/T, rows scaled by T^2 so the residuals it
+    # minimises are (to first order) temperatures rather than reciprocals
+    x = data.logR(iSource, vRef)
+    t = fToK(data.tempF)
+    w = t ** 2
+    if fixC is None:
+        design = np.stack([np.ones_like(x), x, x ** 3], axis=1) * w[:, None]
+        coeffs = np.linalg.lstsq(design, w / t, rcond=None)[0]
+    else:
+        design = np.stack([np.ones_like(x), x], axis=1) * w[:, None]
+        a, b = np.linalg.lstsq(design, (1 / t - fixC * x ** 3) * w, rcond=None)[0]
+        coeffs = np.array([a, b, fixC])
+    return coeffs, modelF(coeffs, x) - data.tempF
+
+
+def fit(data, vRef, iGuess, fixC=None):
+    # golden section over log(I_SOURCE), coefficients solved exactly inside
+    def cost(logI):
+        return np.sqrt(np.mean(solveCoeffs(data, math.exp(logI), vRef, fixC)[1] ** 2))
+
+    lo, hi = math.log(iGuess / 3), math.log(iGuess * 3)
+    g = (math.sqrt(5) - 1) / 2
+    x1, x2 = hi - g * (hi - lo), lo + g * (hi - lo)
+    f1, f2 = cost(x1), cost(x2)
+    while hi - lo > 1e-9:
+        if f1 < f2:
+            hi, x2, f2 = x2, x1, f1
+            x1 = hi - g * (hi - lo)
+            f1 = cost(x1)
+        else:
+            lo, x1, f1 = x1, x2, f2
+            x2 = lo + g * (hi - lo)
+            f2 = cost(x2)
+    iSource = math.exp((lo + hi) / 2)
+    coeffs, residuals = solveCoeffs(data, iSource, vRef, fixC)
+    return iSource, coeffs, residuals
+
+
+def compare(iSource, vRef, coeffs, temps=(150, 250, 300, 350, 375)):
+    # what the fit makes of the readings the current model puts at temps
+    print("at the counts thermistor.py reads as:")
+    for f in temps:
+        lo, hi = 1, 65535
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if thermistor.cToF(thermistor.samplesToTemp(mid)) > f:
+                lo = mid
+            else:
+                hi = mid
+        fitted = float(modelF(coeffs, np.log(hi / C_MAX * vRef / iSource)))
+        print("  {:3}F ({:5} counts) the fit says {:6.1f}F".format(f, hi, fitted))
+
+
+def monotonic(iSource, vRef, coeffs):
+    # hotter must always mean fewer counts
+    temps = modelF(coeffs, np.log(np.arange(1, 65536) / C_MAX * vRef / iSource))
+    return bool(np.all(np.diff(temps) < 0))
+
+
+def report(title, data, residuals):
+    print(title)
+    for label, r in zip(data.labels, residuals):
+        print("  {:10} {:+6.2f}F".format(label, r))
+    print("  rms {:.2f}F, worst {:.2f}F".format(np.sqrt(np.mean(residuals ** 2)), np.max(np.abs(residuals))))
+
+
+def emit(path, source, iSource, vRef, coeffs, residuals):
+    a, b, c = (float(v) for v in coeffs)
+
+    def toTemp(v):
+        # clamped so a forced, badly extrapolated fit still fits in the table
+        r = vRef * (v / C_MAX) / iSource
+        t = 1 / (a + b * math.log(r) + c * math.log(r) ** 3) + T_AZ
+        return min(max(t, -200), 1500)
+    table = thermistor.buildTable(toTemp)
+    rows = []
+    for i in range(0, len(table), 12):
+        rows.append("    " + ", ".join(str(v) for v in table[i:i + 12]) + ",")
+    with open(path, "w") as f:
+        f.write("# Written by host/calibrate.py from {}, re-run that rather than editing.\n".format(source))
+        f.write("# Fit rms {:.2f}F, worst {:.2f}F over {} points\n".format(
+            float(np.sqrt(np.mean(residuals ** 2))), float(np.max(np.abs(residuals))), len(residuals)))
+        f.write("from array import array\n\n")
+        f.write("I_SOURCE = {!r}\n".format(iSource))
+        f.write("V_REF = {!r}\n".format(vRef))
+        f.write("SH_A = {!r}\n".format(a))
+        f.write("SH_B = {!r}\n".format(b))
+        f.write("SH_C = {!r}\n".format(c))
+        f.write("\n# tenths of F at every 2**LUT_SHIFT counts, see thermistor.py\n")
+        f.write("LUT_SHIFT = {}\n".format(thermistor.LUT_SHIFT))
+        f.write("TEMP_LUT = array(\"h\", (\n")
+        f.write("\n".join(rows))
+        f.write("\n))\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the thermistor model to calibration data")
+    parser.add_argument("data", nargs="?", default=ROOT + "/Calibration.md")
+    parser.add_argument("--out", default=ROOT + "/src/calibration.py")
+    parser.add_argument("--vref", type=float, default=2.5)
+    parser.add_argument("--fix-c", type=float, default=None, help="pin SH_C and fit only A and B")
+    parser.add_argument("--top", type=float, default=375, help="hottest temperature the fryer runs at, F")
+    parser.add_argument("--check", action="store_true", help="report only, don't write anything")
+    parser.add_argument("--force", action="store_true", help="write even if the fit is extrapolated")
+    args = parser.parse_args()
+
+    with open(args.data) as f:
+        readings, resistances = parse(f.read())
+    data = Data(readings, resistances)
+    print("{} ADC points ({} readings), {} resistance points".format(
+        len(readings), sum(len(r[1]) for r in readings), len(resistances)))
+
+    current = np.array([thermistor.SH_A, thermistor.SH_B, thermistor.SH_C])
+    report("current coefficients, I_SOURCE {:.2f}uA:".format(thermistor.I_SOURCE * 1e6), data,
+           modelF(current, data.logR(thermistor.I_SOURCE, thermistor.V_REF)) - data.tempF)
+
+    iSource, coeffs, residuals = fit(data, args.vref, thermistor.I_SOURCE, args.fix_c)
+    report("least squares, I_SOURCE {:.2f}uA at V_REF {}V:".format(iSource * 1e6, args.vref), data, residuals)
+    print("  SH_A {:.9e} SH_B {:.9e} SH_C {:.9e}".format(*coeffs))
+    compare(iSource, args.vref, coeffs)
+
+    problems = []
+    if not monotonic(iSource, args.vref, coeffs):
+        problems.append("the fitted curve isn't monotonic over the ADC range")
+    hottest = float(np.max(data.tempF))
+    if hottest < args.top:
+        problems.append("the hottest point is {:.0f}F, above that the fit is extrapolated to {:.0f}F".format(hottest, args.top))
+    for p in problems:
+        print("warning:", p)
+
+    if args.check:
+        pass
+    elif problems and not args.force:
+        print("not writing {} (--force to write it anyway)".format(args.out))
+        raise SystemExit(1)
+    else:
+        emit(args.out, args.data.rsplit("/", 1)[-1], iSource, args.vref, coeffs, residuals)
+        print("wrote", args.out)
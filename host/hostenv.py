@@ -0,0 +1,78 @@
+# Host environment for running the fryer code on Linux (CPython or the unix port).
+# Import this before anything from src: it puts src on the path next to the
+# stand-in machine/micropython modules and adds the MicroPython time helpers.
+import sys
+import time
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(1, _here + "/../src")
+
+if not hasattr(time, "ticks_ms"):
+    time.ticks_ms = lambda: int(time.perf_counter() * 1000)
+    time.ticks_us = lambda: int(time.perf_counter() * 1000000)
+    time.ticks_diff = lambda a, b: a - b
+    time.ticks_add = lambda a, b: a + b
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+# viper's pointer and integer types, so annotated src functions define
+import builtins
+for _name in ("ptr8", "ptr16", "ptr32", "uint"):
+    if not hasattr(builtins, _name):
+        setattr(builtins, _name, object)
+
+
+def perCall(fn, n=10000):
+    """Average microseconds per call of fn()"""
+    start = time.ticks_us()
+    for _ in range(n):
+        fn()
+    return time.ticks_diff(time.ticks_us(), start) / n
+
+
+# The unix port counts heap bytes exactly. CPython's count is only meaningful
+# for code that doesn't do arithmetic: it boxes every int above 256 (which
+# MicroPython keeps as small ints) and recycles floats from a free list (which
+# MicroPython allocates on the heap)
+import gc as _gc
+EXACT_ALLOCS = hasattr(_gc, "mem_alloc")
+
+
+def allocs(fn, n=1000):
+    """Bytes allocated by n calls of fn(), after one warm-up call.
+
+    Exact on the unix port (gc.mem_alloc with the collector off). On CPython it
+    is the tracemalloc peak, which also catches short-lived objects."""
+    import gc
+    fn()
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(n):
+            fn()
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used
+
+    import tracemalloc
+
+    def peak(f):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        i = 0
+        while i < n:
+            f()
+            i += 1
+        return tracemalloc.get_traced_memory()[1] - before
+
+    # the measuring itself costs a few bytes, so take off an empty run
+    tracemalloc.start()
+    peak(fn)
+    used = peak(fn) - peak(_nothing)
+    tracemalloc.stop()
+    return max(used, 0)
+
+
+def _nothing():
+    pass
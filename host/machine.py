@@ -0,0 +1,173 @@
+# Host stand-in for the bits of MicroPython's machine module the fryer uses.
+# Only enough behaviour to run the display/control code on Linux.
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    ALT_PIO0 = 6
+    ALT_PIO1 = 7
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, alt=-1):
+        self.id = id
+        self.mode = Pin.IN
+        self.pull = None
+        self.alt = None
+        self._value = 0
+        self.init(mode, pull, value=value, alt=alt)
+
+    def init(self, mode=-1, pull=-1, value=None, alt=-1):
+        if alt != -1:
+            self.alt = alt
+        if mode != -1:
+            self.mode = mode
+        if pull != -1:
+            self.pull = pull
+        if value is not None:
+            self._value = 1 if value else 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = 1 if v else 0
+
+    def high(self):
+        self._value = 1
+
+    def low(self):
+        self._value = 0
+
+    on = high
+    off = low
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+        self.handler = handler
+
+    def __repr__(self):
+        return "Pin({}, mode={}, value={})".format(self.id, self.mode, self._value)
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+class ADC:
+    # Reads counts (u16 scale) plus gaussian noise of the given sigma, clipped
+    # to the ADC's 12 bits the way the real read_u16() scales them. A fraction
+    # `spikes` of the reads get spikeSize added, like a segment switching
+    CORE_TEMP = 4
+
+    def __init__(self, pin, counts=32768, noise=0.0, seed=1, spikes=0.0, spikeSize=20000):
+        import random
+        self.pin = pin
+        self.counts = counts
+        self.noise = noise
+        self.spikes = spikes
+        self.spikeSize = spikeSize
+        self.random = random.Random(seed)
+
+    def read_u16(self):
+        value = self.counts
+        if self.noise:
+            value += self.random.gauss(0, self.noise)
+        if self.spikes and self.random.random() < self.spikes:
+            value += self.spikeSize
+        raw = min(max(int(value) >> 4, 0), 4095)
+        return (raw << 4) | (raw >> 8)
+
+
+class PWM:
+    def __init__(self, pin, freq=0, duty_u16=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty_u16
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def deinit(self):
+        self._duty = 0
+
+
+# RP2040 SIO block, enough to model GPIO_OUT/GPIO_OE and their set/clr/xor aliases
+SIO_BASE = 0xd0000000
+_SIO_ALIASES = {
+    SIO_BASE + 0x010: (SIO_BASE + 0x010, None),  # GPIO_OUT
+    SIO_BASE + 0x014: (SIO_BASE + 0x010, "set"),
+    SIO_BASE + 0x018: (SIO_BASE + 0x010, "clr"),
+    SIO_BASE + 0x01c: (SIO_BASE + 0x010, "xor"),
+    SIO_BASE + 0x020: (SIO_BASE + 0x020, None),  # GPIO_OE
+    SIO_BASE + 0x024: (SIO_BASE + 0x020, "set"),
+    SIO_BASE + 0x028: (SIO_BASE + 0x020, "clr"),
+    SIO_BASE + 0x02c: (SIO_BASE + 0x020, "xor"),
+}
+
+
+class Mem32:
+    # Word-addressed memory. Writes are appended to log as (address, value)
+    # when recording is on; SIO alias writes update the underlying register
+    def __init__(self):
+        self.regs = {}
+        self.log = []
+        self.recording = False
+
+    def __getitem__(self, addr):
+        return self.regs.get(addr, 0)
+
+    def __setitem__(self, addr, value):
+        value &= 0xffffffff
+        if self.recording:
+            self.log.append((addr, value))
+        reg, op = _SIO_ALIASES.get(addr, (addr, None))
+        if op == "set":
+            value = self.regs.get(reg, 0) | value
+        elif op == "clr":
+            value = self.regs.get(reg, 0) & ~value
+        elif op == "xor":
+            value = self.regs.get(reg, 0) ^ value
+        self.regs[reg] = value
+
+
+mem32 = Mem32()
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, mode=PERIODIC, freq=-1, period=-1, callback=None):
+        self.id = id
+        self.init(mode=mode, freq=freq, period=period, callback=callback)
+
+    def init(self, mode=PERIODIC, freq=-1, period=-1, callback=None):
+        self.mode = mode
+        self.freq = freq if freq != -1 else 1000 / period
+        self.callback = callback
+
+    def fire(self, n=1):
+        # what the hardware would do every 1/freq seconds. A while loop, so the
+        # stand-in itself doesn't allocate during allocation checks
+        while n > 0 and self.callback is not None:
+            self.callback(self)
+            if self.mode == Timer.ONE_SHOT:
+                self.callback = None
+            n -= 1
+
+    def deinit(self):
+        self.callback = None
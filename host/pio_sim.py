@@ -0,0 +1,124 @@
+# Cycle-level simulator for the subset of PIO the display program uses:
+# pull, out (including exec), mov, set, jmp, nop, irq, delays and wrap. Runs a Program built by the
+# host rp2.asm_pio stand-in.
+
+MASK32 = 0xffffffff
+
+
+class PioSim:
+    def __init__(self, prog, outCount, feed):
+        # feed() returns the next TX FIFO word, or None if the FIFO is empty
+        self.prog = prog
+        self.outCount = outCount
+        self.feed = feed
+        self.pc = 0
+        self.x = 0
+        self.y = 0
+        self.osr = 0
+        self.pins = 0
+        self.pindirs = 0
+        self.cycle = 0
+        self.stalls = 0
+        self.pending = None
+        # (cycle, index) for every irq raised
+        self.irqs = []
+        # (cycle, pins, pindirs) every time the outputs change
+        self.trace = [(0, 0, 0)]
+
+    def _src(self, name):
+        if name == "null":
+            return 0
+        return getattr(self, name)
+
+    def _writeOut(self, dest, value, count):
+        mask = (1 << min(count, self.outCount)) - 1
+        if dest == "pins":
+            self.pins = (self.pins & ~mask) | (value & mask)
+        elif dest == "pindirs":
+            self.pindirs = (self.pindirs & ~mask) | (value & mask)
+        elif dest in ("x", "y", "osr"):
+            setattr(self, dest, value & MASK32)
+        elif dest != "null":
+            raise NotImplementedError(dest)
+
+    def _tick(self, n=1):
+        self.cycle += n
+        last = self.trace[-1]
+        if last[1] != self.pins or last[2] != self.pindirs:
+            self.trace.append((self.cycle, self.pins, self.pindirs))
+
+    def _exec(self, word):
+        # an instruction word from out(exec): only irq and nop are understood
+        if word >> 13 == 0b110:
+            self.irqs.append((self.cycle, word & 0x1f))
+        elif word != 0xa042:
+            raise NotImplementedError(hex(word))
+        self._tick(1)
+        self.cycle += (word >> 8) & 0x1f
+
+    def step(self):
+        # Execute one instruction, including its delay cycles
+        if self.pending is not None:
+            word, self.pending = self.pending, None
+            self._exec(word)
+            return
+        instr = self.prog.instrs[self.pc]
+        op, args = instr.op, instr.args
+        nextPc = self.pc + 1
+        if op == "pull":
+            if "noblock" in args:
+                raise NotImplementedError("pull noblock")
+            word = self.feed()
+            if word is None:
+                self.stalls += 1
+                self.cycle += 1
+                return
+            self.osr = word & MASK32
+        elif op == "out":
+            dest, count = args
+            value = self.osr & ((1 << count) - 1)
+            self.osr >>= count
+            if dest == "exec":
+                self.pending = value
+            else:
+                self._writeOut(dest, value, self.outCount if dest in ("pins", "pindirs") else 32)
+        elif op == "mov":
+            dest, src = args
+            self._writeOut(dest, self._src(src), self.outCount if dest in ("pins", "pindirs") else 32)
+        elif op == "set":
+            dest, value = args
+            self._writeOut(dest, value, 5)
+        elif op == "jmp":
+            if len(args) == 1:
+                cond, target = None, args[0]
+            else:
+                cond, target = args
+            take = True
+            if cond == "x_dec":
+                take = self.x != 0
+                self.x = (self.x - 1) & MASK32
+            elif cond == "y_dec":
+                take = self.y != 0
+                self.y = (self.y - 1) & MASK32
+            elif cond == "not_x":
+                take = self.x == 0
+            elif cond == "not_y":
+                take = self.y == 0
+            elif cond is not None:
+                raise NotImplementedError(cond)
+            if take:
+                nextPc = self.prog.labels[target]
+        elif op != "nop":
+            raise NotImplementedError(op)
+
+        if self.pc == self.prog.wrap and nextPc == self.pc + 1:
+            nextPc = self.prog.wrapTarget
+        self.pc = nextPc
+        self._tick(1)
+        if instr.delay:
+            self.cycle += instr.delay
+
+    def run(self, cycles):
+        end = self.cycle + cycles
+        while self.cycle < end:
+            self.step()
@@ -0,0 +1,97 @@
+# A fryer to control on the host: heater element, oil and probe as first
+# order lags, plus a dead time between relay and element. Temperatures in F,
+# time in seconds. Default numbers are for about 3L of oil and a 1500W
+# element: full power would settle far above frying temperature (gainF), and
+# holding 350F takes about a quarter duty. Losses are proportional to the
+# rise over ambient unless hotLossF is set: then they grow with it too, and
+# have doubled hotLossF above ambient, which makes the fryer slower and
+# weaker at low temperatures than at high ones.
+import math
+from collections import deque
+
+
+class FryerPlant:
+    def __init__(self, ambientF=70.0, gainF=1100.0, oilTauS=2400.0, heaterTauS=40.0,
+                 probeTauS=8.0, deadS=3.0, startF=None, dtS=0.1, hotLossF=None):
+        self.ambientF = ambientF
+        self.gainF = gainF
+        self.oilTauS = oilTauS
+        self.heaterTauS = heaterTauS
+        self.probeTauS = probeTauS
+        self.deadS = deadS
+        self.dtS = dtS
+        self.hotLossF = hotLossF
+        start = ambientF if startF is None else startF
+        # steady state for the start temperature
+        self.heat = self.holdDuty(start) # element output, 0..1
+        self.oilF = start
+        self.probeF = start
+        self.delay = deque([self.heat] * max(int(deadS / dtS), 1))
+        self.timeS = 0.0
+
+    def step(self, duty):
+        # advance dtS with the relay at duty (0..1, or a bool)
+        dt = self.dtS
+        self.delay.append(float(duty))
+        u = self.delay.popleft()
+        self.heat += (u - self.heat) * dt / self.heaterTauS
+        self.oilF += (self.gainF * self.heat - self.loss(self.oilF)) * dt / self.oilTauS
+        self.probeF += (self.oilF - self.probeF) * dt / self.probeTauS
+        self.timeS += dt
+
+    def drop(self, coolF):
+        # cold food going in takes heat straight out of the oil
+        self.oilF -= coolF
+
+    def loss(self, tempF):
+        # heat lost at tempF, in F of steady state rise
+        rise = tempF - self.ambientF
+        if self.hotLossF is None:
+            return rise
+        return rise * (1 + rise / self.hotLossF)
+
+    def holdDuty(self, tempF):
+        return self.loss(tempF) / self.gainF
+
+    def response(self, w):
+        # gain and phase (radians) of relay -> probe at w rad/s, for linear
+        # losses
+        gain = self.gainF
+        phase = -w * self.deadS
+        for tau in (self.heaterTauS, self.oilTauS, self.probeTauS):
+            gain /= math.sqrt(1 + (w * tau) ** 2)
+            phase -= math.atan(w * tau)
+        return gain, phase
+
+    def ultimate(self, extraDelayS=0.0, band=0.0, amplitude=1.0):
+        # ultimate gain (duty per F) and period (s) from the model: where the
+        # loop's phase reaches -180 degrees. With a relay band, where a relay
+        # test will actually oscillate: the hysteresis takes asin(band / a)
+        # off that, for a swing of +-amplitude
+        target = -math.pi + math.asin(min(band / amplitude, 1.0))
+        lo, hi = 1e-5, 10.0
+        for _ in range(200):
+            w = math.sqrt(lo * hi)
+            if self.response(w)[1] - w * extraDelayS > target:
+                lo = w
+            else:
+                hi = w
+        return 1 / self.response(w)[0], 2 * math.pi / w
+
+
+def score(samples, setpointF, startS=0.0):
+    # samples: (seconds, F) pairs. Rise time to 90% of the step, overshoot
+    # past the setpoint, and integral of |error| (F*s) from startS on
+    first = samples[0][1]
+    target = first + 0.9 * (setpointF - first)
+    rise = None
+    peak = -1e9
+    iae = 0.0
+    for (t0, f0), (t1, f1) in zip(samples, samples[1:]):
+        if t0 < startS:
+            continue
+        if rise is None and f1 >= target:
+            rise = t1 - startS
+        peak = max(peak, f1)
+        iae += abs(setpointF - f0) * (t1 - t0)
+    return rise, max(peak - setpointF, 0.0), iae
@@ -0,0 +1,148 @@
+# Host stand-in for the rp2 module. asm_pio assembles into a Program that
+# pio_sim.PioSim can run; StateMachine and DMA just remember how they were set up.
+# Program memory is modelled: each PIO block holds 32 instruction words, and
+# like the real module a Program object is only loaded once per block.
+
+PROGRAM_WORDS = 32
+
+
+class PIO:
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    IN_LOW = 0
+    IN_HIGH = 1
+    OUT_LOW = 2
+    OUT_HIGH = 3
+
+    loaded = {0: [], 1: []} # programs in each block's instruction memory
+
+    def __init__(self, id):
+        self.id = id
+
+    def add_program(self, prog):
+        loaded = PIO.loaded[self.id]
+        if any(p is prog for p in loaded):
+            return
+        if sum(len(p.instrs) for p in loaded) + len(prog.instrs) > PROGRAM_WORDS:
+            raise OSError(12, "ENOMEM: no room for the program in PIO{}".format(self.id))
+        loaded.append(prog)
+
+    def remove_program(self, prog=None):
+        loaded = PIO.loaded[self.id]
+        if prog is None:
+            del loaded[:]
+        else:
+            loaded[:] = [p for p in loaded if p is not prog]
+
+    def used(self):
+        # instruction words taken
+        return sum(len(p.instrs) for p in PIO.loaded[self.id])
+
+
+class Instr:
+    def __init__(self, op, args):
+        self.op = op
+        self.args = args
+        self.delay = 0
+
+    def __getitem__(self, delay):
+        # the [n] delay syntax
+        self.delay = delay
+        return self
+
+    def __repr__(self):
+        return "{}{}[{}]".format(self.op, self.args, self.delay)
+
+
+class Program:
+    def __init__(self, settings):
+        self.settings = settings
+        self.instrs = []
+        self.labels = {}
+        self.wrapTarget = 0
+        self.wrap = None
+
+
+# operand names used inside asm_pio functions
+OPERANDS = ("pins", "x", "y", "null", "pindirs", "pc", "isr", "osr", "exec", "status",
+            "x_dec", "y_dec", "x_not_y", "not_x", "not_y", "pin", "not_osre", "block",
+            "noblock", "iffull", "ifempty", "rel", "invert", "reverse", "irq")
+
+
+def asm_pio(**settings):
+    def assemble(fn):
+        prog = Program(settings)
+
+        def emit(op):
+            def f(*args):
+                instr = Instr(op, args)
+                prog.instrs.append(instr)
+                return instr
+            return f
+
+        def label(name):
+            prog.labels[name] = len(prog.instrs)
+
+        def wrap_target():
+            prog.wrapTarget = len(prog.instrs)
+
+        def wrap():
+            prog.wrap = len(prog.instrs) - 1
+
+        env = dict(fn.__globals__)
+        env.update({name: name for name in OPERANDS})
+        env.update({op: emit(op) for op in ("jmp", "wait", "in_", "out", "push", "pull", "mov", "set", "nop")})
+        env.update(label=label, wrap_target=wrap_target, wrap=wrap)
+        type(fn)(fn.__code__, env, fn.__name__, fn.__defaults__, fn.__closure__)()
+        if prog.wrap is None:
+            prog.wrap = len(prog.instrs) - 1
+        return prog
+    return assemble
+
+
+class StateMachine:
+    def __init__(self, id, prog, freq=-1, **kw):
+        PIO(id // 4).add_program(prog)
+        self.id = id
+        self.prog = prog
+        self.freq = freq
+        self.kw = kw
+        self.txFifo = []
+        self.running = False
+
+    def irq(self, handler=None, trigger=0, hard=False):
+        self.irqHandler = handler
+
+    def put(self, value, shift=0):
+        self.txFifo.append(value >> shift)
+
+    def active(self, v=None):
+        if v is None:
+            return self.running
+        self.running = bool(v)
+
+
+class DMA:
+    _next = 0
+
+    def __init__(self):
+        self.channel = DMA._next
+        DMA._next += 1
+        self.running = False
+
+    def pack_ctrl(self, **kw):
+        return kw
+
+    def config(self, read=None, write=None, count=None, ctrl=None, trigger=False):
+        self.read = read
+        self.write = write
+        self.count = count
+        self.ctrl = ctrl
+
+    def active(self, v=None):
+        if v is None:
+            return self.running
+        self.running = bool(v)
+
+    def close(self):
+        self.running = False
@@ -0,0 +1,135 @@
+# Relay-feedback autotune against the simulated fryer, faster than real time
+# on the virtual-time uasyncio. Checks the measured ultimate gain and period
+# against the plant model, on average over a few noise seeds, then heats and
+# holds with the stock and the first seed's tuned gains.
+# Usage: python3 host/sim_autotune.py
+import hostenv
+import random
+import uasyncio as asyncio
+import relay
+from relay import RelayScheduler
+from autotune import RelayAutotune
+from control import TempController
+from estimator import TempEstimator
+from plant import FryerPlant, score
+from thermistor import countsToTenthsF
+from sim_sensor import countsFor
+
+relay.ticks_ms = asyncio.ticks_ms
+
+SETPOINT = 350
+WINDOW_MS = 5000
+READ_MS = 250
+NOISE_F = 0.3
+TUNE_SEEDS = (1, 2, 3)
+
+
+class Rig:
+    # plant, relay scheduler and a noisy probe, all on the virtual clock. The
+    # probe reads through the ADC and the thermistor table, so below about
+    # 123F it pins at full scale like the real one
+    def __init__(self, seed, startF=None, **plant):
+        self.plant = FryerPlant(startF=startF, **plant)
+        self.rng = random.Random(seed)
+        self.on = False
+        self.relay = RelayScheduler(self.relayOn, self.relayOff, WINDOW_MS)
+        self.trace = [] # (s, probe F)
+
+    def relayOn(self):
+        self.on = True
+
+    def relayOff(self):
+        self.on = False
+
+    def read(self):
+        return countsToTenthsF(countsFor(self.plant.probeF + self.rng.gauss(0, NOISE_F))) / 10
+
+    async def physics(self):
+        ms = int(self.plant.dtS * 1000)
+        while True:
+            await asyncio.sleep_ms(ms)
+            self.plant.step(1.0 if self.on else 0.0)
+            self.trace.append((self.plant.timeS, self.plant.probeF))
+
+    def run(self, control, seconds):
+        async def main():
+            asyncio.create_task(self.physics())
+            task = asyncio.create_task(self.relay.run())
+            result = await asyncio.wait_for_ms(control(self), seconds * 1000) if seconds else await control(self)
+            task.cancel()
+            return result
+
+        asyncio.new_event_loop()
+        try:
+            return asyncio.run(main())
+        except asyncio.TimeoutError:
+            return None
+
+
+def autotune(rig, setValue=SETPOINT):
+    async def control(rig):
+        tuner = RelayAutotune(setValue)
+        estimator = TempEstimator()
+        while not tuner.done:
+            estimator.update(rig.read(), asyncio.ticks_ms())
+            rig.relay.setDuty(tuner.update(estimator.temp, asyncio.ticks_ms()))
+            await asyncio.sleep_ms(READ_MS)
+        rig.relay.setDuty(0)
+        return tuner
+    return rig.run(control, 0)
+
+
+def hold(rig, gains, seconds):
+    async def control(rig):
+        controller = TempController()
+        controller.debug = False
+        if gains is not None:
+            controller.setGains(*gains)
+        while True:
+            rig.relay.setDuty(controller.getDemand(SETPOINT, rig.read()))
+            await asyncio.sleep_ms(WINDOW_MS)
+    rig.run(control, seconds)
+    return score(rig.trace, SETPOINT)
+
+
+if __name__ == "__main__":
+    # the relay only changes at window boundaries: half a window of delay
+    delayS = WINDOW_MS / 2000
+    kuRatios = []
+    tuRatios = []
+    for seed in TUNE_SEEDS:
+        rig = Rig(seed)
+        tuner = autotune(rig)
+        assert not tuner.failed, "autotune didn't settle"
+        amplitude = sum(tuner.swings[-tuner.cycles:]) / tuner.cycles / 2
+        ku, tu = rig.plant.ultimate(delayS, tuner.band, amplitude)
+        kuRatios.append(tuner.ku / ku)
+        tuRatios.append(tuner.tu / tu)
+        minutes = rig.plant.timeS / 60
+        print("seed {}: autotune took {:.0f} simulated minutes, {} cycles, +-{:.1f}F swing".format(
+            seed, minutes, len(tuner.periods), amplitude))
+        print("  measured Ku {:.4f}/F, Tu {:.0f}s; model, same band and swing: Ku {:.4f}/F, Tu {:.0f}s".format(
+            tuner.ku, tuner.tu, ku, tu))
+        if seed == TUNE_SEEDS[0]:
+            first = tuner
+    trueKu, trueTu = rig.plant.ultimate(delayS)
+    print("model, no band: Ku {:.4f}/F, Tu {:.0f}s".format(trueKu, trueTu))
+    # one run's Ku wanders 10-20% with the noise and the last few swings
+    kuRatio = sum(kuRatios) / len(kuRatios)
+    tuRatio = sum(tuRatios) / len(tuRatios)
+    print("measured over model, mean: Ku {:.2f}, Tu {:.2f}".format(kuRatio, tuRatio))
+    assert abs(kuRatio - 1) < 0.15 and abs(tuRatio - 1) < 0.15
+    tuner = first
+
+    gains = tuner.gains(TempController.periodS)
+    print("tuned P {:.4f} I {:.5f} D {:.4f} (stock P {} I {} D {:.4f})".format(
+        *gains, TempController.P, TempController.I, TempController.D))
+
+    results = {}
+    for name, g in (("stock", None), ("tuned", gains)):
+        rise, overshoot, iae = hold(Rig(2), g, 3600)
+        results[name] = overshoot, iae
+        print("{}: rise {:.0f}s, overshoot {:.1f}F, IAE {:.0f}F*s over an hour from cold".format(name, rise, overshoot, iae))
+
+    assert results["tuned"][0] < results["stock"][0], "tuned gains overshoot more"
+    assert results["tuned"][1] <= results["stock"][1], "tuned gains track worse"
@@ -0,0 +1,144 @@
+# Runs the PioDisplay scan program through the cycle-level PIO simulator and
+# checks scan order, slot timing and blanking, then that power cycles don't
+# fill the PIO's program memory. Usage: python3 host/sim_display_pio.py
+import hostenv
+import rp2
+from pio_sim import PioSim
+from display import MAX_SLOTS, QUIET
+from display_pio import PioDisplay, OUT_COUNT, ENABLE_MASK, WORDS_PER_SLOT
+
+
+def feeder(d):
+    # what the two DMA channels do: the dwell word put() by start(), then the buffer on repeat
+    fifo = list(d.sm.txFifo)
+    state = [0]
+
+    def feed():
+        if fifo:
+            return fifo.pop(0)
+        word = d.buffer[state[0] % d.dma[0].count]
+        state[0] += 1
+        return word
+    return feed
+
+
+def litIntervals(trace, end):
+    # (start, end, pins, pindirs) for every stretch with the commons enabled
+    out = []
+    for i, (cycle, pins, dirs) in enumerate(trace):
+        if pins & ENABLE_MASK:
+            stop = trace[i + 1][0] if i + 1 < len(trace) else end
+            out.append((cycle, stop, pins, dirs))
+    return out
+
+
+def simulate(sv, pv, slotUs=1000, blankUs=8, scans=3):
+    d = PioDisplay(slotUs=slotUs, blankUs=blankUs)
+    d.setSV(sv)
+    d.setPV(pv)
+    d.start()
+    sim = PioSim(d.sm.prog, OUT_COUNT, feeder(d))
+    cycles = slotUs * MAX_SLOTS * scans
+    sim.run(cycles)
+    assert sim.stalls == 0
+    d.stop()
+    return d, litIntervals(sim.trace, sim.cycle)
+
+
+def check(sv, pv, slotUs=1000, blankUs=8):
+    d, lit = simulate(sv, pv, slotUs, blankUs)
+    lit.pop()  # cut short by the end of the run
+    frames = [(d.buffer[i * WORDS_PER_SLOT + 1], d.buffer[i * WORDS_PER_SLOT]) for i in range(MAX_SLOTS)]
+    litSlots = [i for i in range(MAX_SLOTS) if frames[i][0] & ENABLE_MASK]
+
+    # every lit stretch is exactly one frame, in scan order, one slotUs apart
+    first = lit[0][0]
+    for n, (start, stop, pins, dirs) in enumerate(lit):
+        slot = litSlots[n % len(litSlots)]
+        scan = n // len(litSlots)
+        assert (pins, dirs) == frames[slot], (n, slot)
+        assert start - first == (scan * MAX_SLOTS + slot - litSlots[0]) * slotUs, (n, start)
+        # dark for blankUs + 3 cycles around each change
+        assert stop - start == slotUs - blankUs - 3, (n, stop - start)
+    print("{!r}/{!r}: {} lit slots per scan, order {}, lit {}us, dark {}us per slot".format(
+        sv, pv, len(litSlots), litSlots, lit[0][1] - lit[0][0], slotUs - (lit[0][1] - lit[0][0])))
+
+
+def checkDimmed():
+    # SV at half brightness and blinking: 2 of every 4 scans lit, then dark for
+    # blinkPeriod cycles. PV stays lit every scan
+    d = PioDisplay(slotUs=100, blankUs=4)
+    d.setSV(350)
+    d.setPV(275)
+    d.setBrightness(d.DISPLAY_SV, 2)
+    d.blink(d.DISPLAY_SV)
+    d.start()
+    assert d.dma[0].count == len(d.schedule) * WORDS_PER_SLOT
+    cycles = len(d.schedule) * 100
+    sim = PioSim(d.sm.prog, OUT_COUNT, feeder(d))
+    sim.run(cycles + 100)
+    lit = litIntervals(sim.trace, sim.cycle)
+    svSlots = pvSlots = 0
+    for start, stop, pins, dirs in lit:
+        if start >= cycles:
+            break
+        slot = [i for i in range(MAX_SLOTS) if d.frames[i] == (dirs, pins)][0]
+        if slot < 3:
+            svSlots += 1
+            # only in the first half, the blink on phase
+            assert start < cycles // 2
+        else:
+            pvSlots += 1
+    assert pvSlots == len(d.schedule) // 2
+    assert svSlots == pvSlots // 4
+    d.stop()
+    print("dimmed + blinking SV: {} SV and {} PV lit slots over {} ticks".format(svSlots, pvSlots, len(d.schedule)))
+
+
+def checkQuiet():
+    # one QUIET slot per brightness cycle: the IRQ fires once per cycle, always
+    # with the commons off, and the slot timing doesn't change
+    d = PioDisplay(slotUs=200, blankUs=4)
+    d.setSV(350)
+    d.setPV(275)
+    d.setQuiet(lambda display: None)
+    d.start()
+    assert d.sm.irqHandler == d.onQuietIrq
+    period = len(d.schedule)
+    assert period == MAX_SLOTS * 4 + 1 and d.schedule[-1] == QUIET
+    sim = PioSim(d.sm.prog, OUT_COUNT, feeder(d))
+    sim.run(period * 200 * 3)
+    assert len(sim.irqs) == 3
+    for (cycle, index), nextCycle in zip(sim.irqs, [c for c, i in sim.irqs[1:]] + [None]):
+        assert index == 0x10  # rel 0
+        pins = [p for c, p, dirs in sim.trace if c <= cycle][-1]
+        assert pins & ENABLE_MASK == 0
+        if nextCycle is not None:
+            assert nextCycle - cycle == period * 200
+    lit = litIntervals(sim.trace, sim.cycle)
+    assert all(stop - start == 200 - 4 - 3 for start, stop, pins, dirs in lit[:-1])
+    d.stop()
+    print("quiet slot: IRQ every {}us with the display dark".format(period * 200))
+
+
+def checkRestarts(cycles=10):
+    # main() starts the display for the boot splash and at every power up,
+    # and stops it at every power down
+    d = PioDisplay()
+    words = len(d.program.instrs)
+    for _ in range(cycles):
+        d.start()
+        assert rp2.PIO(0).used() == words, rp2.PIO(0).used()
+        d.stop()
+    assert rp2.PIO(0).used() == 0
+    print("{} start/stop cycles: {} of {} PIO0 words while running".format(cycles, words, rp2.PROGRAM_WORDS))
+
+
+if __name__ == "__main__":
+    check("350", "275")
+    check(" lo", "  5")
+    check("---", "123", slotUs=500, blankUs=20)
+    checkDimmed()
+    checkQuiet()
+    checkRestarts()
+    print("PioDisplay scan OK")
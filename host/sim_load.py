@@ -0,0 +1,120 @@
+# Food drops on the simulated fryer, with and without the load detector:
+# detection latency, recovery time (back within 2F) and overshoot
+# afterwards, then an hour of holding with no loads for false alarms.
+# Latency is given from the food going in and from when the probe is 1F
+# down, about two reading noise sd: the probe lags the oil by seconds, and
+# nothing can see a fall before the probe does. Readings at the sensor's
+# 20Hz into the estimator, the controller every 5s, as on the Pico.
+# Usage: python3 host/sim_load.py
+import hostenv
+import uasyncio as asyncio
+import load
+from control import TempController
+from estimator import TempEstimator
+from load import LoadDetector
+from sim_autotune import Rig, SETPOINT, WINDOW_MS
+
+load.ticks_diff = lambda a, b: a - b
+
+SENSOR_MS = 50
+TUNED = (0.0230, 0.00120, 0.2900) # what sim_autotune comes up with
+SETTLE_S = 1200 # holding before the load, so the integrator has settled
+DONE_F = 2.0
+VISIBLE_F = 1.0
+# (name, F taken out of the oil, over seconds)
+LOADS = (("small", 15, 10), ("medium", 30, 15), ("large", 50, 20), ("quench", 40, 3))
+
+
+def run(loadF, loadS, useDetector, seconds):
+    rig = Rig(3, startF=SETPOINT)
+    detector = LoadDetector(doneF=DONE_F)
+    estimator = TempEstimator()
+    controller = TempController()
+    controller.debug = False
+    controller.setGains(*TUNED)
+    detections = []
+    startS = SETTLE_S
+    endS = SETTLE_S + loadS
+
+    async def sensor():
+        # readings, the load going in, and the detector
+        holdDuty = 0.0
+        while True:
+            await asyncio.sleep_ms(SENSOR_MS)
+            t = rig.plant.timeS
+            if loadF and startS <= t < endS:
+                rig.plant.drop(loadF * SENSOR_MS / 1000 / loadS)
+            ms = asyncio.ticks_ms()
+            estimator.update(rig.read(), ms)
+            if not useDetector:
+                continue
+            was = detector.recovering()
+            if detector.update(estimator, SETPOINT):
+                if not was:
+                    detections.append(t)
+                    holdDuty = rig.relay.duty
+                    rig.relay.setDuty(1.0, True)
+            elif was:
+                rig.relay.setDuty(holdDuty, True)
+
+    async def control(rig):
+        asyncio.create_task(sensor())
+        while True:
+            if not detector.recovering():
+                ms = asyncio.ticks_ms()
+                rig.relay.setDuty(controller.getDemand(SETPOINT, estimator.temp, estimator.rate, ms))
+            await asyncio.sleep_ms(WINDOW_MS)
+
+    rig.run(control, seconds)
+    return rig, detector, detections
+
+
+def probeDown(rig, byF):
+    # first time after the load went in that the probe was byF down
+    before = None
+    for t, f in rig.trace:
+        if t < SETTLE_S:
+            before = f
+        elif f < before - byF:
+            return t
+
+
+def recovery(rig):
+    # load start to back within DONE_F, lowest point, and overshoot after
+    back = None
+    low = 1e9
+    peak = -1e9
+    for t, f in rig.trace:
+        if t < SETTLE_S:
+            continue
+        low = min(low, f)
+        if back is None and low < SETPOINT - DONE_F and f >= SETPOINT - DONE_F:
+            back = t - SETTLE_S
+        if back is not None:
+            peak = max(peak, f)
+    return back, low, peak - SETPOINT
+
+
+if __name__ == "__main__":
+    for name, loadF, loadS in LOADS:
+        results = {}
+        for useDetector in (False, True):
+            rig, detector, detections = run(loadF, loadS, useDetector, SETTLE_S + 1200)
+            back, low, overshoot = results[useDetector] = recovery(rig)
+            line = "{:6} {}F over {}s, {:11} back within {:.0f}F after {:3.0f}s, low {:.1f}F, overshoot {:.1f}F".format(
+                name, loadF, loadS, "detector:" if useDetector else "controller:", DONE_F, back, low, max(overshoot, 0.0))
+            if useDetector:
+                assert len(detections) == 1, detections
+                seen = probeDown(rig, VISIBLE_F)
+                latency = detections[0] - seen
+                line += "\n{:33} detected {:.2f}s in, {:.2f}s after the probe was {:.0f}F down, logged recovery {:.0f}s".format(
+                    "", detections[0] - SETTLE_S, latency, VISIBLE_F, detector.lastRecovery() / 1000)
+                assert latency < (1.0 if name == "quench" else 2.0), "slow to see it"
+            print(line)
+        assert results[True][0] < results[False][0], "no faster"
+        assert results[True][2] < DONE_F, "overshoots"
+
+    # no loads: nothing to find in an hour of holding
+    rig, detector, detections = run(0, 1, True, SETTLE_S + 3600)
+    print("an hour without loads: {} false detections".format(len(detections)))
+    assert not detections
@@ -0,0 +1,158 @@
+# Cutoff latency of the protection timer. A stand-in ADC follows a
+# temperature trace with noise and display-switching spikes, and a fault is
+# injected at a random moment; latency is fault to relay off, on a virtual
+# clock. Then the heater at full duty with no rise: an open probe on a cold
+# fryer (pinned like cold oil) and a dead element. Also runs an hour of
+# fault-free frying, full heat from cold and after every basket, to check
+# nothing trips. Usage: python3 host/sim_protect.py
+import hostenv
+import random
+import protect
+from protect import Protection, REASONS, OK, STALLED
+from sim_sensor import countsFor
+
+TRIALS = 200
+LIMIT_MS = 100
+STALL_TRIALS = 3
+
+
+class Clock:
+    now = 0 # us
+
+    def ticks_ms(self):
+        return self.now // 1000
+
+
+clock = Clock()
+protect.ticks_ms = clock.ticks_ms
+
+
+class FaultyAdc:
+    def __init__(self, rng, trace):
+        self.rng = rng
+        self.trace = trace # us -> (temperature F, or counts to force)
+        self.cache = {}
+
+    def read_u16(self):
+        temp, forced = self.trace(clock.now)
+        if forced is not None:
+            value = forced
+        else:
+            tenths = int(temp * 10)
+            if tenths not in self.cache:
+                self.cache[tenths] = countsFor(tenths / 10)
+            value = self.cache[tenths] + self.rng.gauss(0, 40)
+            if self.rng.random() < 0.02:
+                value += self.rng.uniform(-8000, 8000) # a segment switching
+        raw = min(max(int(value) >> 4, 0), 4095)
+        return (raw << 4) | (raw >> 8)
+
+
+class Heater:
+    # the relay scheduler's duty, as the controller would set it over time
+    def __init__(self, dutyAt):
+        self.dutyAt = dutyAt # us -> duty
+
+    @property
+    def duty(self):
+        return self.dutyAt(clock.now)
+
+
+class Relay:
+    def __init__(self):
+        self.offAt = None
+
+    def off(self):
+        if self.offAt is None:
+            self.offAt = clock.now
+
+
+def run(trace, untilUs, rng, dutyAt=None):
+    relay = Relay()
+    p = Protection(FaultyAdc(rng, trace), relay.off, Heater(dutyAt) if dutyAt else None)
+    p.start()
+    clock.now = rng.randint(0, p.periodMs * 1000) # timer phase
+    while clock.now < untilUs and not p.tripped:
+        p.timer.fire()
+        clock.now += p.periodMs * 1000
+    p.stop()
+    return p, relay
+
+
+def faults(rng):
+    # name, trace, when the fault becomes real (us)
+    at = rng.randint(3000000, 4000000)
+    yield "shorted probe", lambda us: (350.0, 30 if us >= at else None), at
+    yield "open probe", lambda us: (350.0, 65535 if us >= at else None), at
+    yield "connector jump +40F", lambda us: (390.0 if us >= at else 350.0, None), at
+    # heater stuck on: 2F/s from 380, past the 410F limit at `at`
+    yield "runaway", lambda us: (410 + 2 * (us - at) / 1000000, None), at
+
+
+def normal(us):
+    # an hour of frying: cold start, then a basket every five minutes
+    t = us / 1000000
+    if t < 600:
+        return 70 + 280 * t / 600, None
+    since = (t - 600) % 300
+    if since < 20:
+        return 350 - 2 * since, None # ~2F/s quench, well under the rate limit
+    return max(310 + (since - 20) / 2, 310) if since < 100 else 350.0, None
+
+
+def normalDuty(us):
+    # full heat through the preheat and every basket's recovery
+    t = us / 1000000
+    if t < 600 or (t - 600) % 300 < 100:
+        return 1.0
+    return 0.4
+
+
+def stalls():
+    # name, trace; the heater is full on from the start
+    yield "open probe, cold fryer", lambda us: (70.0, 65535)
+    yield "dead element at 200F", lambda us: (200.0, None)
+
+
+if __name__ == "__main__":
+    rng = random.Random(1)
+    latencies = {}
+    tripTemps = []
+    for _ in range(TRIALS):
+        for name, trace, at in faults(rng):
+            p, relay = run(trace, at + 2000000, rng)
+            assert p.tripped != OK, name + " never tripped"
+            if name == "runaway":
+                # noise trips it a little either side of the limit, what
+                # matters is how far past it the oil gets
+                tripTemps.append(trace(relay.offAt)[0])
+                limitF = p.maxTenths // 10
+            else:
+                latencies.setdefault(name, []).append(((relay.offAt - at) / 1000, REASONS[p.tripped]))
+
+    worst = 0
+    for name, results in latencies.items():
+        ms = [r[0] for r in results]
+        reasons = sorted(set(r[1] for r in results))
+        worst = max(worst, max(ms))
+        print("{:20} cutoff mean {:5.1f}ms, worst {:5.1f}ms ({})".format(name, sum(ms) / len(ms), max(ms), ", ".join(reasons)))
+
+    print("runaway at 2F/s cut off at {:.1f}-{:.1f}F (limit {}F)".format(min(tripTemps), max(tripTemps), limitF))
+
+    for name, trace in stalls():
+        cutS = []
+        for _ in range(STALL_TRIALS):
+            p, relay = run(trace, 2 * 3600 * 1000000, rng, lambda us: 1.0)
+            assert p.tripped == STALLED, name + ": " + REASONS[p.tripped]
+            cutS.append(relay.offAt / 1000000)
+        stallS = p.stallTicks * p.periodMs / 1000
+        print("{:22} at full heat cut off after {:.0f}-{:.0f}s ({})".format(name, min(cutS), max(cutS), REASONS[STALLED]))
+        assert max(cutS) < stallS + 1
+
+    p, relay = run(normal, 3600 * 1000000, random.Random(2), normalDuty)
+    print("an hour of normal frying: {}".format("tripped: " + REASONS[p.tripped] if p.tripped else "no trips"))
+    print("the old check in regulate() only caught a short, 0-5s after it happened")
+
+    assert worst < LIMIT_MS
+    assert max(tripTemps) < limitF + 2 * LIMIT_MS / 1000
+    assert p.tripped == OK
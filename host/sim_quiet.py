@@ -0,0 +1,101 @@
+# Quiet-window sampling against sampling whenever, with made-up interference
+# from the display and the relay. Runs on a virtual microsecond clock.
+# Usage: python3 host/sim_quiet.py
+import hostenv
+import random
+import sampler
+from display import Display
+from sampler import QuietSampler
+from filters import COUNT_FRAC
+
+TRUE_COUNTS = 20577
+SLOT_US = 1000
+READ_US = 4  # one conversion plus the Python around it
+
+
+class World:
+    # Virtual time plus everything that makes the thermistor reading noisy
+    def __init__(self, seed):
+        self.now = 0
+        self.slotChange = 0
+        self.relayEdge = -10 ** 9
+        self.display = None
+        self.random = random.Random(seed)
+
+    def ticks_us(self):
+        self.now += 1  # polling the clock isn't free either
+        return self.now
+
+    def ticks_ms(self):
+        return self.now // 1000
+
+    def read_u16(self):
+        self.now += READ_US
+        noise = 40.0
+        if self.display.ledDE.value():
+            noise += 250  # segment current on the shared ground
+        value = TRUE_COUNTS + self.random.gauss(0, noise)
+        if self.now - self.slotChange < 30:
+            value += self.random.uniform(-4000, 4000)  # lines switching
+        sinceRelay = self.now - self.relayEdge
+        if sinceRelay < 60000:
+            value += self.random.gauss(0, 1500 * (1 - sinceRelay / 60000))
+        return min(max(int(value), 0), 65535)
+
+
+def run(quiet, seed, seconds=20, stepMs=500, relayMs=2500):
+    world = World(seed)
+    sampler.ticks_us = world.ticks_us
+    sampler.ticks_ms = world.ticks_ms
+    d = Display()
+    d.setSV(350)
+    d.setPV(275)
+    world.display = d
+    q = QuietSampler(world, holdoffMs=80)
+    if quiet:
+        d.setQuiet(q.window)
+
+    estimates = []
+    total = count = 0
+    nextStep = stepMs * 1000
+    nextRelay = relayMs * 1000
+    while world.now < seconds * 1000000:
+        tickStart = world.now
+        world.slotChange = world.now
+        d.nextDigit()
+        if not quiet:
+            # about as many reads per ms as the quiet windows give, at any time
+            for _ in range(4):
+                world.now = tickStart + world.random.randrange(SLOT_US - READ_US)
+                total += world.read_u16()
+                count += 1
+        world.now = tickStart + SLOT_US
+        if world.now >= nextRelay:
+            world.relayEdge = world.now
+            q.relayEdge()
+            nextRelay += relayMs * 1000
+        if world.now >= nextStep:
+            if quiet:
+                estimates.append(q.take() / (1 << COUNT_FRAC))
+            else:
+                estimates.append(total / count)
+                total = count = 0
+            nextStep += stepMs * 1000
+    return estimates, q
+
+
+def stats(values):
+    mean = sum(values) / len(values)
+    return mean - TRUE_COUNTS, (sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5
+
+
+if __name__ == "__main__":
+    anytime, _ = run(False, 1)
+    quiet, q = run(True, 1)
+    used = [n for n in q.perWindow if n]
+    print("anytime: bias {:6.1f} sd {:6.1f} counts".format(*stats(anytime)))
+    print("quiet:   bias {:6.1f} sd {:6.1f} counts".format(*stats(quiet)))
+    print("quiet windows: {} total, {} skipped near relay edges, {}-{} samples each".format(
+        q.windows, q.skipped, min(used), max(used)))
+    assert stats(quiet)[1] < stats(anytime)[1] / 3
+    assert q.skipped > 0
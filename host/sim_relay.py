@@ -0,0 +1,145 @@
+# Relay scheduler timing on the virtual-time uasyncio: window starts, on
+# times, minimum on/off and edge jitter while other tasks hog the CPU and the
+# duty changes at random moments. Then the same with setDuty(now=True)
+# cutting windows short, which still has to keep to the minimum on and off
+# times. Usage: python3 host/sim_relay.py
+import hostenv
+import random
+import uasyncio as asyncio
+import relay
+from relay import RelayScheduler
+
+relay.ticks_ms = asyncio.ticks_ms
+
+WINDOW_MS = 5000
+MIN_MS = 500
+WINDOWS = 400
+HOG_MS = 4 # longest another task keeps the CPU
+
+
+class Recorder(RelayScheduler):
+    # logs every window as it's planned, and every real relay edge
+    def __init__(self):
+        RelayScheduler.__init__(self, self.relayOn, self.relayOff, WINDOW_MS, MIN_MS)
+        self.state = False
+        self.edges = [] # (ms, on)
+        self.planned = [] # (ms, duty, onMs)
+        self.sets = [(0, 0.0)] # (ms, duty) from the controller
+
+    def relayOn(self):
+        if not self.state:
+            self.state = True
+            self.edges.append((asyncio.ticks_ms(), True))
+
+    def relayOff(self):
+        if self.state:
+            self.state = False
+            self.edges.append((asyncio.ticks_ms(), False))
+
+    def plan(self, duty):
+        onMs = RelayScheduler.plan(self, duty)
+        self.planned.append((asyncio.ticks_ms(), duty, onMs))
+        return onMs
+
+
+async def hog(rng):
+    # everything else: sensor reads, display updates, prints
+    while True:
+        await asyncio.sleep_ms(rng.randint(1, 13))
+        asyncio.advance(rng.randint(0, HOG_MS * 1000))
+
+
+async def controller(r, rng):
+    # demand changes whenever it likes, not on window boundaries
+    while True:
+        await asyncio.sleep_ms(rng.randint(500, 9000))
+        duty = rng.choice((0.0, 0.05, 0.3, 0.5, 0.95, 1.0, rng.random()))
+        r.setDuty(duty)
+        r.sets.append((asyncio.ticks_ms(), duty))
+
+
+async def urgent(r, rng):
+    # the load detector: now=True, often just after an edge
+    while True:
+        await asyncio.sleep_ms(rng.randint(50, 3000))
+        duty = rng.choice((0.0, 0.3, 1.0, rng.random()))
+        r.setDuty(duty, True)
+        r.sets.append((asyncio.ticks_ms(), duty))
+
+
+def simulate(seed, now=False):
+    rng = random.Random(seed)
+    r = Recorder()
+
+    async def main():
+        task = asyncio.create_task(r.run())
+        asyncio.create_task(hog(rng))
+        asyncio.create_task((urgent if now else controller)(r, rng))
+        await asyncio.sleep_ms(WINDOWS * WINDOW_MS)
+        task.cancel()
+        await asyncio.sleep_ms(0)
+
+    asyncio.new_event_loop()
+    origin = asyncio.ticks_ms()
+    asyncio.run(main())
+    return r, origin
+
+
+def check(r, origin):
+    # window k starts at origin + k * WINDOW_MS, late by at most the hog time
+    starts = [ms - origin for ms, _, _ in r.planned]
+    late = [s - k * WINDOW_MS for k, s in enumerate(starts)]
+    assert min(late) >= 0 and max(late) <= HOG_MS + 1, (min(late), max(late))
+
+    # each window runs at the newest duty set before it started, and a
+    # change mid-window waits for the next one
+    for ms, duty, _ in r.planned:
+        assert duty == [d for at, d in r.sets if at <= ms][-1]
+
+    # snapping
+    for _, duty, onMs in r.planned:
+        assert onMs in (0, WINDOW_MS) or MIN_MS <= onMs <= WINDOW_MS - MIN_MS
+        assert abs(onMs - duty * WINDOW_MS) <= MIN_MS
+
+    # every on and off stretch lasts at least MIN_MS, give or take jitter
+    shortest = min(b[0] - a[0] for a, b in zip(r.edges, r.edges[1:]))
+    assert shortest >= MIN_MS - HOG_MS - 1, shortest
+
+    # on time in each window is what was planned for it
+    onTimes = []
+    for (start, _, onMs), (end, _, _) in zip(r.planned, r.planned[1:]):
+        on = 0
+        state = r.edges[0][1] if r.edges and r.edges[0][0] < start else False
+        t = start
+        for ms, edgeOn in r.edges:
+            if ms < start:
+                state = edgeOn
+                continue
+            if ms >= end:
+                break
+            if state:
+                on += ms - t
+            state, t = edgeOn, ms
+        if state:
+            on += end - t
+        onTimes.append(on - onMs)
+        assert abs(on - onMs) <= 2 * HOG_MS + 2, (start, on, onMs)
+    return late, onTimes, shortest
+
+
+if __name__ == "__main__":
+    r, origin = simulate(1)
+    late, onErrors, shortest = check(r, origin)
+    drift = late[-1]
+    print("{} windows, {} relay edges".format(len(r.planned), len(r.edges)))
+    print("window start jitter: mean {:.1f}ms, worst {}ms, last window {}ms late (no drift)".format(
+        sum(late) / len(late), max(late), drift))
+    print("on time error per window: worst {}ms".format(max(abs(e) for e in onErrors)))
+    print("shortest on/off stretch {}ms (minimum {}ms)".format(shortest, MIN_MS))
+    print("scheduler's own worst wakeup: {}ms late".format(r.maxLateMs))
+    assert not r.state, "relay left on after cancel"
+
+    r, _ = simulate(2, now=True)
+    shortest = min(b[0] - a[0] for a, b in zip(r.edges, r.edges[1:]))
+    print("with setDuty(now=True): {} relay edges, shortest on/off stretch {}ms".format(len(r.edges), shortest))
+    assert shortest >= MIN_MS - HOG_MS - 1, shortest
@@ -0,0 +1,131 @@
+# PV latency and CPU share of the sensor task against the old read-once-per-
+# control-period loop, on the virtual-time uasyncio stand-in. The oil drops
+# 30F in a step (a basket going in) at a different point of the control
+# period in each trial; latency is how long the PV display takes to show it.
+# Usage: python3 host/sim_sensor.py
+import hostenv
+import uasyncio as asyncio
+import sensor
+from sensor import Sensor
+from filters import SamplePipeline
+from thermistor import countsToTenthsF
+
+LOOP_MS = 5000
+SENSOR_MS = 50
+READ_US = 4 # one conversion plus the Python around it
+BEFORE = 350
+AFTER = 320
+TRIALS = 20
+
+sensor.ticks_ms = asyncio.ticks_ms
+sensor.ticks_us = asyncio.ticks_us
+
+
+def countsFor(tempF):
+    # the ADC reading for a temperature, by bisection (counts fall as it heats)
+    lo, hi = 0, 65535
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if countsToTenthsF(mid) > tempF * 10:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+class PlantAdc:
+    # the thermistor reading follows the step; every read costs READ_US
+    before = countsFor(BEFORE)
+    after = countsFor(AFTER)
+
+    def __init__(self):
+        self.stepMs = 0
+
+    def read_u16(self):
+        asyncio.advance(READ_US)
+        if asyncio.ticks_ms() < self.stepMs:
+            return self.before
+        return self.after
+
+
+class PvLog:
+    def __init__(self):
+        self.shown = []
+
+    def setPV(self, pv):
+        self.shown.append((asyncio.ticks_ms(), pv))
+
+    def latency(self, stepMs):
+        for ms, pv in self.shown:
+            if ms >= stepMs and pv != " lo" and abs(pv - AFTER) <= 2:
+                return ms - stepMs
+        return None
+
+
+async def legacy(adc, pipeline, pv, busy):
+    # what regulate() did: read, show, then sleep out the control period
+    while True:
+        start = asyncio.ticks_us()
+        counts = pipeline.fromAdc(adc)
+        busy[0] += asyncio.ticks_us() - start
+        pv.setPV(countsToTenthsF(counts >> 4) // 10)
+        await asyncio.sleep_ms(LOOP_MS)
+
+
+async def pvHandler(s, pv):
+    # as in main.py
+    shown = None
+    while True:
+        await s.fresh.wait()
+        tempInF = s.tenthsF // 10
+        value = " lo" if tempInF < 140 else tempInF
+        if value != shown:
+            pv.setPV(value)
+            shown = value
+
+
+def trial(phaseMs, useSensor):
+    adc = PlantAdc()
+    pipeline = SamplePipeline()
+    pv = PvLog()
+    busy = [0]
+    result = {}
+
+    async def run():
+        start = asyncio.ticks_ms()
+        adc.stepMs = start + 3 * LOOP_MS + phaseMs
+        if useSensor:
+            s = Sensor(lambda: pipeline.fromAdc(adc), SENSOR_MS)
+            asyncio.create_task(s.run())
+            asyncio.create_task(pvHandler(s, pv))
+        else:
+            asyncio.create_task(legacy(adc, pipeline, pv, busy))
+        await asyncio.sleep_ms(6 * LOOP_MS)
+        elapsed = (asyncio.ticks_ms() - start) * 1000
+        result["latency"] = pv.latency(adc.stepMs)
+        result["cpu"] = 100 * (s.busyUs if useSensor else busy[0]) / elapsed
+
+    asyncio.new_event_loop()
+    asyncio.run(run())
+    return result
+
+
+def summary(useSensor):
+    latencies = []
+    cpu = 0
+    for i in range(TRIALS):
+        r = trial(i * 263 % LOOP_MS, useSensor)
+        assert r["latency"] is not None, "PV never showed the step"
+        latencies.append(r["latency"])
+        cpu = r["cpu"]
+    return sum(latencies) / len(latencies), max(latencies), cpu
+
+
+if __name__ == "__main__":
+    for name, useSensor in (("once per control period", False),
+                            ("sensor task at {}ms".format(SENSOR_MS), True)):
+        mean, worst, cpu = summary(useSensor)
+        print("{}: PV latency mean {:.0f}ms, worst {}ms, {:.2f}% CPU".format(name, mean, worst, cpu))
+        if useSensor:
+            assert worst <= 2 * SENSOR_MS, "sensor task PV is stale"
+            assert cpu < 5, "sensor task takes too much CPU"
@@ -0,0 +1,134 @@
+# Set value changes on the simulated fryer: straight to the new value, as
+# the knob always did, against through the trajectory generator
+# (src/trajectory.py). Overshoot past the new value (undershoot going down),
+# time until it's within 2F for good, and IAE against it, with the autotuned
+# gains, with and without the plant model, averaged over a few noise seeds.
+# Each run holds the old set value long enough to settle first. Rises step
+# straight to the new value, as the knob does, so those come out the same;
+# the falls are where the trajectory has to earn its keep. Then a two-leg
+# profile from cold, hold 325 then 350, against the knob turned to 350 when
+# the hold ends. Usage: python3 host/sim_trajectory.py
+import hostenv
+import uasyncio as asyncio
+import trajectory
+from control import TempController
+from estimator import TempEstimator
+from model import Fopdt
+from trajectory import Trajectory
+from sim_autotune import Rig, WINDOW_MS, READ_MS
+
+trajectory.ticks_diff = lambda a, b: a - b
+
+TUNED = (0.0230, 0.00120, 0.2900) # what sim_autotune comes up with
+MODEL = Fopdt(1117.0, 2443.0, 61.0, 70.0) # what bench_model identifies
+SETTLE_S = 1800
+AFTER_S = 1800
+DONE_F = 2.0
+# (from F, to F)
+CHANGES = ((325, 350), (300, 350), (350, 375), (350, 325), (375, 350), (375, 300))
+PROFILE = ((325, 900), (350, 0)) # (F, hold s)
+PREHEAT_S = 1200 # from cold to the first leg, about
+SEEDS = (1, 2, 3, 4)
+
+
+def knobAt(steps, elapsedS):
+    # the set value the knob shows elapsedS into steps, each leg straight
+    # to its value as soon as the one before has been held for its time
+    for tempF, holdS in steps:
+        elapsedS -= holdS
+        if elapsedS < 0:
+            break
+    return tempF
+
+
+def run(steps, useTrajectory, model, startF, switchS, seconds, seed):
+    # hold startF (None: from cold, the first leg preheats) until switchS,
+    # then steps as for Trajectory.profile()
+    rig = Rig(seed, startF=startF)
+
+    async def control(rig):
+        controller = TempController(model)
+        controller.debug = False
+        controller.setGains(*TUNED)
+        estimator = TempEstimator()
+        estimator.update(rig.read(), asyncio.ticks_ms())
+        generator = Trajectory()
+        # power on holds the knob's value: the preheat needs no ramp
+        generator.hold(steps[0][0] if startF is None else startF)
+        begun = False
+        while True:
+            ms = asyncio.ticks_ms()
+            t = rig.plant.timeS
+            if t < switchS:
+                setValue = generator.target(ms, estimator.temp)
+            elif useTrajectory:
+                if not begun:
+                    begun = True
+                    generator.profile(steps, ms)
+                setValue = generator.target(ms, estimator.temp)
+            else:
+                setValue = knobAt(steps, t - switchS)
+            rig.relay.setDuty(controller.getDemand(setValue, estimator.temp, estimator.rate, ms))
+            for _ in range(WINDOW_MS // READ_MS):
+                await asyncio.sleep_ms(READ_MS)
+                estimator.update(rig.read(), asyncio.ticks_ms())
+
+    rig.run(control, seconds)
+    return rig
+
+
+def score(rig, fromS, finalF):
+    # overshoot past finalF in the direction of travel, time from fromS
+    # until within DONE_F for good, IAE against finalF from fromS
+    rising = True
+    peak = 0.0
+    last = fromS
+    iae = 0.0
+    for (t0, f0), (t1, f1) in zip(rig.trace, rig.trace[1:]):
+        if t0 < fromS:
+            rising = finalF > f0
+            continue
+        peak = max(peak, f0 - finalF if rising else finalF - f0)
+        if abs(f0 - finalF) > DONE_F:
+            last = t0
+        iae += abs(f0 - finalF) * (t1 - t0)
+    return peak, last - fromS, iae
+
+
+def average(steps, useTrajectory, model, startF, switchS, scoreS, seconds):
+    results = [score(run(steps, useTrajectory, model, startF, switchS, seconds, seed), scoreS, steps[-1][0])
+               for seed in SEEDS]
+    return [sum(r[k] for r in results) / len(results) for k in range(3)]
+
+
+def line(name, result):
+    return "{:11} overshoot {:3.1f}F, within {:.0f}F after {:4.0f}s, IAE {:6.0f}F*s".format(
+        name + ":", result[0], DONE_F, result[1], result[2])
+
+
+if __name__ == "__main__":
+    for modelName, model in (("no model", None), ("model", MODEL)):
+        for fromF, toF in CHANGES:
+            knob, ramp = [average(((toF, 0),), useTrajectory, model, fromF, SETTLE_S, SETTLE_S, SETTLE_S + AFTER_S)
+                          for useTrajectory in (False, True)]
+            for name, result in (("knob", knob), ("trajectory", ramp)):
+                print("{:8} {}F to {}F, {}".format(modelName, fromF, toF, line(name, result)))
+            if toF < fromF:
+                # the heater can only stop: where the landing earns its keep,
+                # and waiting for the oil it mustn't take longer either
+                assert ramp[0] < knob[0] * 0.7, "undershoot barely better"
+                assert ramp[1] < knob[1], "slower to settle"
+                assert ramp[2] < knob[2], "IAE got worse"
+            else:
+                # a ramp up only ever held the oil back: it's a step now
+                assert ramp == knob, "a rise isn't a step"
+
+        # the second leg starts when the first has been held for its time,
+        # which is the same for both after a preheat of the same length
+        legS = PREHEAT_S + PROFILE[0][1]
+        knob, ramp = [average(PROFILE, useTrajectory, model, None, PREHEAT_S, legS, legS + AFTER_S)
+                      for useTrajectory in (False, True)]
+        for name, result in (("knob", knob), ("trajectory", ramp)):
+            print("{:8} cold, {}F {}s then {}F, {}".format(
+                modelName, PROFILE[0][0], PROFILE[0][1], PROFILE[1][0], line(name, result)))
+        assert ramp == knob, "a rise isn't a step"
@@ -0,0 +1,254 @@
+# Virtual-time stand-in for uasyncio. Tasks run against a simulated clock:
+# when every task is waiting, the clock jumps straight to the next wakeup, so
+# minutes of fryer time take milliseconds. ticks_ms()/ticks_us() read that
+# clock; host scripts point the modules under test at them
+# (module.ticks_ms = asyncio.ticks_ms) and call advance(us) from stand-ins to
+# charge CPU time to whatever is running.
+from collections import deque
+from heapq import heappush, heappop
+import types
+
+
+class CancelledError(BaseException):
+    pass
+
+
+class TimeoutError(Exception):
+    pass
+
+
+_now = 0 # microseconds
+_ready = deque()
+_sleeping = [] # heap of (wakeUs, seq, task, token)
+_seq = 0
+_current = None
+_handler = None
+
+
+def ticks_us():
+    return _now
+
+
+def ticks_ms():
+    return _now // 1000
+
+
+def advance(us):
+    # the running code took us microseconds of CPU
+    global _now
+    _now += int(us)
+
+
+@types.coroutine
+def _park(until=None, waitOn=None):
+    # suspend the running task until the clock reaches until and/or somebody
+    # schedules it off the waitOn list
+    yield (until, waitOn)
+
+
+class Task:
+    def __init__(self, coro):
+        self.coro = coro
+        self.done = False
+        self.result = None
+        self.exc = None
+        self.waiting = [] # tasks awaiting this one
+        self.retrieved = False
+        self._cancel = False
+        self._token = 0 # bumped on every wakeup, stale heap entries are skipped
+        self._on = None # list this task is parked on
+
+    def cancel(self):
+        if self.done:
+            return False
+        self._cancel = True
+        _schedule(self)
+        return True
+
+    def __await__(self):
+        self.retrieved = True
+        if not self.done:
+            yield from _park(None, self.waiting)
+        if self.exc is not None:
+            raise self.exc
+        return self.result
+
+
+def _schedule(task):
+    task._token += 1
+    if task._on is not None:
+        if task in task._on:
+            task._on.remove(task)
+        task._on = None
+    if task not in _ready and task is not _current:
+        _ready.append(task)
+
+
+def _finish(task, result, exc):
+    task.done = True
+    task.result = result
+    task.exc = exc
+    waiting = task.waiting
+    task.waiting = []
+    for t in waiting:
+        _schedule(t)
+    if exc is not None and not waiting and not isinstance(exc, CancelledError):
+        if _handler is not None:
+            _handler(_loop, {"message": "Task exception wasn't retrieved", "exception": exc, "future": task})
+        elif not task.retrieved:
+            print("Task exception wasn't retrieved:", repr(exc))
+
+
+def _step(task):
+    global _current, _seq
+    _current = task
+    try:
+        if task._cancel:
+            task._cancel = False
+            until, waitOn = task.coro.throw(CancelledError())
+        else:
+            until, waitOn = task.coro.send(None)
+    except StopIteration as e:
+        _finish(task, e.value, None)
+    except BaseException as e:
+        _finish(task, None, e)
+        if not isinstance(e, (Exception, CancelledError)):
+            raise
+    else:
+        if until is None and waitOn is None:
+            _ready.append(task)
+        if until is not None:
+            _seq += 1
+            heappush(_sleeping, (until, _seq, task, task._token))
+        if waitOn is not None:
+            waitOn.append(task)
+            task._on = waitOn
+    finally:
+        _current = None
+
+
+def create_task(coro):
+    task = Task(coro)
+    _ready.append(task)
+    return task
+
+
+def current_task():
+    return _current
+
+
+async def sleep_ms(ms):
+    await _park(_now + int(ms * 1000))
+
+
+async def sleep(s):
+    await _park(_now + int(s * 1000000))
+
+
+async def wait_for_ms(aw, ms):
+    task = aw if isinstance(aw, Task) else create_task(aw)
+    task.retrieved = True
+    if not task.done:
+        await _park(_now + int(ms * 1000), task.waiting)
+    if not task.done:
+        task.cancel()
+        raise TimeoutError()
+    if task.exc is not None:
+        raise task.exc
+    return task.result
+
+
+async def wait_for(aw, s):
+    return await wait_for_ms(aw, s * 1000)
+
+
+async def gather(*aws, return_exceptions=False):
+    tasks = [aw if isinstance(aw, Task) else create_task(aw) for aw in aws]
+    results = []
+    for task in tasks:
+        try:
+            results.append(await task)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+class Event:
+    def __init__(self):
+        self.state = False
+        self.waiting = []
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        # like uasyncio, everybody waiting is scheduled even if the event is
+        # cleared again before they run
+        self.state = True
+        waiting = self.waiting
+        self.waiting = []
+        for t in waiting:
+            t._on = None
+            _schedule(t)
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        if not self.state:
+            await _park(None, self.waiting)
+        return True
+
+
+class ThreadSafeFlag(Event):
+    async def wait(self):
+        await Event.wait(self)
+        self.state = False
+
+
+class _Loop:
+    def set_exception_handler(self, handler):
+        global _handler
+        _handler = handler
+
+    def get_exception_handler(self):
+        return _handler
+
+
+_loop = _Loop()
+
+
+def get_event_loop():
+    return _loop
+
+
+def new_event_loop():
+    # drops every task, the clock keeps going
+    global _handler
+    _ready.clear()
+    _sleeping.clear()
+    _handler = None
+    return _loop
+
+
+def run(coro):
+    global _now
+    main = create_task(coro)
+    main.retrieved = True
+    while not main.done:
+        if _ready:
+            _step(_ready.popleft())
+            continue
+        if not _sleeping:
+            raise RuntimeError("every task is waiting on an event")
+        until, _, task, token = heappop(_sleeping)
+        if token != task._token or task.done:
+            continue
+        if until > _now:
+            _now = until
+        _schedule(task)
+    if main.exc is not None:
+        raise main.exc
+    return main.result
@@ -0,0 +1,4 @@
+# Host stand-in for uctypes. Addresses are only used as opaque numbers here.
+
+def addressof(obj):
+    return id(obj) & 0xffffffff
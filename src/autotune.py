@@ -0,0 +1,109 @@
+# Relay-feedback autotune (Astrom-Hagglund). The heater is switched between
+# high and low duty whenever the temperature leaves a small band around the
+# setpoint, which makes the oil oscillate at the loop's ultimate period. From
+# the swing and the period:
+#   Ku = 4 * d / (pi * sqrt(a^2 - h^2))    d: half the duty step, a: half the
+#   Tu = time between upward switches      temperature swing, h: half the band
+# and a Ziegler-Nichols style rule turns those into PID gains.
+#
+# Holding frying temperature takes about a quarter duty, so a plain 0/1
+# relay gives a lopsided oscillation that the formula above misreads. After
+# each cycle the relay is re-centred on that cycle's mean duty (the duty that
+# holds the setpoint) with the widest symmetric step that fits in 0..1.
+# The band has to sit above the noise, so feed it filtered temperatures (the
+# estimator's), and keep it small: the hysteresis lengthens the period.
+
+# (Kp / Ku, Ti / Tu, Td / Tu)
+RULES = {
+    "classic": (0.6, 0.5, 0.125),
+    "some overshoot": (0.33, 0.5, 0.33),
+    "no overshoot": (0.2, 0.5, 0.33),
+}
+
+class RelayAutotune:
+    def __init__(self, setValue, high=1.0, low=0.0, band=0.5, cycles=3, tolerance=0.1, maxCycles=12):
+        self.setValue = setValue
+        self.high = high
+        self.low = low
+        self.downMs = -1 # last switch down
+        self.band = band # F either side of the setpoint
+        self.cycles = cycles # consistent cycles needed
+        self.tolerance = tolerance # how consistent
+        self.maxCycles = maxCycles
+        self.output = high
+        self.switchMs = -1 # last switch up
+        self.hi = -1e9
+        self.lo = 1e9
+        # per completed cycle, newest last: (period ms, swing F)
+        self.periods = []
+        self.swings = []
+        self.done = False
+        self.failed = False
+        self.ku = 0.0
+        self.tu = 0.0
+
+    def update(self, processValue, ms):
+        # feed a reading, returns the duty to run the heater at
+        if self.done:
+            return self.low
+        if processValue > self.hi:
+            self.hi = processValue
+        if processValue < self.lo:
+            self.lo = processValue
+        if self.output == self.high and processValue > self.setValue + self.band:
+            self.output = self.low
+            self.downMs = ms
+        elif self.output == self.low and processValue < self.setValue - self.band:
+            if self.switchMs >= 0:
+                period = ms - self.switchMs
+                self.periods.append(period)
+                self.swings.append(self.hi - self.lo)
+                self.check()
+                self.recentre(((self.downMs - self.switchMs) * self.high + (ms - self.downMs) * self.low) / period)
+            self.output = self.high
+            # the first upward switch ends the warm-up, cycles count from here
+            self.switchMs = ms
+            self.hi = processValue
+            self.lo = processValue
+        return self.output
+
+    def recentre(self, bias):
+        step = min(bias, 1.0 - bias)
+        self.high = bias + step
+        self.low = bias - step
+
+    def check(self):
+        n = self.cycles
+        if len(self.periods) > self.maxCycles:
+            self.done = True
+            self.failed = True
+            return
+        if len(self.periods) < n:
+            return
+        periods = self.periods[-n:]
+        swings = self.swings[-n:]
+        period = sum(periods) / n
+        swing = sum(swings) / n
+        if max(periods) - min(periods) > self.tolerance * period:
+            return
+        if max(swings) - min(swings) > self.tolerance * swing:
+            return
+        a = swing / 2
+        if a <= self.band:
+            # the band alone explains the swing, nothing to measure
+            self.done = True
+            self.failed = True
+            return
+        d = (self.high - self.low) / 2
+        self.ku = 4 * d / (3.14159265 * (a * a - self.band * self.band) ** 0.5)
+        self.tu = period / 1000
+        self.done = True
+
+    def gains(self, periodS, rule="no overshoot"):
+        # P, I, D in TempController's units: demand per F, integrator step
+        # per control period, and demand per F of change per period
+        kp, ti, td = RULES[rule]
+        kp *= self.ku
+        ti *= self.tu
+        td *= self.tu
+        return kp, kp * periodS / ti, kp * td / periodS
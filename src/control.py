@@ -1,3 +1,10 @@
+from array import array
+from time import ticks_diff
+import json
+
+# gains saved by the autotuner, on the Pico's flash
+GAINS_FILE = "pid.json"
+
 class TempController:
     # the status flags
     __pidRangeMin__ = 20  # Start PID loop at set temp minus this. Loop is just on after this
@@ -6,56 +13,207 @@ class TempController:
     # PID Parameters
     P = .12
     I = 0.01
-    D = 0.4
+    # D acts on the mean PV change per control period. The old history got
+    # every reading twice, so it only ever saw a third of that: 0.4 as tuned
+    D = 0.4 / 3
+
+    # seconds per control period, turns a measured rate into change per period
+    periodS = 5.0
 
-    __iAccumulator__ = 0.0
     __iMax__ = 0.3 # maximum for iAccumulator
-    __dLast__ = [0.0, 0.0, 0.0, 0.0]
+    __dHistory__ = 4 # readings the D term averages across
+    __dFilterS__ = 10.0 # time constant of the derivative filter, timed calls without a rate
+    __maxGapS__ = 30.0 # longer than this between timed calls starts the derivative over
+
+    # with a plant model, the approach aims to peak below set value plus this
+    overshootF = 3.0
 
     # misc
     debug = True
 
-    def iLimit(self, num):
-        return max(min(num, self.__iMax__), self.__iMax__ * -1.0)
-    
+    def __init__(self, model=None, schedule=None):
+        # model: a Fopdt, for feedforward and predictive cutoff once ready()
+        # schedule: a GainSchedule, gains and band follow the set value
+        self.model = model
+        self.schedule = schedule
+        self.__scheduledFor__ = None # set value the gains were looked up for
+        # all the state lives here, preallocated, so controllers don't share
+        # it and getDemand() doesn't build anything
+        self.__dLast__ = array("f", [0.0] * self.__dHistory__)
+        self.reset()
+
+    def setGains(self, P, I, D):
+        # per instance, the class values stay as the defaults
+        self.P = P
+        self.I = I
+        self.D = D
+
+    def loadGains(self, path=GAINS_FILE):
+        # True if saved gains were found and used
+        try:
+            with open(path) as f:
+                gains = json.load(f)
+            self.setGains(gains["P"], gains["I"], gains["D"])
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def saveGains(self, path=GAINS_FILE):
+        with open(path, "w") as f:
+            json.dump({"P": self.P, "I": self.I, "D": self.D}, f)
+
+    def useSchedule(self, setValue):
+        # gains and band for setValue from the schedule
+        gains = self.schedule.lookup(setValue)
+        if gains is not None:
+            P, I, D, band = gains
+            self.setGains(P, I, D)
+            self.__pidRangeMin__ = band
+        self.__scheduledFor__ = setValue
+
+    def iLimit(self, num, feedforward=0.0):
+        # the integrator and the feedforward together stay within iMax: the
+        # feedforward is the holding duty the integrator would otherwise
+        # build up, and with another iMax free on top of it the integrator
+        # crept up whenever the output sat at zero
+        top = max(self.__iMax__ - feedforward, 0.0)
+        return max(min(num, top), self.__iMax__ * -1.0)
+
     def inRange(self, setValue, processValue):
         return processValue >= setValue - self.__pidRangeMin__ and processValue <= setValue + self.__pidRangeMax__
-    
+
     def reset(self):
         self.__iAccumulator__ = 0.0
-        self.__dLast__ = [0.0, 0.0, 0.0, 0.0]
-        
-    def getDemand(self, setValue, processValue):
-        # keep track of the temp differentials
-        self.__dLast__.append(processValue)
-        self.__dLast__.pop(0)
-        diffs = [self.__dLast__[i+1]-self.__dLast__[i] for i in range(len(self.__dLast__)-1)]
+        self.__dNext__ = 0 # oldest entry, where the next reading goes
+        self.__dFilled__ = False
+        self.__lastMs__ = None # stamp of the last timed call
+        self.__pvLast__ = 0.0
+        self.__dRate__ = 0.0 # filtered dPV/dt, F/s
+        self.__inPid__ = False # False while a band (or the approach) has the output
+        self.__lastDemand__ = 0.0
+
+    def track(self, processValue):
+        # keep track of the temp differentials: ring of the last few readings
+        ring = self.__dLast__
+        if not self.__dFilled__:
+            # start level rather than with a kick from zero
+            for i in range(len(ring)):
+                ring[i] = processValue
+            self.__dFilled__ = True
+        i = self.__dNext__
+        ring[i] = processValue
+        i += 1
+        self.__dNext__ = 0 if i == len(ring) else i
+
+    def meanChange(self):
+        # mean of the differences between neighbours, which telescopes to
+        # (newest - oldest) / (n - 1)
+        ring = self.__dLast__
+        i = self.__dNext__
+        newest = ring[i - 1] # i - 1 wraps to the end for i == 0
+        return (newest - ring[i]) / (len(ring) - 1)
+
+    def elapsed(self, processValue, ms):
+        # seconds since the last timed call, periodS for untimed ones. Also
+        # keeps the filtered derivative of the measurement up to date
+        if ms is None:
+            return self.periodS
+        last = self.__lastMs__
+        self.__lastMs__ = ms
+        dtS = self.periodS if last is None else ticks_diff(ms, last) / 1000
+        if last is None or dtS <= 0 or dtS > self.__maxGapS__:
+            # nothing to difference against
+            self.__pvLast__ = processValue
+            self.__dRate__ = 0.0
+            return self.periodS
+        raw = (processValue - self.__pvLast__) / dtS
+        self.__pvLast__ = processValue
+        self.__dRate__ += (raw - self.__dRate__) * dtS / (self.__dFilterS__ + dtS)
+        return dtS
+
+    def hold(self, demand):
+        # a band or the approach sets the output, PID picks up from it later
+        self.__inPid__ = False
+        self.__lastDemand__ = demand
+        return demand
+
+    def getDemand(self, setValue, processValue, rate=None, ms=None, scheduleFor=None):
+        # rate: dPV/dt in F/s from an estimator, if there is one
+        # ms: ticks_ms of the reading. With it the integrator and derivative
+        # go by the time since the last call instead of assuming periodS
+        # scheduleFor: set value to look the gains up for, when setValue is
+        # a target on its way there, so a ramp doesn't look up every step
+        self.track(processValue)
+        dtS = self.elapsed(processValue, ms)
+        if scheduleFor is None:
+            scheduleFor = setValue
+        if self.schedule is not None and scheduleFor != self.__scheduledFor__:
+            self.useSchedule(scheduleFor)
+
+        # With a model, PID adds to the duty that holds the set value. Until
+        # the temperature is nearly there, it doesn't run at all: full heat
+        # until the heat already in the element would carry the temperature
+        # to the set value, then just the holding duty, none if it's heading
+        # past the overshoot limit. Once PID has it, the approach only takes
+        # back over from below the band: it isn't for the dips of holding.
+        model = self.model
+        feedforward = 0.0
+        if model is not None and rate is not None and model.ready():
+            feedforward = model.holdDuty(setValue)
+            if processValue < setValue - (self.__pidRangeMin__ if self.__inPid__ else self.overshootF):
+                ahead = model.ahead(processValue, rate)
+                # full heat while it's heading for overshootF / 2 short or
+                # less, the holding duty heading for overshootF / 2 past, in
+                # proportion either side: a noisy rate flicking full heat
+                # back on near the end stacked heat up behind the lag
+                demand = feedforward + (1.0 - feedforward) * (setValue + self.overshootF / 2 - ahead) / self.overshootF
+                demand = min(max(demand, 0.0), 1.0)
+                if self.debug:
+                    print("[TempController] Approaching, heading for {}, demand {}".format(ahead, demand))
+                # the approach aims to arrive on the holding duty, so PID
+                # carries on from that rather than from the full heat
+                self.hold(feedforward)
+                return demand
 
         if processValue < setValue - self.__pidRangeMin__ :
             if self.debug:
                 print("[TempController] Process Value too low")
-            return 1.0
+            return self.hold(1.0)
         if processValue > setValue + self.__pidRangeMax__ :
             if self.debug:
                 print("[TempController] Process Value too high")
-            return 0.0
+            return self.hold(0.0)
 
         error = setValue - processValue
 
-        # compute the I factor, and accumulate
-        i = error * self.I
-        self.__iAccumulator__ = self.iLimit(i + self.__iAccumulator__)
-
-        # compute the D factor (giggle)
-        self.__dLast__.append(processValue)
-        self.__dLast__.pop(0)
-        diffs = [self.__dLast__[i+1]-self.__dLast__[i] for i in range(len(self.__dLast__)-1)]
-        d = self.D * (sum(diffs)/len(diffs)) * -1.0
+        # compute the D factor (giggle), on the measurement so set value
+        # changes don't kick it: the estimator's rate, the filtered
+        # derivative for timed calls, the ring otherwise
+        if rate is not None:
+            d = self.D * rate * self.periodS * -1.0
+        elif ms is not None:
+            d = self.D * self.__dRate__ * self.periodS * -1.0
+        else:
+            d = self.D * self.meanChange() * -1.0
 
         # P value
         p = error * self.P
 
-        demand =  p + self.__iAccumulator__ + d
+        # coming out of a band, start the integrator where P carries on
+        # from the band's demand instead of jumping. Not D: it's there to
+        # brake the arrival, and folding it in would cancel that
+        if not self.__inPid__:
+            self.__iAccumulator__ = self.iLimit(self.__lastDemand__ - p - feedforward, feedforward)
+            self.__inPid__ = True
+
+        # compute the I factor, and accumulate, but not while the output is
+        # pinned at a limit the error is pushing it further into
+        i = error * self.I * dtS / self.periodS
+        demand = p + self.__iAccumulator__ + d + feedforward
+        if not (demand >= 1.0 and i > 0 or demand <= 0.0 and i < 0):
+            self.__iAccumulator__ = self.iLimit(i + self.__iAccumulator__, feedforward)
+
+        demand =  p + self.__iAccumulator__ + d + feedforward
 
         if demand > 1.0:
             demand = 1.0
@@ -63,7 +221,7 @@ class TempController:
             demand = 0.0
 
         if self.debug:
-            print("[TempController] Demand is {}, P: {}, I: {}, D: {}".format(demand, p, self.__iAccumulator__, d))
+            print("[TempController] Demand is {}, P: {}, I: {}, D: {}, FF: {}".format(demand, p, self.__iAccumulator__, d, feedforward))
 
+        self.__lastDemand__ = demand
         return demand
-
@@ -1,5 +1,8 @@
 # Display driver for the 7-segment displays
-from machine import Pin
+from machine import Pin, Timer
+from time import ticks_us, ticks_diff
+from array import array
+import micropython
 
 MAX_DIGITS = 0x3 # number of digits per display
 
@@ -19,6 +22,20 @@ clamp = lambda n, minn, maxn: max(min(maxn, n), minn)
  """
 MAX_DIGITS = 0x3 # number of digits per display
 
+# Pin map. Segments are shared by both displays, the digit lines pick the digit
+# and ENABLE (ledDE) turns the common drivers on
+PIN_A = 21
+PIN_B = 5 # was 26, which is on the ADC bank
+PIN_C = 17
+PIN_D = 19
+PIN_E = 20
+PIN_F = 22
+PIN_G = 16
+PIN_P = 18
+SEGMENT_PINS = (PIN_A, PIN_B, PIN_C, PIN_D, PIN_E, PIN_F, PIN_G, PIN_P)
+DIGIT_PINS = (13, 14, 15)
+ENABLE_PIN = 12
+
 clamp = lambda n, minn, maxn: max(min(maxn, n), minn)
 def rjust(s: str, maxLen: int, pad: str):
     if len(s) >= maxLen:
@@ -26,143 +43,306 @@ def rjust(s: str, maxLen: int, pad: str):
     
     return pad * (maxLen - len(s)) + s
 
-characterLUT = {
-    " ": 0x0,
-    "0": 0x3f,
-    "1": 0x06,
-    "2": 0x5b,
-    "3": 0x4f,
-    "4": 0x66,
-    "5": 0x6d,
-    "6": 0x7d,
-    "7": 0x07,
-    "8": 0x7f,
-    "9": 0x6f,
-    "a": 0x77,
-    "b": 0x0,
-    "c": 0x0,
-    "d": 0x0,
-    "e": 0x0,
-    "f": 0x0,
-    "l": 0x30,
-    "o": 0b01011100,
-    "-": 0x40
-}
-
-# OMG, this is inefficient
+# 7-segment font indexed by ord(), shared by every Display. Characters that
+# can't be drawn are blank. Both cases map onto whichever glyph reads best
+FONT = bytes(0x20) + bytes((
+    #  spc     !     "     #     $     %     &     '     (     )     *     +     ,     -     .     /
+    0x00, 0x00, 0x22, 0x00, 0x00, 0x00, 0x00, 0x02, 0x39, 0x0f, 0x00, 0x00, 0x00, 0x40, 0x80, 0x52,
+    #    0     1     2     3     4     5     6     7     8     9     :     ;     <     =     >     ?
+    0x3f, 0x06, 0x5b, 0x4f, 0x66, 0x6d, 0x7d, 0x07, 0x7f, 0x6f, 0x00, 0x00, 0x00, 0x48, 0x00, 0x53,
+    #    @     A     B     C     D     E     F     G     H     I     J     K     L     M     N     O
+    0x00, 0x77, 0x7c, 0x39, 0x5e, 0x79, 0x71, 0x3d, 0x76, 0x30, 0x1e, 0x00, 0x38, 0x00, 0x54, 0x3f,
+    #    P     Q     R     S     T     U     V     W     X     Y     Z     [     \     ]     ^     _
+    0x73, 0x67, 0x50, 0x6d, 0x78, 0x3e, 0x00, 0x00, 0x00, 0x6e, 0x00, 0x39, 0x64, 0x0f, 0x23, 0x08,
+    #    `     a     b     c     d     e     f     g     h     i     j     k     l     m     n     o
+    0x20, 0x77, 0x7c, 0x58, 0x5e, 0x79, 0x71, 0x6f, 0x74, 0x10, 0x0e, 0x00, 0x30, 0x00, 0x54, 0x5c,
+    #    p     q     r     s     t     u     v     w     x     y     z     {     |     }     ~   del
+    0x73, 0x67, 0x50, 0x6d, 0x78, 0x1c, 0x00, 0x00, 0x00, 0x6e, 0x00, 0x00, 0x30, 0x00, 0x01, 0x00,
+))
+
+def glyph(char):
+    code = ord(char)
+    if code < len(FONT):
+        return FONT[code]
+    return 0x0
+
+# Slots in the scan, SV digits first then PV digits
+MAX_SLOTS = MAX_DIGITS * 2
+BLANK = MAX_SLOTS # frame index of the all-dark frame
+QUIET = MAX_SLOTS + 1 # dark as well, and calls the quiet handler (see setQuiet)
+
+# Brightness is how many of every MAX_BRIGHTNESS scans a display gets lit for.
+# More steps would dim by flickering
+MAX_BRIGHTNESS = 4
+
+# Inter-digit gaps are binned into GAP_BUCKETS buckets of 2**GAP_SHIFT us.
+# The last bucket takes everything longer
+GAP_SHIFT = 5
+GAP_BUCKETS = 128
+
+class ScanSnapshot:
+    ticks = 0   # nextDigit() calls counted
+    fps = 0     # full scans (every slot once) per second
+    maxGap = 0  # longest time between two nextDigit() calls, us
+    p99Gap = 0  # 99% of gaps were at most this long, us (bucket resolution)
+    blanks = 0  # ticks that showed the blank frame
+
+class ScanStats:
+    # Cheap refresh counters, fed by nextDigit(). Read them with snapshot(),
+    # which fills in the same ScanSnapshot every time
+    def __init__(self, blank):
+        self.blank = blank # the display's BLANK frame
+        self.gaps = array("I", [0] * GAP_BUCKETS)
+        self.result = ScanSnapshot()
+        self.reset()
+
+    def reset(self):
+        for i in range(GAP_BUCKETS):
+            self.gaps[i] = 0
+        self.ticks = 0
+        self.blanks = 0
+        self.maxGap = 0
+        self.started = ticks_us()
+        self.last = self.started
+
+    @micropython.native
+    def tick(self, frame):
+        now = ticks_us()
+        gap = ticks_diff(now, self.last)
+        self.last = now
+        if gap > self.maxGap:
+            self.maxGap = gap
+        bucket = gap >> GAP_SHIFT
+        if bucket >= GAP_BUCKETS:
+            bucket = GAP_BUCKETS - 1
+        self.gaps[bucket] += 1
+        self.ticks += 1
+        if frame is self.blank:
+            self.blanks += 1
+
+    def snapshot(self):
+        result = self.result
+        result.ticks = self.ticks
+        result.blanks = self.blanks
+        result.maxGap = self.maxGap
+        elapsedMs = ticks_diff(self.last, self.started) // 1000
+        result.fps = self.ticks * 1000 // MAX_SLOTS // elapsedMs if elapsedMs > 0 else 0
+
+        # first bucket that gets the running total to 99%
+        need = self.ticks - self.ticks // 100
+        seen = 0
+        bucket = 0
+        while bucket < GAP_BUCKETS - 1:
+            seen += self.gaps[bucket]
+            if seen >= need:
+                break
+            bucket += 1
+        result.p99Gap = (bucket + 1) << GAP_SHIFT
+        return result
+
 class Display:
-    __SV = "  "
-    __PV = "  "
-    blinkPeriod = 0x0A
-    __blinkCounter = 0x0
-    blinking = False
+    __SV = "   "
+    __PV = "   "
+    blinkPeriod = 0x0A # brightness cycles (MAX_BRIGHTNESS scans) on, then the same off
 
     DISPLAY_SV = False # Small display, CK
     DISPLAY_PV = True # Large Display, CA
-    __stateDisplay = DISPLAY_SV
-    __stateDigit = 0
+    slot = 0 # position in the schedule
+
+    # Set when the digits get scanned without anybody calling nextDigit(): by a
+    # hardware backend, or by a Timer when a scan rate is given
+    selfRefresh = False
 
-    def __init__(self):
+    def __init__(self, scanHz=0):
         # Setup the pins to not output anything
-        self.ledA = Pin(21, Pin.IN)
-        # self.ledB = Pin(26, Pin.IN)
-        self.ledC = Pin(17, Pin.IN)
-        self.ledD = Pin(19, Pin.IN)
-        self.ledE = Pin(20, Pin.IN)
-        self.ledF = Pin(22, Pin.IN)
-        self.ledG = Pin(16, Pin.IN)
-        self.ledP = Pin(18, Pin.IN)
-        # self.ledA = Pin(5, Pin.IN)
-        self.ledB = Pin(5, Pin.IN)
-        # self.ledC = Pin(5, Pin.IN)
-        # self.ledD = Pin(5, Pin.IN)
-        # self.ledE = Pin(5, Pin.IN)
-        # self.ledF = Pin(5, Pin.IN)
-        # self.ledG = Pin(5, Pin.IN)
-        # self.ledP = Pin(5, Pin.IN)
+        self.ledA = Pin(PIN_A, Pin.IN)
+        self.ledB = Pin(PIN_B, Pin.IN)
+        self.ledC = Pin(PIN_C, Pin.IN)
+        self.ledD = Pin(PIN_D, Pin.IN)
+        self.ledE = Pin(PIN_E, Pin.IN)
+        self.ledF = Pin(PIN_F, Pin.IN)
+        self.ledG = Pin(PIN_G, Pin.IN)
+        self.ledP = Pin(PIN_P, Pin.IN)
         self.ledSegments = [self.ledA, self.ledB, self.ledC, self.ledD, self.ledE, self.ledF, self.ledG, self.ledP]
 
         # Digits
-        self.ledD0 = Pin(13, Pin.OUT, value=1)
-        self.ledD1 = Pin(14, Pin.OUT, value=1)
-        self.ledD2 = Pin(15, Pin.OUT, value=1)
-        self.ledDE = Pin(12, Pin.OUT, value=0) # disables the common pins
+        self.ledD0 = Pin(DIGIT_PINS[0], Pin.OUT, value=1)
+        self.ledD1 = Pin(DIGIT_PINS[1], Pin.OUT, value=1)
+        self.ledD2 = Pin(DIGIT_PINS[2], Pin.OUT, value=1)
+        self.ledDE = Pin(ENABLE_PIN, Pin.OUT, value=0) # disables the common pins
         self.ledDigits = [self.ledD0, self.ledD1, self.ledD2]
+
+        # One precompiled frame per slot plus the BLANK frame, built by
+        # compileSlot(). Backends override compileSlot() and nextDigit() to
+        # change how frames are applied
+        self.frames = [None] * (MAX_SLOTS + 2)
+        self.frames[BLANK] = self.compileSlot(self.DISPLAY_SV, 0, 0)
+        self.frames[QUIET] = self.frames[BLANK]
+        self.quietHandler = None
+        self.quiet = False # whether the schedule has the quiet slot
+
+        # The schedule is the frame index to show on each tick. Brightness and
+        # blinking are baked into it, so the tick never looks at them
+        self.brightness = [MAX_BRIGHTNESS, MAX_BRIGHTNESS] # indexed by DISPLAY_SV/DISPLAY_PV
+        self.blinking = [False, False]
+        self.schedule = bytearray()
+        self.__compile(self.DISPLAY_SV)
+        self.__compile(self.DISPLAY_PV)
+        self.buildSchedule()
+
+        # Refresh instrumentation, off unless enableStats() is called
+        self.stats = None
+
+        # Timer driven refresh, see start()
+        self.scanHz = scanHz
+        self.timer = None
+        if scanHz:
+            self.selfRefresh = True
         print("Display initialized")
 
-    def __getDigit(self, char):
-        index = char[0]
-        if index in characterLUT:
-            return characterLUT[index]
-        
-        return 0x0
+    def compileSlot(self, display, digit, bitmap):
+        # Works out everything nextDigit() needs for one slot, so the 1ms tick
+        # only has to push values at the pins
+        if bitmap == 0:
+            return None
+
+        if display == self.DISPLAY_SV:
+            # Common Cathode display: selected digit low, lit segments driven high
+            selected, lit, unlit = 0, 1, 0
+        else:
+            # Common Anode display: selected digit high, lit segments driven low
+            selected, lit, unlit = 1, 0, 1
+
+        digits = tuple(selected if idx == digit else 1 - selected for idx in range(MAX_DIGITS))
+        modes = tuple(Pin.OUT if bitmap & (1 << counter) else Pin.IN for counter in range(len(self.ledSegments)))
+        values = tuple(lit if bitmap & (1 << counter) else unlit for counter in range(len(self.ledSegments)))
+        return (digits, modes, values)
+
+    def __compile(self, display):
+        text = self.__PV if display == self.DISPLAY_PV else self.__SV
+        base = MAX_DIGITS if display == self.DISPLAY_PV else 0
+        for digit in range(MAX_DIGITS):
+            bitmap = glyph(text[digit])
+            # blank digits share the BLANK frame, which is how ScanStats spots them
+            self.frames[base + digit] = self.compileSlot(display, digit, bitmap) if bitmap else self.frames[BLANK]
+        self.update()
+
+    def buildSchedule(self):
+        # Each scan of MAX_BRIGHTNESS gets every slot once. A display at level n
+        # is lit on n of those scans, spread out as evenly as they go. When a
+        # display blinks, blinkPeriod cycles are followed by as many with it dark
+        blinking = True in self.blinking
+        cycles = []
+        for phase in range(2 if blinking else 1):
+            cycle = bytearray()
+            for scan in range(MAX_BRIGHTNESS):
+                for slot in range(MAX_SLOTS):
+                    display = slot >= MAX_DIGITS
+                    level = self.brightness[display]
+                    lit = (scan + 1) * level // MAX_BRIGHTNESS > scan * level // MAX_BRIGHTNESS
+                    if phase == 1 and self.blinking[display]:
+                        lit = False
+                    cycle.append(slot if lit else BLANK)
+            if self.quiet:
+                cycle.append(QUIET)
+            cycles.append(cycle * (self.blinkPeriod if blinking else 1))
+        self.schedule = bytearray().join(cycles)
+        self.slot = 0
+        self.update()
+
+    def update(self):
+        # Called whenever the frames or the schedule change. Backends that keep
+        # their own copy of the schedule (PIO) refresh it here
+        pass
+
+    def setQuiet(self, handler):
+        # handler(display) gets called at the start of a dark slot, once per
+        # brightness cycle, with every LED line quiet. Meant for ADC reads.
+        # None takes the slot back out. The Timer may be scanning, so the
+        # handler goes in before the slot that calls it and out after
+        if handler is not None:
+            self.quietHandler = handler
+        self.quiet = handler is not None
+        self.buildSchedule()
+        self.quietHandler = handler
+
+    def setBrightness(self, display, level):
+        self.brightness[display] = clamp(level, 0, MAX_BRIGHTNESS)
+        self.buildSchedule()
+
+    def blink(self, display, on=True):
+        if self.blinking[display] == on:
+            return
+        self.blinking[display] = on
+        self.buildSchedule()
     
     def isStarting(self): 
-        return self.__stateDisplay == 0 and self.__stateDigit == 0
+        return self.slot == 0
     
+    # Runs from the Timer callback when scanHz is set, so it must not allocate:
+    # plain while loops over the precompiled tuples, no iterators
+    @micropython.native
     def nextDigit(self):
         # advance to the next digit
-        self.__stateDigit += int(1)
-        if self.__stateDigit >= MAX_DIGITS:
-            self.__stateDigit = 0
-            self.__stateDisplay = not self.__stateDisplay
-        
-        if self.__stateDisplay == self.DISPLAY_SV:
-            bitmap = self.__getDigit(self.__SV[self.__stateDigit])
-            # bug out if the digit is blank
-            if bitmap == 0:
-                self.ledDE.low()
-                return
-            
-            # Enable the display
-            self.ledDE.high()
-            # Common Cathode display
-            # set the digits
-            for idx, digit in enumerate(self.ledDigits):
-                if idx == self.__stateDigit:
-                    digit.low()
-                else:
-                    digit.high()
-                # if idx == self.__stateDigit:
-                #     print("Writing digit {}".format(idx))
-            
-            # Lookup the digit
-            # print("stateDigit - {}, SV - _{}_".format(self.__stateDigit, self.__SV))
-            counter = 0
-            # calcOut = []
-            for segment in self.ledSegments:
-                value = 1 if bitmap & (1 << counter) > 0 else 0
-                pinState = Pin.OUT if value == 1 else Pin.IN
-                # pinPull = None if value == 1 else Pin.PULL_DOWN
-                pinPull= None
-                # pinState = Pin.OUT
-                # calcOut.append(pinState)
-                segment.init(mode=pinState, value=value, pull=pinPull)
-                counter += 1
-        else:
-            bitmap = self.__getDigit(self.__PV[self.__stateDigit])
-            if bitmap == 0:
-                self.ledDE.low()
-                return
-            
-            # Enable the display
-            self.ledDE.high()
-
-            for idx, digit in enumerate(self.ledDigits):
-                if idx == self.__stateDigit:
-                    digit.high()
-                else:
-                    digit.low()
-            counter = 0
-            for segment in self.ledSegments:
-                value = 0 if bitmap & (1 << counter) > 0 else 1
-                pinState = Pin.OUT if value == 0 else Pin.IN
-                # pinPull = None if value == 1 else Pin.PULL_UP
-                pinPull= None
-                segment.init(mode=pinState, value=value, pull=pinPull)
-                counter += 1
-            
+        slot = self.slot + 1
+        if slot >= len(self.schedule):
+            slot = 0
+        self.slot = slot
+
+        index = self.schedule[slot]
+        frame = self.frames[index]
+        stats = self.stats
+        if stats is not None:
+            stats.tick(frame)
+
+        # bug out if the digit is blank
+        if frame is None:
+            self.ledDE.low()
+            handler = self.quietHandler
+            if index == QUIET and handler is not None:
+                handler(self)
+            return
+
+        # Enable the display
+        self.ledDE.high()
+        digits = self.ledDigits
+        values = frame[0]
+        i = 0
+        while i < MAX_DIGITS:
+            digits[i].value(values[i])
+            i += 1
+
+        segments = self.ledSegments
+        modes = frame[1]
+        values = frame[2]
+        i = 0
+        while i < 8:
+            segments[i].init(modes[i], value=values[i], pull=None)
+            i += 1
+
+    def enableStats(self, on=True):
+        # Count refresh timing in nextDigit(). See ScanStats
+        self.stats = ScanStats(self.frames[BLANK]) if on else None
+
+    @micropython.native
+    def onTimer(self, t):
+        self.nextDigit()
+
+    def start(self):
+        # Scan from a hardware timer at scanHz slots per second, so the refresh
+        # doesn't wait on whatever the event loop is busy with
+        if self.timer is not None or not self.scanHz:
+            return
+        self.timer = Timer(freq=self.scanHz, mode=Timer.PERIODIC, callback=self.onTimer)
+
+    def stop(self):
+        if self.timer is None:
+            return
+        self.timer.deinit()
+        self.timer = None
+
     def off(self):
+        self.stop()
         self.ledDE.low()
         for segment in self.ledSegments:
             segment.init(mode=Pin.IN, value=0)
@@ -171,16 +351,16 @@ class Display:
         # ensure the value has 3 or fewer characters, or is less than 999
         if type(value) == int:
             self.__SV = rjust(str(clamp(value, 0, 999)),3, " ")
-            return
-        
-        self.__SV =  rjust(str(value), 3, " ")
+        else:
+            self.__SV =  rjust(str(value), 3, " ")
+        self.__compile(self.DISPLAY_SV)
     
     def setPV(self, value : str | int):
         # ensure the value has 3 or fewer characters, or is less than 999
         if type(value) == int:
             self.__PV = rjust(str(clamp(value, 0, 999)),3, " ")
-            return
-        
-        self.__PV =  rjust(str(value), 3, " ")
+        else:
+            self.__PV =  rjust(str(value), 3, " ")
+        self.__compile(self.DISPLAY_PV)
 
     # def __mystring
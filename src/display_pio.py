@@ -0,0 +1,181 @@
+# Display backend where a PIO state machine scans the digits and DMA keeps its
+# FIFO fed from a frame buffer, so a refresh costs no CPU at all.
+#
+# The display lines (5 and 12..22) all fit in one OUT window starting at the
+# lowest pin. Only pins switched to the PIO function follow the state machine,
+# so the relay, knob and LED pins inside that window are left alone.
+from machine import Pin, mem32
+from micropython import const
+from array import array
+from uctypes import addressof
+import rp2
+from display import Display, MAX_SLOTS, MAX_BRIGHTNESS, SEGMENT_PINS, DIGIT_PINS, ENABLE_PIN, QUIET
+
+DISPLAY_PINS = SEGMENT_PINS + DIGIT_PINS + (ENABLE_PIN,)
+OUT_BASE = min(DISPLAY_PINS)
+OUT_COUNT = max(DISPLAY_PINS) - OUT_BASE + 1
+
+PIO_FREQ = const(1_000_000) # one cycle per microsecond keeps the timing maths easy
+PIO0_BASE = const(0x50200000)
+PIO1_BASE = const(0x50300000)
+PIO_TXF0 = const(0x010)
+PIO_SM0_PINCTRL = const(0x0dc)
+PIO_SM_STRIDE = const(0x18)
+DMA_BASE = const(0x50000000)
+DMA_CH_STRIDE = const(0x40)
+DMA_AL3_READ_ADDR_TRIG = const(0x03c)
+DREQ_PIO1_TX0 = const(8)
+DREQ_FORCE = const(0x3f)
+
+# Cycles spent outside the dwell loop for every slot, not counting the blank delay
+SLOT_OVERHEAD = const(10)
+
+# Third word of every slot, run with out(exec). QUIET slots raise the state
+# machine's IRQ, the rest do nothing in the same single cycle
+WORDS_PER_SLOT = const(3)
+PIO_IRQ_REL0 = const(0xc010) # irq nowait 0 rel
+PIO_NOP = const(0xa042) # mov y, y
+
+def outMask(pins):
+    mask = 0
+    for pin in pins:
+        mask |= 1 << (pin - OUT_BASE)
+    return mask
+
+ENABLE_MASK = outMask((ENABLE_PIN,))
+DIGIT_MASK = outMask(DIGIT_PINS)
+SEGMENT_MASK = outMask(SEGMENT_PINS)
+
+def makeProgram(count=OUT_COUNT, blank=8):
+    # The first word is the dwell count. After that every slot is three words:
+    # pin directions, pin values and an instruction to run. The commons are
+    # dropped (mov pins, null) before anything else moves and stay dark for
+    # blank + 3 cycles.
+    @rp2.asm_pio(out_shiftdir=rp2.PIO.SHIFT_RIGHT)
+    def scan():
+        pull()
+        mov(y, osr)
+        wrap_target()
+        pull()
+        mov(pins, null)         [blank]
+        out(pindirs, count)
+        pull()
+        out(pins, count)
+        pull()
+        out(exec, 16)
+        mov(x, y)
+        label("dwell")
+        jmp(x_dec, "dwell")
+        wrap()
+    return scan
+
+class PioDisplay(Display):
+    selfRefresh = True
+
+    def __init__(self, smId=0, slotUs=1000, blankUs=8):
+        if not 0 <= blankUs <= 31:
+            raise ValueError("blankUs has to fit in a PIO delay (0-31)")
+        # The whole schedule, WORDS_PER_SLOT words per entry as the state machine
+        # pulls them. Sized for the longest one (blinking, with a quiet slot) so
+        # DMA never has to move
+        self.buffer = array("I", [0] * ((MAX_SLOTS * MAX_BRIGHTNESS + 1) * 2 * self.blinkPeriod * WORDS_PER_SLOT))
+        self.sm = None
+        self.dma = None
+        super().__init__()
+        self.smId = smId
+        self.blankUs = blankUs
+        self.dwell = slotUs - blankUs - SLOT_OVERHEAD
+        # one program object for every start(): rp2 loads each new one into
+        # the PIO's 32 words again, a second copy doesn't fit in three
+        self.program = makeProgram(OUT_COUNT, blankUs)
+
+    def compileSlot(self, display, digit, bitmap):
+        if bitmap == 0:
+            # keep the slot so the timing stays even, just with the commons off
+            dirs = DIGIT_MASK | ENABLE_MASK
+            values = 0
+        else:
+            if display == self.DISPLAY_SV:
+                selected, lit = 0, 1
+            else:
+                selected, lit = 1, 0
+            litMask = 0
+            for counter, pin in enumerate(SEGMENT_PINS):
+                if bitmap & (1 << counter):
+                    litMask |= outMask((pin,))
+            digitMask = outMask((DIGIT_PINS[digit],))
+            values = ENABLE_MASK | (digitMask if selected else DIGIT_MASK & ~digitMask)
+            if lit:
+                values |= litMask
+            dirs = DIGIT_MASK | ENABLE_MASK | litMask
+        return (dirs, values)
+
+    def update(self):
+        # expand the schedule into the words DMA streams out
+        buffer = self.buffer
+        for i, index in enumerate(self.schedule):
+            dirs, values = self.frames[index]
+            buffer[i * WORDS_PER_SLOT] = dirs
+            buffer[i * WORDS_PER_SLOT + 1] = values
+            buffer[i * WORDS_PER_SLOT + 2] = PIO_IRQ_REL0 if index == QUIET else PIO_NOP
+        if self.dma is not None:
+            # picked up the next time the control channel retriggers
+            self.dma[0].count = len(self.schedule) * WORDS_PER_SLOT
+
+    def nextDigit(self):
+        # the state machine does this
+        pass
+
+    def onQuietIrq(self, sm):
+        if self.quietHandler is not None:
+            self.quietHandler(self)
+
+    def start(self):
+        if self.sm is not None:
+            return
+        pio = self.smId // 4
+        alt = Pin.ALT_PIO1 if pio else Pin.ALT_PIO0
+        for pin in DISPLAY_PINS:
+            Pin(pin, mode=Pin.ALT, alt=alt)
+
+        self.sm = rp2.StateMachine(self.smId, self.program, freq=PIO_FREQ, out_base=Pin(OUT_BASE))
+        # StateMachine only sizes the OUT window from out_init, and out_init would
+        # also claim pins 6..11. Set OUT_COUNT by hand instead
+        sm = self.smId % 4
+        pioBase = PIO1_BASE if pio else PIO0_BASE
+        pinctrl = pioBase + PIO_SM0_PINCTRL + sm * PIO_SM_STRIDE
+        mem32[pinctrl] = (mem32[pinctrl] & ~(0x3f << 20)) | (OUT_COUNT << 20)
+        # hard, so the handler runs inside the quiet slot rather than whenever
+        # the scheduler gets to it; handlers must be short and not allocate
+        # (QuietSampler.window() is bounded to a couple of hundred us)
+        self.sm.irq(self.onQuietIrq, hard=True)
+        self.sm.put(self.dwell)
+        self.sm.active(1)
+
+        # Two channels: data streams the buffer into the TX FIFO, then chains to
+        # control, which rewrites data's read address and so retriggers it
+        data = rp2.DMA()
+        control = rp2.DMA()
+        self.bufferAddress = array("I", [addressof(self.buffer)])
+        data.config(read=self.buffer, write=pioBase + PIO_TXF0 + sm * 4, count=len(self.schedule) * WORDS_PER_SLOT,
+                    ctrl=data.pack_ctrl(size=2, inc_write=False, treq_sel=DREQ_PIO1_TX0 * pio + sm, chain_to=control.channel))
+        control.config(read=self.bufferAddress, write=DMA_BASE + data.channel * DMA_CH_STRIDE + DMA_AL3_READ_ADDR_TRIG, count=1,
+                    ctrl=control.pack_ctrl(size=2, inc_read=False, inc_write=False, treq_sel=DREQ_FORCE))
+        self.dma = (data, control)
+        data.active(1)
+
+    def stop(self):
+        if self.sm is None:
+            return
+        for channel in self.dma:
+            channel.active(0)
+            channel.close()
+        self.dma = None
+        self.sm.active(0)
+        self.sm = None
+        # and out of the PIO's instruction memory, start() loads it again
+        rp2.PIO(self.smId // 4).remove_program(self.program)
+        # back to plain GPIO
+        for pin in self.ledDigits:
+            pin.init(mode=Pin.OUT, value=1)
+        self.ledDE.init(mode=Pin.OUT, value=0)
@@ -0,0 +1,81 @@
+# Display backend that drives the LED lines with a handful of writes to the
+# RP2040 SIO set/clear registers instead of one Pin call per line.
+from machine import mem32
+import micropython
+from micropython import const
+from display import Display, SEGMENT_PINS, DIGIT_PINS, ENABLE_PIN, QUIET
+
+SIO_BASE = const(0xd0000000)
+GPIO_OUT_SET = const(SIO_BASE + 0x014)
+GPIO_OUT_CLR = const(SIO_BASE + 0x018)
+GPIO_OE_SET = const(SIO_BASE + 0x024)
+GPIO_OE_CLR = const(SIO_BASE + 0x028)
+
+def pinMask(pins):
+    mask = 0
+    for pin in pins:
+        mask |= 1 << pin
+    return mask
+
+SEGMENT_MASK = pinMask(SEGMENT_PINS)
+DIGIT_MASK = pinMask(DIGIT_PINS)
+ENABLE_MASK = pinMask((ENABLE_PIN,))
+
+class SioDisplay(Display):
+    # Every frame is (outClr, oeClr, outSet, oeSet, enable) and is applied as
+    #   1. OUT_CLR: blank the commons and drop every line that ends up low
+    #   2. OE_CLR:  float the unlit segments
+    #   3. OUT_SET: raise every line that ends up high, except the enable
+    #   4. OE_SET:  drive the lit segments
+    #   5. OUT_SET: enable the commons (0 for a blank slot)
+    # so the display is dark while the lines move and never shows a mix of digits.
+    # The Pins made by Display.__init__ leave every line on the SIO function.
+
+    def compileSlot(self, display, digit, bitmap):
+        if bitmap == 0:
+            return (ENABLE_MASK, 0, 0, 0, 0)
+
+        if display == self.DISPLAY_SV:
+            # Common Cathode display: selected digit low, lit segments driven high
+            selected, lit = 0, 1
+        else:
+            # Common Anode display: selected digit high, lit segments driven low
+            selected, lit = 1, 0
+
+        litMask = 0
+        for counter, pin in enumerate(SEGMENT_PINS):
+            if bitmap & (1 << counter):
+                litMask |= 1 << pin
+
+        digitMask = 1 << DIGIT_PINS[digit]
+        high = digitMask if selected else DIGIT_MASK & ~digitMask
+        if lit:
+            high |= litMask
+        else:
+            # unlit CA segments float high, same as the Pin backend
+            high |= SEGMENT_MASK & ~litMask
+        low = (SEGMENT_MASK | DIGIT_MASK) & ~high
+
+        return (low | ENABLE_MASK, SEGMENT_MASK & ~litMask, high, litMask, ENABLE_MASK)
+
+    @micropython.native
+    def nextDigit(self):
+        slot = self.slot + 1
+        if slot >= len(self.schedule):
+            slot = 0
+        self.slot = slot
+
+        index = self.schedule[slot]
+        frame = self.frames[index]
+        stats = self.stats
+        if stats is not None:
+            stats.tick(frame)
+
+        mem32[GPIO_OUT_CLR] = frame[0]
+        mem32[GPIO_OE_CLR] = frame[1]
+        mem32[GPIO_OUT_SET] = frame[2]
+        mem32[GPIO_OE_SET] = frame[3]
+        mem32[GPIO_OUT_SET] = frame[4]
+        handler = self.quietHandler
+        if index == QUIET and handler is not None:
+            handler(self)
@@ -0,0 +1,72 @@
+# Temperature and rate-of-change estimate from the sensor readings. A two
+# state (temperature, rate) Kalman filter with a constant-rate model: the rate
+# is allowed to wander by processNoise (F/s)^2 per second, the readings are
+# trusted to readNoise F^2. Uses the real time between readings, so missed or
+# late readings just mean a longer prediction, and it only ever holds a
+# handful of floats.
+from time import ticks_diff
+
+class TempEstimator:
+    def __init__(self, readNoise=0.25, processNoise=0.005, startRateVar=4.0):
+        self.r = readNoise
+        self.q = processNoise
+        self.startRateVar = startRateVar
+        self.reset()
+
+    def reset(self):
+        self.temp = 0.0 # F
+        self.rate = 0.0 # F/s
+        self.stamp = 0 # ticks_ms of the last reading
+        self.ready = False
+        self.innovation = 0.0 # last reading minus what was predicted for it
+        # covariance of (temp, rate)
+        self.p00 = 0.0
+        self.p01 = 0.0
+        self.p11 = 0.0
+
+    def update(self, reading, stamp):
+        # reading in F, stamp in ticks_ms
+        if not self.ready:
+            self.temp = reading
+            self.rate = 0.0
+            self.stamp = stamp
+            self.p00 = self.r
+            self.p01 = 0.0
+            self.p11 = self.startRateVar
+            self.ready = True
+            return
+        dt = ticks_diff(stamp, self.stamp) / 1000
+        self.stamp = stamp
+        if dt <= 0:
+            # same instant: treat it as a second look at the same moment
+            dt = 0.0
+
+        # predict
+        q = self.q
+        p11 = self.p11
+        p01 = self.p01 + dt * p11 + q * dt * dt / 2
+        p00 = self.p00 + dt * (2 * self.p01 + dt * p11) + q * dt * dt * dt / 3
+        p11 += q * dt
+        predicted = self.temp + self.rate * dt
+
+        # correct
+        s = p00 + self.r
+        k0 = p00 / s
+        k1 = p01 / s
+        y = reading - predicted
+        self.innovation = y
+        self.temp = predicted + k0 * y
+        self.rate += k1 * y
+        self.p00 = (1 - k0) * p00
+        self.p01 = (1 - k0) * p01
+        self.p11 = p11 - k1 * p01
+
+    def predict(self, aheadMs):
+        # where the temperature is heading, aheadMs after the last reading
+        return self.temp + self.rate * aheadMs / 1000
+
+    def tempSd(self):
+        return self.p00 ** 0.5
+
+    def rateSd(self):
+        return self.p11 ** 0.5
@@ -0,0 +1,66 @@
+# Integer sampling pipeline: oversample -> reject spikes -> low-pass.
+# Everything is preallocated, so a reading costs no heap.
+from array import array
+
+# Results are ADC counts (read_u16 scale) with this many fraction bits
+COUNT_FRAC = 4
+
+class SamplePipeline:
+    def __init__(self, blocks=16, blockShift=4, trim=4, iirShift=0):
+        # Stage 1: blocks of 2**blockShift samples, summed and shifted
+        # Stage 2: sort the block means and drop trim from each end. Averaging
+        #          what's left is a trimmed mean, or the median once trim
+        #          leaves only one or two
+        # Stage 3: y += (x - y) >> iirShift, off when iirShift is 0
+        if not 0 <= trim < (blocks + 1) // 2:
+            raise ValueError("trim leaves no blocks")
+        self.blocks = array("i", [0] * blocks)
+        self.blockShift = blockShift
+        self.trim = trim
+        self.iirShift = iirShift
+        self.value = -1
+
+    def fromSampler(self, sampler):
+        # blocks from the newest samples of an AdcSampler ring
+        sampler.decimate(self.blocks, 1 << self.blockShift)
+        blocks = self.blocks
+        for i in range(len(blocks)):
+            blocks[i] <<= COUNT_FRAC
+        return self.finish()
+
+    def fromAdc(self, adc):
+        # blocks read straight from an ADC (or anything with read_u16)
+        blocks = self.blocks
+        shift = self.blockShift
+        for i in range(len(blocks)):
+            total = 0
+            for _ in range(1 << shift):
+                total += adc.read_u16()
+            blocks[i] = (total << COUNT_FRAC) >> shift
+        return self.finish()
+
+    def finish(self):
+        blocks = self.blocks
+        n = len(blocks)
+        # insertion sort in place, n is small
+        for i in range(1, n):
+            v = blocks[i]
+            j = i - 1
+            while j >= 0 and blocks[j] > v:
+                blocks[j + 1] = blocks[j]
+                j -= 1
+            blocks[j + 1] = v
+
+        total = 0
+        for i in range(self.trim, n - self.trim):
+            total += blocks[i]
+        x = total // (n - 2 * self.trim)
+
+        if self.iirShift == 0 or self.value < 0:
+            self.value = x
+        else:
+            self.value += (x - self.value) >> self.iirShift
+        return self.value
+
+    def reset(self):
+        self.value = -1
@@ -0,0 +1,151 @@
+# Integer PID: TempController's untimed loop without the model or a rate
+# (the ring derivative, per-call integration), in fixed point so a
+# call allocates nothing (every float result is a heap object on
+# MicroPython). Temperatures are tenths of a degree F, as Sensor.tenthsF;
+# gains and demand carry DEMAND_FRAC fraction bits, so a demand of ONE is
+# full power. The step itself is a viper function over one int32 array.
+#
+# Ranges: errors inside the PID band are a few hundred tenths and the gains
+# well under one per degree, so every product stays below 2**30 (a small int
+# off viper, no wrapping in it).
+import micropython
+from micropython import const
+from array import array
+from control import TempController, GAINS_FILE
+import json
+
+DEMAND_FRAC = const(24)
+ONE = const(1 << 24)
+
+# layout of the state array
+S_P = const(0) # demand per tenth F
+S_I = const(1) # integrator step per tenth F of error
+S_D = const(2) # demand per tenth F of PV change across the history
+S_I_MAX = const(3)
+S_I_ACC = const(4)
+S_RANGE_MIN = const(5) # tenths F
+S_RANGE_MAX = const(6)
+S_NEXT = const(7) # oldest ring entry, where the next reading goes
+S_FILLED = const(8)
+S_IN_PID = const(9) # 0 while a band has the output
+S_LAST_DEMAND = const(10)
+S_HISTORY = const(11)
+S_RING = const(12)
+
+
+@micropython.viper
+def pidStep(s: ptr32, setValue: int, processValue: int) -> int:
+    n = s[S_HISTORY]
+    i = s[S_NEXT]
+    if s[S_FILLED] == 0:
+        # start level rather than with a kick from zero
+        j = 0
+        while j < n:
+            s[S_RING + j] = processValue
+            j += 1
+        s[S_FILLED] = 1
+    s[S_RING + i] = processValue
+    i += 1
+    if i == n:
+        i = 0
+    s[S_NEXT] = i
+
+    if processValue < setValue - s[S_RANGE_MIN]:
+        s[S_IN_PID] = 0
+        s[S_LAST_DEMAND] = ONE
+        return ONE
+    if processValue > setValue + s[S_RANGE_MAX]:
+        s[S_IN_PID] = 0
+        s[S_LAST_DEMAND] = 0
+        return 0
+
+    error = setValue - processValue
+    # on the measurement: newest minus oldest, the mean step folded into D
+    newest = i - 1
+    if newest < 0:
+        newest = n - 1
+    d = s[S_D] * (s[S_RING + newest] - s[S_RING + i])
+    p = error * s[S_P]
+    iMax = s[S_I_MAX]
+
+    # out of a band: P carries on from its demand
+    acc = s[S_I_ACC]
+    if s[S_IN_PID] == 0:
+        acc = s[S_LAST_DEMAND] - p
+        if acc > iMax:
+            acc = iMax
+        if acc < 0 - iMax:
+            acc = 0 - iMax
+        s[S_IN_PID] = 1
+    # conditional integration, then the clamp
+    step = error * s[S_I]
+    demand = p + acc - d
+    if not ((demand >= ONE and step > 0) or (demand <= 0 and step < 0)):
+        acc += step
+        if acc > iMax:
+            acc = iMax
+        if acc < 0 - iMax:
+            acc = 0 - iMax
+    s[S_I_ACC] = acc
+
+    demand = p + acc - d
+    if demand > ONE:
+        demand = ONE
+    if demand < 0:
+        demand = 0
+    s[S_LAST_DEMAND] = demand
+    return demand
+
+
+def toFixed(x):
+    return int(x * ONE + (0.5 if x >= 0 else -0.5))
+
+
+class FixedPid:
+    def __init__(self, P=TempController.P, I=TempController.I, D=TempController.D):
+        n = TempController.__dHistory__
+        self.state = array("i", [0] * (S_RING + n))
+        s = self.state
+        s[S_HISTORY] = n
+        s[S_I_MAX] = toFixed(TempController.__iMax__)
+        s[S_RANGE_MIN] = TempController.__pidRangeMin__ * 10
+        s[S_RANGE_MAX] = TempController.__pidRangeMax__ * 10
+        self.setGains(P, I, D)
+        self.reset()
+
+    def setGains(self, P, I, D):
+        # the float controller's units: per F, per F per period, per F of
+        # mean change per period
+        s = self.state
+        s[S_P] = toFixed(P / 10)
+        s[S_I] = toFixed(I / 10)
+        s[S_D] = toFixed(D / 10 / (s[S_HISTORY] - 1))
+
+    def gains(self):
+        s = self.state
+        return s[S_P] * 10 / ONE, s[S_I] * 10 / ONE, s[S_D] * 10 * (s[S_HISTORY] - 1) / ONE
+
+    def loadGains(self, path=GAINS_FILE):
+        try:
+            with open(path) as f:
+                gains = json.load(f)
+            self.setGains(gains["P"], gains["I"], gains["D"])
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def reset(self):
+        s = self.state
+        s[S_I_ACC] = 0
+        s[S_NEXT] = 0
+        s[S_FILLED] = 0
+        s[S_IN_PID] = 0
+        s[S_LAST_DEMAND] = 0
+
+    def demand(self, setTenths, processTenths):
+        # ints in, ONE is full power
+        return pidStep(self.state, setTenths, processTenths)
+
+    def getDemand(self, setValue, processValue):
+        # TempController's call, F in and a 0..1 duty out (the one float)
+        return pidStep(self.state, round(setValue * 10), round(processValue * 10)) / ONE
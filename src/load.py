@@ -0,0 +1,87 @@
+# Food going in: the oil falls far faster than it ever cools on its own
+# (a few tenths of a degree a second with the heater off). Two ways to see
+# it from the estimator: a CUSUM of its innovations (readings coming in
+# below what it predicted, summed less a slack per reading), which trips on
+# a steep fall within a second, before the filtered rate has caught up; and
+# the rate itself past dropRate for a few readings running, which catches
+# the slower ones. Rather than wait for the next control period and a PID
+# ramping its clamped integrator, recovery goes straight to full heat, until
+# the heat already in the element would carry the oil back up to the set
+# value; the controller takes over from there. Every event's recovery time (detection to back
+# within doneF of the set value) is kept.
+from array import array
+from time import ticks_diff
+
+IDLE = 0
+RECOVERING = 1 # full heat
+RETURNING = 2 # controller has it again, timing until back within doneF
+
+class LoadDetector:
+    def __init__(self, dropRate=0.5, confirm=5, slackF=0.3, limitF=5.0, armF=10.0, leadS=35.0, doneF=2.0, history=8):
+        self.dropRate = dropRate # F/s falling that counts as a load
+        self.confirm = confirm # readings in a row
+        self.slackF = slackF # innovation per reading the CUSUM lets go, about 0.6 sd
+        self.limitF = limitF # CUSUM that counts as a load
+        self.armF = armF # only within this of the set value
+        self.leadS = leadS # heat in the element, in seconds of the current rate
+        self.doneF = doneF
+        self.recoveries = array("i", [0] * history) # ms, newest at events - 1
+        self.events = 0
+        self.reset()
+
+    def reset(self):
+        self.state = IDLE
+        self.falling = 0
+        self.cusum = 0.0
+        self.detectedMs = 0
+        self.lowF = 0.0 # lowest temperature of the event in progress
+
+    def lastRecovery(self):
+        # ms of the newest recovery, -1 if none
+        if self.events == 0:
+            return -1
+        return self.recoveries[(self.events - 1) % len(self.recoveries)]
+
+    def update(self, estimator, setValue):
+        # after every reading the estimator takes; True while recovery wants
+        # full heat
+        temp = estimator.temp
+        rate = estimator.rate
+        ms = estimator.stamp
+        state = self.state
+        if rate < -self.dropRate:
+            self.falling += 1
+        else:
+            self.falling = 0
+        cusum = self.cusum - estimator.innovation - self.slackF
+        self.cusum = cusum if cusum > 0 else 0.0
+        seen = self.falling >= self.confirm or self.cusum > self.limitF
+        if state == IDLE:
+            # not while the estimator is still finding its feet either
+            if seen and abs(temp - setValue) < self.armF and estimator.rateSd() < self.dropRate / 2:
+                self.state = RECOVERING
+                self.detectedMs = ms
+                self.lowF = temp
+                return True
+            return False
+
+        if temp < self.lowF:
+            self.lowF = temp
+        if state == RECOVERING:
+            if rate > 0 and temp + rate * self.leadS >= setValue:
+                self.state = RETURNING
+                return False
+            return True
+
+        # RETURNING. Another load before it's back is the same event
+        if seen:
+            self.state = RECOVERING
+            return True
+        if temp >= setValue - self.doneF:
+            self.recoveries[self.events % len(self.recoveries)] = ticks_diff(ms, self.detectedMs)
+            self.events += 1
+            self.state = IDLE
+        return False
+
+    def recovering(self):
+        return self.state == RECOVERING
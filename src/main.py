@@ -1,14 +1,41 @@
 from machine import Pin, ADC, PWM
 from time import ticks_ms, sleep_ms
-import math 
 from display import Display
 from rotary_irq_rp2 import RotaryIRQ
 import uasyncio as asyncio
 from primitives import EButton
 from control import TempController
+from sampler import AdcSampler, QuietSampler
+from filters import SamplePipeline, COUNT_FRAC
+from sensor import Sensor
+from estimator import TempEstimator
+from protect import Protection, REASONS
+from relay import RelayScheduler
+from autotune import RelayAutotune
+from model import Fopdt, FopdtIdentifier
+from schedule import GainSchedule
+from load import LoadDetector
+from period import FixedPeriod, AdaptivePeriod
+from trajectory import Trajectory
+
+def makeDisplay(backend):
+    # only the chosen backend's module gets imported; anything else falls
+    # back to the plain Pin-driven Display
+    if backend == "pio":
+        from display_pio import PioDisplay
+        return PioDisplay()
+    if backend == "sio":
+        from display_sio import SioDisplay
+        return SioDisplay()
+    return Display()
+
 class fryerState:
     # ADC
     adc = ADC(Pin(28, mode=Pin.IN))
+    sampler = AdcSampler() # free-running capture of the same input
+    pipeline = SamplePipeline() # 16 blocks of 16 samples, trimmed mean of the middle 8
+    quiet = QuietSampler(adc) # reads only while the display and relay are quiet
+    quietSampling = True # quiet windows instead of the free-running sampler
     lowPower = Pin(23, mode=Pin.OUT, value=0)
 
     # Knob LEDs
@@ -38,11 +65,19 @@ class fryerState:
                 range_mode=RotaryIRQ.RANGE_BOUNDED)
     rotaryEvent = asyncio.Event()
 
-    # Display
-    display = Display()
+    # Display: "pin" (the default) is scanned by the ui() task through
+    # machine.Pin, "sio" the same through the SIO registers, "pio" refreshes
+    # itself from a PIO state machine fed by DMA
+    displayBackend = "pin"
+    display = makeDisplay(displayBackend)
 
     # config values
-    loopMs = 5000
+    loopMs = 5000 # control period while tuning, and the stock fixed one
+    relayMinMs = 500 # shortest relay on or off time
+    tuneMs = 250 # autotune reading interval
+    sensorMs = 50 # 20Hz PV, whatever the control period
+    editMs = 3000 # SV stops blinking this long after the last knob turn
+    ambientF = 70 # the kitchen: where cold oil starts, below what the probe reads
 
     def __init__(self):
         # some pin initializastion
@@ -56,12 +91,69 @@ class fryerState:
 
         self.relay.freq(1000)
         self.relay.duty_u16(0)
+        self.relayState = False
+
+        # PV at sensorMs, independent of the control period
+        self.estimator = TempEstimator()
+        self.sensor = Sensor(self.readCounts, self.sensorMs, self.estimator)
+
+        # gains from the last autotune, if there was one, and the plant model
+        # from the last preheat from cold. A gain schedule on flash takes
+        # over from the single set of gains
+        model = Fopdt()
+        model.load()
+        schedule = GainSchedule()
+        self.controller = TempController(model, schedule if schedule.load() else None)
+        self.controller.loadGains()
+        self.identifier = FopdtIdentifier(ambientF=self.ambientF)
+        self.tuning = False
+        # food going in: full heat straight away, between control periods
+        self.load = LoadDetector()
+        # the knob sets where to end up, the trajectory how to get there;
+        # target is what the controller is after right now, and what SV
+        # shows once the knob is left alone
+        self.trajectory = Trajectory()
+        self.target = float(self.setValueNew)
+
+        # relay windows run on their own, regulate() only sets the duty. The
+        # period policy picks each window's length; FixedPeriod(self.loopMs)
+        # for the old 5s everywhere
+        self.period = AdaptivePeriod(self.relayMinMs)
+        self.relayScheduler = RelayScheduler(self.relayOn, self.relayOff, self.loopMs, self.relayMinMs, self.period)
+
+        # cuts the relay from a timer, whatever the control loop is doing.
+        # It watches the scheduler's duty for full heat that never arrives
+        self.protection = Protection(self.adc if self.quietSampling else self.sampler, self.relayOff,
+                                     self.relayScheduler)
+
+    def readCounts(self):
+        if self.quietSampling:
+            # everything the quiet windows collected since last time
+            return self.quiet.take()
+        # ~5ms worth of samples, with the spikes trimmed off
+        return self.pipeline.fromSampler(self.sampler)
+
+    async def startSampling(self):
+        if self.quietSampling:
+            self.quiet.take()
+            self.display.setQuiet(self.quiet.window)
+        else:
+            self.sampler.start()
+            await asyncio.sleep_ms(self.sampler.fillMs())
 
     def relayOn(self):
+        if self.protection.tripped:
+            return
         self.relay.duty_u16(32768)
+        if not self.relayState:
+            self.relayState = True
+            self.quiet.relayEdge()
     
     def relayOff(self):
         self.relay.duty_u16(0)
+        if self.relayState:
+            self.relayState = False
+            self.quiet.relayEdge()
     
     def beepOn(self):
         self.beeper.duty_u16(32768)
@@ -81,10 +173,15 @@ class fryerState:
     
     def off(self):
         self.beepOff()
+        self.relayScheduler.setDuty(0)
         self.relayOff()
+        self.protection.stop()
+        self.sampler.stop()
+        self.display.setQuiet(None)
         self.display.off()
         self.display.setSV(int(self.knob.value())*5)
         self.display.setPV("lo")
+        self.display.blink(self.display.DISPLAY_SV, False)
         self.knobLedBlue.low()
         self.knobLedOrange.low()
 
@@ -95,24 +192,6 @@ def knobCallback():
 
 state.knob.add_listener(knobCallback)
 
-def samplesToTemp(v):
-    i = 0.000036    # Current source
-    # Tx = 25         # Reference temp
-    # Rtx = 250000.0  # Resistance at reference tempi9i9i9
-    CMax = 65535.0  # Max ADC Counts
-    # alpha = .044    # delta R per degree C
-    Vref = 2.5      # Reference Voltage
-    Taz = -273.15   # offset to absolute 0
-    # return 
-
-    # Calculated Steinhart-Hart model coefficients (https://www.thinksrs.com/downloads/programs/therm%20calc/ntccalibrator/ntccalculator.html)
-    A = 1.451371111e-3
-    B = 0.6977565024e-4
-    C = 6.210453074e-7
-    R = Vref * (v/CMax) / i # =VRef * (I2/65535) / Current
-    return 1/(A + B * math.log(R) + C * math.log(R) ** 3) + Taz
-
-
 ########################
 # Async Functions
 ########################
@@ -122,31 +201,76 @@ async def ui(s: fryerState):
         await asyncio.sleep_ms(1)
 
             
+async def faultHandler(s: fryerState):
+    # the relay is already off by the time this runs, this is the telling
+    await s.protection.tripFlag.wait()
+    reason = REASONS[s.protection.tripped]
+    s.relayOff()
+    print("[ERROR] {}. Turning off.".format(reason))
+    s.display.setPV("---")
+    s.display.setSV("---")
+    await s.alert()
+    await asyncio.sleep_ms(2000)
+    raise Exception(reason)
+
+async def pvHandler(s: fryerState):
+    # PV follows every reading the sensor task publishes
+    shown = None
+    while True:
+        await s.sensor.fresh.wait()
+        tempInF = s.sensor.tenthsF // 10
+        pv = " lo" if tempInF < 140 else tempInF
+        if pv != shown:
+            s.display.setPV(pv)
+            shown = pv
+
 async def regulate(s: fryerState):
-    controller = TempController()
+    controller = s.controller
+    controller.reset()
     alerted = False
+    # the first step runs on a reading from this session
+    while not s.sensor.valid():
+        await s.sensor.fresh.wait()
+    # a preheat from cold refits the plant model, only counts while at full
+    # power. Cold is the probe pinned at its floor, so it needs a real
+    # reading first: the estimator reads 0 until it has been fed
+    while not s.estimator.ready:
+        await s.sensor.fresh.wait()
+    identifier = s.identifier
+    identifier.start(s.estimator.temp, s.estimator.stamp)
+    dutyCycle = 1.0
+    shown = None
     while True:
-        oversample = 0
-        for counter in range(8):
-            oversample += s.adc.read_u16()/8
-        currentTemp = samplesToTemp(oversample)
-
-        # Check for out of bounds reading
-        if oversample < 500:
-            s.relayOff()
-            await s.alert()
-            print ("[ERROR] Reading is too low to use. Turning off.")
-            s.display.setPV("---")
-            s.display.setSV("---")
-            await asyncio.sleep_ms(2000)
-            raise Exception("Temp out of range")
-        tempInF = currentTemp * (9/5) + 32
-        print("PV: {}, SV: {}, Raw Reading: {}".format(tempInF, s.setValueNew, oversample))
-        if tempInF < 140:
-            s.display.setPV(" lo")
-        else:
-            s.display.setPV(int(tempInF))
-        dutyCycle = controller.getDemand(s.setValueNew, tempInF)
+        # newest reading, at most sensorMs old
+        oversample = s.sensor.counts >> COUNT_FRAC
+
+        tempInF = s.sensor.tenthsF / 10
+        s.target = s.trajectory.target(ticks_ms(), tempInF)
+        print("PV: {}, SV: {}, Target: {:.1f}, Raw Reading: {}, Rate: {:.2f}F/s".format(
+            tempInF, s.setValueNew, s.target, oversample, s.estimator.rate))
+        if s.display.stats is not None:
+            scan = s.display.stats.snapshot()
+            print("Display: {} fps, max gap {}us, p99 gap {}us".format(scan.fps, scan.maxGap, scan.p99Gap))
+        print("Sensor: {}% CPU, {} missed".format(s.sensor.load(), s.sensor.missed))
+        if s.tuning or s.load.recovering():
+            # the autotuner or the load recovery has the relay
+            identifier.reset()
+            shown = None
+            await asyncio.sleep_ms(s.loopMs)
+            continue
+        if identifier.running():
+            if dutyCycle == 1.0:
+                identifier.update(s.estimator.temp, s.estimator.rate, ticks_ms())
+                model = identifier.result()
+                if model is not None:
+                    controller.model = model
+            else:
+                identifier.reset()
+                if controller.model.ready():
+                    controller.model.save()
+                    print("[model] gain {}F, tau {}s, dead time {}s".format(
+                        controller.model.gainF, controller.model.tauS, controller.model.deadS))
+        dutyCycle = controller.getDemand(s.target, tempInF, s.estimator.rate, s.sensor.stamp, s.setValueNew)
         if controller.inRange(s.setValueNew, tempInF):
             s.knobLedOrange.high()
             s.knobLedBlue.low()
@@ -157,23 +281,88 @@ async def regulate(s: fryerState):
         if not alerted and tempInF >= s.setValueNew:
             await s.alert()
             alerted = True
-        
-        onTime = int(dutyCycle * s.loopMs)
-        if onTime < 500:
-            onTime = 0
-        
-        if onTime > s.loopMs - 500:
-            onTime = s.loopMs
-        
-        if onTime > 0:
-            s.relayOn()
-            await asyncio.sleep_ms(onTime)
-        
-        if dutyCycle != 1.0:
-            s.relayOff()
-
-        await asyncio.sleep_ms(s.loopMs - onTime)
 
+        # SV follows the target on its way, unless the knob is being turned
+        if s.display.blinking[s.display.DISPLAY_SV]:
+            shown = None
+        else:
+            sv = int(s.target + 0.5)
+            if sv != shown:
+                s.display.setSV(sv)
+                shown = sv
+        
+        # the relay task picks it up at its next window, as long as this
+        s.relayScheduler.setDuty(dutyCycle)
+        await asyncio.sleep_ms(s.period.windowMs(dutyCycle))
+
+
+async def loadHandler(s: fryerState):
+    # every reading goes to the load detector, so a drop gets full heat
+    # within a reading or two rather than at the next control period
+    detector = s.load
+    detector.reset()
+    holdDuty = 0.0
+    events = detector.events
+    while True:
+        await s.sensor.fresh.wait()
+        if s.tuning:
+            detector.reset()
+            continue
+        was = detector.recovering()
+        if detector.update(s.estimator, s.target):
+            if not was:
+                model = s.controller.model
+                holdDuty = model.holdDuty(s.target) if model is not None and model.ready() else s.relayScheduler.duty
+                print("[load] drop at {}F, full heat".format(s.estimator.temp))
+                s.relayScheduler.setDuty(1.0, True)
+        elif was:
+            s.relayScheduler.setDuty(holdDuty, True)
+        if detector.events != events:
+            events = detector.events
+            print("[load] recovered in {}ms, low {}F".format(detector.lastRecovery(), detector.lowF))
+
+
+async def autotuneHandler(s: fryerState):
+    # double click: relay-feedback autotune at the current SV. Double click
+    # again to give up, a long press powers off as usual
+    while True:
+        await s.knobButton.double.wait()
+        s.knobButton.double.clear()
+        tuner = RelayAutotune(s.setValueNew)
+        s.tuning = True
+        # the autotuner only ever asks for 0 or 1, it needs the windows it
+        # was worked out with rather than the long saturated ones
+        s.relayScheduler.policy = FixedPeriod(s.loopMs)
+        s.display.setSV("tun")
+        s.display.blink(s.display.DISPLAY_SV)
+        print("[autotune] starting at {}F".format(s.setValueNew))
+        await s.beep()
+        while not tuner.done and not s.knobButton.double.is_set():
+            s.relayScheduler.setDuty(tuner.update(s.estimator.temp, ticks_ms()))
+            await asyncio.sleep_ms(s.tuneMs)
+        s.knobButton.double.clear()
+        s.tuning = False
+        s.relayScheduler.policy = s.period
+        s.display.blink(s.display.DISPLAY_SV, False)
+        s.display.setSV(s.setValueNew)
+        if tuner.done and not tuner.failed:
+            s.controller.setGains(*tuner.gains(s.controller.periodS))
+            schedule = s.controller.schedule
+            if schedule is None:
+                s.controller.saveGains()
+            else:
+                # a breakpoint at the set value it tuned at, which the knob
+                # may have left since, keeping the band it had
+                schedule.put(tuner.setValue, s.controller.P, s.controller.I, s.controller.D,
+                             schedule.lookup(tuner.setValue)[3])
+                schedule.save()
+                s.controller.useSchedule(s.setValueNew)
+            s.controller.reset()
+            print("[autotune] Ku {} Tu {}s: P {}, I {}, D {}".format(
+                tuner.ku, tuner.tu, s.controller.P, s.controller.I, s.controller.D))
+            await s.alert()
+        else:
+            print("[autotune] gave up, gains unchanged")
 
 async def knobHandler(s: fryerState):
     while True:
@@ -182,10 +371,24 @@ async def knobHandler(s: fryerState):
 
         if s.setValueNew != s.setValueOld:
             s.setValueOld = s.setValueNew
-            s.display.setSV(s.setValueNew)
+            # from wherever the target is now, a turn mid-ramp just bends it
+            s.trajectory.goTo(s.setValueNew, ticks_ms())
+            # SV keeps showing "tun" while the autotuner runs, it puts the
+            # new value up when it's done
+            if not s.tuning:
+                s.display.setSV(s.setValueNew)
+                s.display.blink(s.display.DISPLAY_SV)
 
         s.rotaryEvent.clear()
 
+        # SV blinks while it's being edited, until the knob is left alone
+        if s.display.blinking[s.display.DISPLAY_SV] and not s.tuning:
+            try:
+                await asyncio.wait_for_ms(s.rotaryEvent.wait(), s.editMs)
+            except asyncio.TimeoutError:
+                if not s.tuning:
+                    s.display.blink(s.display.DISPLAY_SV, False)
+
 ########################
 # /Async Functions
 ########################
@@ -219,17 +422,46 @@ async def main(s: fryerState):
 
         # system is on
         # insert coros into queue!
-        uiTask = asyncio.create_task(ui(state))
+        if s.display.selfRefresh:
+            s.display.start()
+            uiTask = None
+        else:
+            uiTask = asyncio.create_task(ui(state))
+        # the preheat is no ramp: the controller's own approach handles it
+        s.setValueNew = s.setValueOld = int(s.knob.value() * 5)
+        s.trajectory.hold(s.setValueNew)
+        s.target = float(s.setValueNew)
         knobTask = asyncio.create_task(knobHandler(state))
+        await s.startSampling()
+        s.sensor.reset()
+        s.estimator.reset()
+        s.protection.reset()
+        s.protection.start()
+        faultTask = asyncio.create_task(faultHandler(state))
+        sensorTask = asyncio.create_task(s.sensor.run())
+        pvTask = asyncio.create_task(pvHandler(state))
         regulateTask = asyncio.create_task(regulate(state))
+        relayTask = asyncio.create_task(s.relayScheduler.run())
+        s.knobButton.double.clear()
+        tuneTask = asyncio.create_task(autotuneHandler(state))
+        loadTask = asyncio.create_task(loadHandler(state))
 
         # Turn off when we get a long press
         await s.knobButton.long.wait()
         print("Powering Down...")
         s.off()
-        uiTask.cancel()
+        if uiTask is not None:
+            uiTask.cancel()
         knobTask.cancel()
         regulateTask.cancel()
+        relayTask.cancel()
+        tuneTask.cancel()
+        loadTask.cancel()
+        s.tuning = False
+        s.relayScheduler.policy = s.period
+        pvTask.cancel()
+        sensorTask.cancel()
+        faultTask.cancel()
         await s.beep()
         await asyncio.sleep_ms(2000)
         s.knobButton.long.clear()
@@ -244,6 +476,8 @@ async def main(s: fryerState):
 # display fw version
 state.display.setPV("---")
 state.display.setSV("002")
+if state.display.selfRefresh:
+    state.display.start()
 startTime = ticks_ms()
 state.beepOn()
 sleep_ms(100)
@@ -0,0 +1,122 @@
+# First order plus dead time model of the fryer, relay duty -> temperature:
+#   tauS * dT/dt = gainF * duty(t - deadS) - (T - ambientF)
+# The controller uses it two ways: feedforward (the duty that holds a
+# temperature) and prediction (where the temperature will be once the heat
+# already on its way through the element has arrived, deadS from now).
+import json
+import math
+from time import ticks_diff
+from thermistor import countsToTenthsF
+
+MODEL_FILE = "model.json"
+FLOOR_F = countsToTenthsF(65535) / 10 # colder than this reads as this
+
+class Fopdt:
+    def __init__(self, gainF=0.0, tauS=0.0, deadS=0.0, ambientF=70.0):
+        self.gainF = gainF # F above ambient at full power, eventually
+        self.tauS = tauS
+        self.deadS = deadS
+        self.ambientF = ambientF
+
+    def ready(self):
+        return self.gainF > 0 and self.tauS > 0
+
+    def holdDuty(self, tempF):
+        duty = (tempF - self.ambientF) / self.gainF
+        return min(max(duty, 0.0), 1.0)
+
+    def ahead(self, tempF, rateFs):
+        # temperature deadS from now if nothing changes
+        return tempF + rateFs * self.deadS
+
+    def load(self, path=MODEL_FILE):
+        try:
+            with open(path) as f:
+                m = json.load(f)
+            self.gainF, self.tauS, self.deadS, self.ambientF = m["gainF"], m["tauS"], m["deadS"], m["ambientF"]
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def save(self, path=MODEL_FILE):
+        with open(path, "w") as f:
+            json.dump({"gainF": self.gainF, "tauS": self.tauS, "deadS": self.deadS, "ambientF": self.ambientF}, f)
+
+
+class FopdtIdentifier:
+    # Fits the model to a full power preheat from cold, from the estimator's
+    # temperature and rate. Gain and time constant from a straight line
+    # through rate against temperature once the lags have settled,
+    # rate = (gainF + ambientF - T) / tauS, then dead time from how far
+    # behind the model's step response the latest reading is. Running sums
+    # only.
+    # Cold oil is below what the probe can read: the ADC pins at full scale
+    # and the reading sits at floorF. So a preheat from cold is one that
+    # starts pinned, the oil is taken to start at ambientF, a setting, and
+    # the fit only looks at readings once they have come off the floor.
+    def __init__(self, settleF=30.0, minSpanF=100.0, ambientF=70.0, floorF=FLOOR_F, marginF=1.0):
+        self.settleF = settleF # rise past the first real reading before the line fit starts
+        self.minSpanF = minSpanF # temperature span the line fit needs
+        self.ambientF = ambientF
+        self.floorF = floorF
+        self.marginF = marginF # this close to the floor still counts as pinned
+        self.reset()
+
+    def reset(self):
+        self.startMs = -1
+        self.firstF = None # first reading off the floor
+        self.lastMs = 0
+        self.lastF = 0.0
+        self.n = 0
+        self.sT = self.sR = self.sTT = self.sTR = 0.0
+        self.loF = 1e9
+        self.hiF = -1e9
+
+    def pinned(self, tempF):
+        return tempF < self.floorF + self.marginF
+
+    def start(self, tempF, ms):
+        # the heater goes fully on at ms, with the probe reading tempF
+        self.reset()
+        if self.pinned(tempF):
+            self.startMs = ms
+
+    def running(self):
+        return self.startMs >= 0
+
+    def update(self, tempF, rateFs, ms):
+        # call with every reading while the heater is fully on
+        if self.startMs < 0 or self.pinned(tempF):
+            return
+        if self.firstF is None:
+            self.firstF = tempF
+        if tempF - self.firstF < self.settleF:
+            return
+        self.lastMs = ms
+        self.lastF = tempF
+        self.n += 1
+        self.sT += tempF
+        self.sR += rateFs
+        self.sTT += tempF * tempF
+        self.sTR += tempF * rateFs
+        self.loF = min(self.loF, tempF)
+        self.hiF = max(self.hiF, tempF)
+
+    def result(self):
+        # a Fopdt, or None if there isn't enough to go on
+        if self.startMs < 0 or self.n < 10 or self.hiF - self.loF < self.minSpanF:
+            return None
+        n = self.n
+        slope = (n * self.sTR - self.sT * self.sR) / (n * self.sTT - self.sT * self.sT)
+        if slope >= 0:
+            return None
+        tauS = -1 / slope
+        finalF = (self.sR - slope * self.sT) / n * tauS # where full power would level off
+        if finalF <= self.lastF:
+            return None
+        # T = ambientF + (finalF - ambientF) * (1 - exp(-(t - deadS) / tauS))
+        ambientF = self.ambientF
+        if finalF <= ambientF:
+            return None
+        deadS = ticks_diff(self.lastMs, self.startMs) / 1000 + tauS * math.log((finalF - self.lastF) / (finalF - ambientF))
+        return Fopdt(finalF - ambientF, tauS, max(deadS, 0.0), ambientF)
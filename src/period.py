@@ -0,0 +1,38 @@
+# Control period policies: how long the next relay window is, given the duty
+# it will run at. The relay scheduler asks at the start of every window and
+# regulate() sleeps the same time, so the controller runs once a window.
+# The controller's gains stay per TempController.periodS whatever the window:
+# the integral goes by the real time between calls and the derivative by the
+# rate, so a shorter window doesn't change how hard it pushes.
+
+class FixedPeriod:
+    # every window the same length, as the fryer always ran
+    def __init__(self, periodMs=5000):
+        self.periodMs = periodMs
+
+    def windowMs(self, duty):
+        return self.periodMs
+
+
+class AdaptivePeriod:
+    # Saturated (preheat, or far below a lowered set value) nothing switches
+    # and there's nothing to gain from running the controller often, so the
+    # window is long. In between, it's the shortest that still fits the duty
+    # without the relay scheduler snapping it to 0 or 1: both on and off times
+    # at least minMs. Near the set value that's short windows, so a smaller
+    # swing per window and the controller seeing the oil more often; at a
+    # trickle of duty, a longer window that can still carry it at all.
+    def __init__(self, minMs=500, shortMs=2000, longMs=10000):
+        self.minMs = minMs
+        self.shortMs = shortMs
+        self.longMs = longMs
+
+    def windowMs(self, duty):
+        if duty <= 0.0 or duty >= 1.0:
+            return self.longMs
+        ms = int(self.minMs / min(duty, 1.0 - duty)) + 1
+        if ms < self.shortMs:
+            return self.shortMs
+        if ms > self.longMs:
+            return self.longMs
+        return ms
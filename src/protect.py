@@ -0,0 +1,152 @@
+# Heater cutoff that doesn't wait for the control loop. A hardware timer reads
+# the thermistor every periodMs and drops the relay as soon as a fault has
+# been seen on `confirm` ticks in a row:
+#   - over temperature
+#   - probe shorted (reading near zero)
+#   - probe open (reading pinned at full scale straight after a hot reading,
+#     cold oil pins it too so a pinned reading alone means nothing)
+#   - temperature moving faster than oil can
+#   - heater full on for stallMs without the reading rising stallF: an open
+#     probe on a cold fryer reads pinned like cold oil does, but oil under a
+#     full heater doesn't stay cold. A dead element trips it too
+# A trip latches: cutoff() is called and `tripped` holds the reason until
+# reset(). The callback does integer maths on preallocated state only.
+from machine import Timer
+from time import ticks_ms
+from array import array
+import uasyncio as asyncio
+from thermistor import countsToTenthsF
+
+OK = 0
+OVER_TEMP = 1
+SHORTED = 2
+OPEN = 3
+RATE = 4
+STALLED = 5
+REASONS = ("ok", "over temperature", "probe shorted", "probe open", "implausible rate",
+           "no rise at full heat")
+
+class Protection:
+    def __init__(self, adc, cutoff, heater=None, periodMs=20, confirm=2, maxF=410, maxRateF=15,
+                 rateWindowMs=500, shortCounts=500, openCounts=65400, hotF=150,
+                 stallMs=600000, stallF=20):
+        # adc: anything with read_u16(), an AdcSampler works while it runs.
+        # heater: anything with a duty attribute (the RelayScheduler), None
+        # leaves the stall check out
+        self.adc = adc
+        self.cutoff = cutoff
+        self.heater = heater
+        self.periodMs = periodMs
+        self.confirm = confirm
+        self.maxTenths = maxF * 10
+        self.shortCounts = shortCounts
+        self.openCounts = openCounts
+        self.hotTenths = hotF * 10
+        self.stallTicks = stallMs // periodMs
+        self.stallTenths = stallF * 10
+        # a pinned reading, for the stall check: as cold as it can read
+        self.floorTenths = countsToTenthsF(openCounts)
+        # temperatures one rate window apart may differ by this much
+        self.maxStep = maxRateF * rateWindowMs // 100
+        self.history = array("h", [0] * max(rateWindowMs // periodMs, 1))
+        self.reads = array("H", [0] * 8)
+        self.timer = None
+        self.tripFlag = asyncio.ThreadSafeFlag()
+        self.reset()
+
+    def reset(self):
+        self.tripped = OK
+        self.trippedAt = 0
+        self.pending = OK
+        self.seen = 0
+        self.filled = 0
+        self.next = 0
+        self.last = -1 # newest in-range reading, tenths of F
+        self.ticks = 0
+        self.heatTicks = 0 # at full duty since the reading last rose stallF
+        self.heatFrom = 0
+
+    def start(self):
+        if self.timer is None:
+            self.timer = Timer(mode=Timer.PERIODIC, period=self.periodMs, callback=self.onTimer)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def read(self):
+        # mean of the middle 4 of 8 reads, so a couple of reads that catch a
+        # segment switching can't trip anything on their own
+        adc = self.adc
+        reads = self.reads
+        for i in range(8):
+            v = adc.read_u16()
+            j = i - 1
+            while j >= 0 and reads[j] > v:
+                reads[j + 1] = reads[j]
+                j -= 1
+            reads[j + 1] = v
+        return (reads[2] + reads[3] + reads[4] + reads[5]) >> 2
+
+    def check(self, counts):
+        # fault code for this reading, and keeps the rate history
+        if counts < self.shortCounts:
+            return SHORTED
+        if counts >= self.openCounts:
+            return OPEN if self.last >= self.hotTenths else OK
+        tenths = countsToTenthsF(counts)
+        if tenths > self.maxTenths:
+            return OVER_TEMP
+        self.last = tenths
+        history = self.history
+        i = self.next
+        oldest = history[i]
+        history[i] = tenths
+        i += 1
+        self.next = 0 if i == len(history) else i
+        if self.filled < len(history):
+            self.filled += 1
+            return OK
+        step = tenths - oldest
+        if step > self.maxStep or -step > self.maxStep:
+            return RATE
+        return OK
+
+    def stalled(self, counts):
+        # True once the heater has been full on for stallTicks with the
+        # reading never stallTenths above where it was at the start
+        heater = self.heater
+        if heater is None or heater.duty < 1.0:
+            self.heatTicks = 0
+            return False
+        tenths = self.floorTenths if counts >= self.openCounts else self.last
+        if self.heatTicks == 0 or tenths - self.heatFrom >= self.stallTenths:
+            self.heatFrom = tenths
+            self.heatTicks = 1
+            return False
+        self.heatTicks += 1
+        return self.heatTicks >= self.stallTicks
+
+    def onTimer(self, timer):
+        self.ticks += 1
+        if self.tripped:
+            return
+        counts = self.read()
+        fault = self.check(counts)
+        if fault == OK and self.stalled(counts):
+            fault = STALLED
+        if fault != self.pending:
+            self.pending = fault
+            self.seen = 0
+        if fault == OK:
+            return
+        self.seen += 1
+        if self.seen >= self.confirm:
+            self.trip(fault)
+
+    def trip(self, reason):
+        self.cutoff()
+        self.tripped = reason
+        self.trippedAt = ticks_ms()
+        self.tripFlag.set()
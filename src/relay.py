@@ -0,0 +1,101 @@
+# Time-proportioning relay output. The relay runs in fixed windows: on for
+# duty * windowMs at the start of each, off for the rest. setDuty() can be
+# called at any time and takes effect at the next window boundary, so the
+# control loop never has to sleep through the relay timing; with now=True a
+# fresh window starts straight away instead, or as soon as the relay has been
+# in its current state for minMs. On or off times shorter than minMs are
+# snapped away to spare the relay contacts. With a policy (see
+# period.py) each window's length is chosen as it starts, from its duty.
+import uasyncio as asyncio
+from time import ticks_ms, ticks_diff, ticks_add
+
+class RelayScheduler:
+    def __init__(self, on, off, windowMs=5000, minMs=500, policy=None):
+        self.on = on
+        self.off = off
+        self.windowMs = windowMs # of the window in progress
+        self.policy = policy # None for windowMs every time
+        self.minMs = minMs
+        self.duty = 0.0
+        self.onMs = 0 # on time of the window in progress
+        self.windows = 0
+        self.maxLateMs = 0 # worst wakeup after a planned edge
+        self.isOn = False
+        self.offMs = ticks_ms() # when the relay last went off
+        self.onAt = self.offMs # and on
+        self.wake = asyncio.Event()
+
+    def setDuty(self, duty, now=False):
+        # 0..1, used from the next window on, or from now
+        self.duty = min(max(duty, 0.0), 1.0)
+        if now:
+            self.wake.set()
+
+    def plan(self, duty):
+        # on time for a window at this duty, with the short ends snapped
+        onMs = int(duty * self.windowMs)
+        if onMs < self.minMs:
+            return 0
+        if onMs > self.windowMs - self.minMs:
+            return self.windowMs
+        return onMs
+
+    async def until(self, deadline):
+        # True if setDuty(now=True) cut the wait short
+        wait = ticks_diff(deadline, ticks_ms())
+        if wait > 0:
+            try:
+                await asyncio.wait_for_ms(self.wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        if self.wake.is_set():
+            self.wake.clear()
+            return True
+        late = -ticks_diff(deadline, ticks_ms())
+        if late > self.maxLateMs:
+            self.maxLateMs = late
+        return False
+
+    async def restart(self):
+        # start of a window that begins now, or once the relay has been on or
+        # off for minMs if it only just switched: the new window may switch
+        # it straight back
+        rest = self.minMs - ticks_diff(ticks_ms(), self.onAt if self.isOn else self.offMs)
+        if rest > 0:
+            await asyncio.sleep_ms(rest)
+        return ticks_ms()
+
+    def switch(self, on):
+        if on:
+            self.on()
+            if not self.isOn:
+                self.onAt = ticks_ms()
+        else:
+            self.off()
+            if self.isOn:
+                self.offMs = ticks_ms()
+        self.isOn = on
+
+    async def run(self):
+        # edges are planned from the window start, not from when the last
+        # sleep ended, so late wakeups don't add up
+        start = ticks_ms()
+        try:
+            while True:
+                if self.policy is not None:
+                    self.windowMs = self.policy.windowMs(self.duty)
+                onMs = self.plan(self.duty)
+                self.onMs = onMs
+                self.windows += 1
+                if onMs > 0:
+                    self.switch(True)
+                    if await self.until(ticks_add(start, onMs)):
+                        start = await self.restart()
+                        continue
+                if onMs < self.windowMs:
+                    self.switch(False)
+                start = ticks_add(start, self.windowMs)
+                if await self.until(start):
+                    start = await self.restart()
+        finally:
+            self.switch(False)
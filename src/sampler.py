@@ -0,0 +1,198 @@
+# Free-running ADC capture. The ADC converts back to back into its FIFO and a
+# DMA channel copies every sample into a ring buffer, so oversampling costs no
+# CPU until somebody averages the ring.
+from machine import mem32, disable_irq, enable_irq
+from micropython import const
+from time import ticks_ms, ticks_us, ticks_diff
+from array import array
+from uctypes import addressof
+import rp2
+from filters import COUNT_FRAC
+
+ADC_BASE = const(0x4004c000)
+ADC_CS = const(ADC_BASE + 0x00)
+ADC_FCS = const(ADC_BASE + 0x08)
+ADC_FIFO = const(ADC_BASE + 0x0c)
+ADC_DIV = const(ADC_BASE + 0x10)
+ADC_CS_EN = const(1 << 0)
+ADC_CS_START_MANY = const(1 << 3)
+ADC_FCS_EN = const(1 << 0)
+ADC_FCS_DREQ_EN = const(1 << 3)
+ADC_FCS_THRESH_1 = const(1 << 24)
+ADC_CLOCK = const(48_000_000)
+DREQ_ADC = const(36)
+
+DMA_BASE = const(0x50000000)
+DMA_CH_STRIDE = const(0x40)
+DMA_WRITE_ADDR = const(0x004)
+DMA_AL2_WRITE_ADDR_TRIG = const(0x02c)
+
+# GPIO26..29 are ADC inputs 0..3, the thermistor is on 28
+THERMISTOR_INPUT = 2
+
+def toU16(v):
+    # v is a 12 bit reading already shifted up by 4. read_u16() also copies the
+    # top bits into the bottom ones so full scale comes out as 65535
+    return v + (v >> 12)
+
+class AdcSampler:
+    def __init__(self, adcInput=THERMISTOR_INPUT, ringSize=1024, rateHz=50_000):
+        # 12 bit samples, as the ADC puts them in the FIFO
+        self.ring = array("H", [0] * ringSize)
+        self.ringAddress = array("I", [addressof(self.ring)])
+        self.adcInput = adcInput
+        self.rateHz = rateHz
+        self.dma = None
+
+    def start(self):
+        if self.dma is not None:
+            return
+        mem32[ADC_CS] = ADC_CS_EN | (self.adcInput << 12)
+        mem32[ADC_DIV] = (ADC_CLOCK // self.rateHz - 1) << 8
+        mem32[ADC_FCS] = ADC_FCS_EN | ADC_FCS_DREQ_EN | ADC_FCS_THRESH_1
+
+        # data copies FIFO -> ring and chains to control, which points data
+        # back at the start of the ring and so retriggers it
+        data = rp2.DMA()
+        control = rp2.DMA()
+        data.config(read=ADC_FIFO, write=self.ring, count=len(self.ring),
+                    ctrl=data.pack_ctrl(size=1, inc_read=False, treq_sel=DREQ_ADC, chain_to=control.channel))
+        control.config(read=self.ringAddress, write=DMA_BASE + data.channel * DMA_CH_STRIDE + DMA_AL2_WRITE_ADDR_TRIG, count=1,
+                    ctrl=control.pack_ctrl(size=2, inc_read=False, inc_write=False))
+        self.dma = (data, control)
+        data.active(1)
+        mem32[ADC_CS] = ADC_CS_EN | (self.adcInput << 12) | ADC_CS_START_MANY
+
+    def stop(self):
+        if self.dma is None:
+            return
+        # plain one-shot ADC reads work again after this
+        mem32[ADC_CS] = ADC_CS_EN | (self.adcInput << 12)
+        for channel in self.dma:
+            channel.active(0)
+            channel.close()
+        self.dma = None
+        mem32[ADC_FCS] = 0
+
+    def fillMs(self):
+        # how long after start() before the whole ring holds real samples
+        return len(self.ring) * 1000 // self.rateHz + 1
+
+    def position(self):
+        # index the DMA will write next
+        writeAddr = mem32[DMA_BASE + self.dma[0].channel * DMA_CH_STRIDE + DMA_WRITE_ADDR]
+        index = (writeAddr - self.ringAddress[0]) >> 1
+        if index >= len(self.ring):
+            index = 0
+        return index
+
+    def read_u16(self):
+        # newest sample, so a running sampler can stand in for the ADC
+        i = self.position() - 1
+        return toU16(self.ring[i] << 4)
+
+    def sum(self, n, end=-1):
+        # Sum of the n samples before end (default: the newest n)
+        ring = self.ring
+        size = len(ring)
+        i = self.position() if end < 0 else end
+        total = 0
+        for _ in range(n):
+            i -= 1
+            if i < 0:
+                i = size - 1
+            total += ring[i]
+        return total
+
+    def average(self, n):
+        # Mean of the newest n samples, scaled to read_u16() counts
+        return toU16((self.sum(n) << 4) // n)
+
+    def decimate(self, out, factor):
+        # Fills out with block means of factor samples each, oldest first,
+        # ending at the newest sample. Scaled like average()
+        size = len(self.ring)
+        end = self.position()
+        for i in range(len(out) - 1, -1, -1):
+            out[i] = toU16((self.sum(factor, end) << 4) // factor)
+            end -= factor
+            if end < 0:
+                end += size
+        return out
+
+class QuietSampler:
+    # One-shot ADC reads taken only while nothing is switching: inside the
+    # display's quiet slots (Display.setQuiet(sampler.window)) and not within
+    # holdoffMs of a relay edge. window() can run in a hard IRQ, so it's kept
+    # short and allocation-free: after settleUs it takes at most `reads` reads,
+    # stopping at windowUs whatever, and stores their sum (well inside a small
+    # int) in a preallocated ring. take() adds up the windows since last time
+    # outside the IRQ and hands back their mean. Not for use while an
+    # AdcSampler is free-running on the same ADC
+    def __init__(self, adc, settleUs=50, reads=16, windowUs=200, holdoffMs=100, history=32):
+        self.adc = adc
+        self.settleUs = settleUs
+        self.reads = reads
+        self.windowUs = windowUs
+        self.holdoffMs = holdoffMs
+        self.lastEdge = ticks_ms() - holdoffMs
+        self.windows = 0
+        self.skipped = 0
+        # sum and number of samples each of the last `history` windows gave,
+        # 0 for skipped ones, newest at index newest; pending of them, up to
+        # history, haven't been taken yet
+        self.sums = array("I", [0] * history)
+        self.perWindow = array("H", [0] * history)
+        self.newest = 0
+        self.pending = 0
+
+    def relayEdge(self):
+        self.lastEdge = ticks_ms()
+
+    def window(self, display=None):
+        # Runs from the display refresh (hard IRQ or task): small ints and
+        # array stores only
+        start = ticks_us()
+        n = 0
+        total = 0
+        if ticks_diff(ticks_ms(), self.lastEdge) < self.holdoffMs:
+            self.skipped += 1
+        else:
+            while ticks_diff(ticks_us(), start) < self.settleUs:
+                pass
+            adc = self.adc
+            reads = self.reads
+            while n < reads and ticks_diff(ticks_us(), start) < self.windowUs:
+                total += adc.read_u16()
+                n += 1
+        self.windows += 1
+        size = len(self.perWindow)
+        newest = self.newest + 1
+        if newest >= size:
+            newest = 0
+        self.sums[newest] = total
+        self.perWindow[newest] = n
+        self.newest = newest
+        if self.pending < size:
+            self.pending += 1
+
+    def take(self):
+        # Mean counts since the last take(), with COUNT_FRAC fraction bits.
+        # -1 when no window got any samples
+        irq = disable_irq()
+        i, windows = self.newest, self.pending
+        self.pending = 0
+        enable_irq(irq)
+        sums = self.sums
+        perWindow = self.perWindow
+        total = 0
+        count = 0
+        for _ in range(windows):
+            total += sums[i]
+            count += perWindow[i]
+            i -= 1
+            if i < 0:
+                i = len(sums) - 1
+        if count == 0:
+            return -1
+        return (total << COUNT_FRAC) // count
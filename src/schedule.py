@@ -0,0 +1,70 @@
+# Gain scheduling: PID gains and band by set value. Losses grow with
+# temperature, so gains that suit 350F are wrong at 150F. The table is a
+# handful of (setpoint, P, I, D, band) breakpoints, sorted into arrays, and
+# lookup() interpolates between the two either side of a set value (the end
+# rows hold beyond them). The controller only looks up when the set value
+# changes, not every step.
+from array import array
+import json
+
+# on the Pico's flash: {"rows": [[setpoint, P, I, D, band], ...]}
+SCHEDULE_FILE = "schedule.json"
+
+class GainSchedule:
+    def __init__(self, rows=()):
+        self.setRows(rows)
+
+    def setRows(self, rows):
+        rows = sorted(rows)
+        self.setpoints = array("f", [r[0] for r in rows])
+        self.P = array("f", [r[1] for r in rows])
+        self.I = array("f", [r[2] for r in rows])
+        self.D = array("f", [r[3] for r in rows])
+        self.band = array("f", [r[4] for r in rows])
+
+    def rows(self):
+        return [(self.setpoints[i], self.P[i], self.I[i], self.D[i], self.band[i]) for i in range(len(self.setpoints))]
+
+    def put(self, setValue, P, I, D, band):
+        # add a breakpoint, or replace the one at that set value
+        rows = [r for r in self.rows() if r[0] != setValue]
+        rows.append((setValue, P, I, D, band))
+        self.setRows(rows)
+
+    def lookup(self, setValue):
+        # (P, I, D, band) at setValue, None for an empty table
+        sp = self.setpoints
+        n = len(sp)
+        if n == 0:
+            return None
+        if setValue <= sp[0]:
+            i, t = 0, 0.0
+        elif setValue >= sp[n - 1]:
+            i, t = n - 1, 0.0
+        else:
+            i = 0
+            while sp[i + 1] < setValue:
+                i += 1
+            t = (setValue - sp[i]) / (sp[i + 1] - sp[i])
+        j = i + 1 if t else i
+        return (self.P[i] + (self.P[j] - self.P[i]) * t,
+                self.I[i] + (self.I[j] - self.I[i]) * t,
+                self.D[i] + (self.D[j] - self.D[i]) * t,
+                self.band[i] + (self.band[j] - self.band[i]) * t)
+
+    def load(self, path=SCHEDULE_FILE):
+        # True if a table was found and used
+        try:
+            with open(path) as f:
+                rows = json.load(f)["rows"]
+            for r in rows:
+                if len(r) != 5:
+                    raise ValueError("schedule row needs setpoint, P, I, D, band")
+            self.setRows(rows)
+            return len(rows) > 0
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+
+    def save(self, path=SCHEDULE_FILE):
+        with open(path, "w") as f:
+            json.dump({"rows": [list(r) for r in self.rows()]}, f)
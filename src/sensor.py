@@ -0,0 +1,82 @@
+# Temperature sensing on its own schedule. The sensor task reads and filters
+# every periodMs and keeps the newest reading in a latest-value slot, so the
+# control loop, the display and the fault checks never have to wait for each
+# other. Readers just look at the slot; anyone who wants every reading awaits
+# sensor.fresh.
+import uasyncio as asyncio
+from time import ticks_ms, ticks_us, ticks_diff, ticks_add
+from thermistor import countsToTenthsF
+from filters import COUNT_FRAC
+
+class Sensor:
+    def __init__(self, read, periodMs=50, estimator=None):
+        # read() returns counts with COUNT_FRAC fraction bits, or -1 when it
+        # has nothing new (e.g. no quiet window since the last call).
+        # estimator, if given, is fed every reading (see estimator.py)
+        self.read = read
+        self.estimator = estimator
+        self.periodMs = periodMs
+        self.seq = 0
+        self.fresh = asyncio.Event()
+        self.reset()
+        # bookkeeping
+        self.missed = 0
+        self.overruns = 0
+        self.busyUs = 0
+        self.since = ticks_us()
+
+    def reset(self):
+        # empty the slot for a new session, so nothing read before a power
+        # down passes for a reading. The slot is only ever replaced as a
+        # whole, between awaits
+        self.counts = -1
+        self.tenthsF = 0
+        self.stamp = ticks_ms()
+        self.fresh.clear()
+
+    def valid(self):
+        return self.counts >= 0
+
+    def age(self):
+        # ms since the reading in the slot was taken
+        return ticks_diff(ticks_ms(), self.stamp)
+
+    def load(self):
+        # share of the CPU the sensor task used since the last call, in %
+        now = ticks_us()
+        elapsed = ticks_diff(now, self.since)
+        share = 100 * self.busyUs / elapsed if elapsed > 0 else 0
+        self.busyUs = 0
+        self.since = now
+        return share
+
+    def poll(self):
+        start = ticks_us()
+        counts = self.read()
+        if counts < 0:
+            self.missed += 1
+        else:
+            self.counts = counts
+            self.tenthsF = countsToTenthsF(counts >> COUNT_FRAC)
+            self.stamp = ticks_ms()
+            self.seq += 1
+            if self.estimator is not None:
+                self.estimator.update(self.tenthsF / 10, self.stamp)
+            self.fresh.set()
+            self.fresh.clear()
+        self.busyUs += ticks_diff(ticks_us(), start)
+
+    async def run(self):
+        due = ticks_ms()
+        while True:
+            self.poll()
+            # fixed rate, not fixed gap: the read time doesn't stretch the period
+            due = ticks_add(due, self.periodMs)
+            wait = ticks_diff(due, ticks_ms())
+            if wait < 0:
+                # overran a whole period, start again from now rather than
+                # firing back to back to catch up
+                self.overruns += 1
+                due = ticks_ms()
+                wait = 0
+            await asyncio.sleep_ms(wait)
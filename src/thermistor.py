@@ -0,0 +1,55 @@
+# Thermistor maths: ADC counts -> temperature
+import math
+from array import array
+
+I_SOURCE = 0.000036 # Current source
+# Tx = 25         # Reference temp
+# Rtx = 250000.0  # Resistance at reference temp
+C_MAX = 65535.0     # Max ADC Counts
+# alpha = .044    # delta R per degree C
+V_REF = 2.5         # Reference Voltage
+T_AZ = -273.15      # offset to absolute 0
+
+# Calculated Steinhart-Hart model coefficients (https://www.thinksrs.com/downloads/programs/therm%20calc/ntccalibrator/ntccalculator.html)
+SH_A = 1.451371111e-3
+SH_B = 0.6977565024e-4
+SH_C = 6.210453074e-7
+
+def samplesToTemp(v):
+    # Closed form, in C. Floats all the way, so keep it off the hot path
+    R = V_REF * (v/C_MAX) / I_SOURCE # =VRef * (I2/65535) / Current
+    return 1/(SH_A + SH_B * math.log(R) + SH_C * math.log(R) ** 3) + T_AZ
+
+def cToF(c):
+    return c * (9/5) + 32
+
+# Lookup table: temperature in tenths of a degree F at every 2**LUT_SHIFT ADC
+# counts, with one extra entry so 65535 still has a right-hand neighbour.
+# 512 steps keeps the interpolation within 0.15F over 140-375F
+LUT_SHIFT = 7
+TEMP_LUT = None
+
+# host/calibrate.py writes calibration.py for a fitted probe: coefficients,
+# current source and a finished table, which also saves building one at boot
+try:
+    from calibration import I_SOURCE, V_REF, SH_A, SH_B, SH_C, LUT_SHIFT, TEMP_LUT
+except ImportError:
+    pass
+
+LUT_MASK = (1 << LUT_SHIFT) - 1
+
+def buildTable(toTemp=samplesToTemp):
+    # count 0 would be log(0), use count 1 instead
+    table = array("h", [0] * ((65536 >> LUT_SHIFT) + 1))
+    for i in range(len(table)):
+        table[i] = round(cToF(toTemp(max(i << LUT_SHIFT, 1))) * 10)
+    return table
+
+if TEMP_LUT is None:
+    TEMP_LUT = buildTable()
+
+def countsToTenthsF(counts):
+    # Integer only: pick the two breakpoints around counts and interpolate
+    index = counts >> LUT_SHIFT
+    lo = TEMP_LUT[index]
+    return lo + ((TEMP_LUT[index + 1] - lo) * (counts & LUT_MASK) >> LUT_SHIFT)
@@ -0,0 +1,123 @@
+# Set value trajectories: what the controller regulates to on the way to the
+# set value on the knob. Going up, that's the new value straight away: full
+# heat sets the pace, the controller brings a step in without overshooting
+# to speak of, and a ramp only held the oil back (more overshoot and slower
+# to settle, in host/sim_trajectory.py). Going down, the heater can only stop
+# and the oil sets the pace (see landF). goTo() starts from wherever the
+# target is now, so turning the knob mid-ramp just bends it; profile() lays
+# out several legs, e.g. hold 325 then 350. Either way the legs are worked
+# out once, into preallocated arrays, and target() is a cursor into them: a
+# few compares and one interpolation per control step, however long the
+# profile.
+from array import array
+from time import ticks_diff, ticks_add
+
+LINEAR = 0
+SCURVE = 1 # smoothstep: starts and ends at zero rate, peaks at 1.5x the mean
+WAIT = 2 # no length, holds until target() is given a temperature down to it
+
+class Trajectory:
+    def __init__(self, fallFs=0.015, landF=4.0, shape=SCURVE, segments=8):
+        # fastest the target falls, F/s. The heater can only stop, and a
+        # target coming down slower than the oil cools by itself would only
+        # hold it up. So the target steps down to landF above the new value,
+        # waits there for the oil, and only ramps that last bit: the heater
+        # is back in play before the oil arrives, rather than after it
+        # undershoots
+        self.fallFs = fallFs
+        self.landF = landF
+        self.shape = shape
+        # segment k runs from endMs[k - 1] (0 for the first) to endMs[k],
+        # measured from startMs, fromF to toF
+        self.endMs = array("i", [0] * segments)
+        self.fromF = array("f", [0.0] * segments)
+        self.toF = array("f", [0.0] * segments)
+        self.shapes = array("B", [0] * segments)
+        self.count = 0
+        self.cursor = 0
+        self.startMs = 0
+        self.finalF = 0.0
+
+    def hold(self, tempF):
+        # straight to tempF, no ramp: power on, or the autotuner's set value
+        self.count = 0
+        self.cursor = 0
+        self.finalF = float(tempF)
+
+    def goTo(self, tempF, ms):
+        # from the current target to tempF and stay there
+        self.profile(((tempF, 0),), ms)
+
+    def profile(self, steps, ms):
+        # steps: (tempF, holdS) each, stepped up or ramped down to from the
+        # one before (the current target for the first) and held for holdS;
+        # the last is held for good. ValueError if it needs more segments
+        # than there are
+        startF = self.target(ms)
+        count = 0
+        endMs = 0
+        size = len(self.endMs)
+        last = len(steps) - 1
+        for n, (tempF, holdS) in enumerate(steps):
+            if tempF < startF:
+                if startF > tempF + self.landF:
+                    startF = tempF + self.landF
+                    if count == size:
+                        raise ValueError("profile too long")
+                    self.put(count, endMs, startF, startF, WAIT)
+                    count += 1
+                rampMs = 1000 * (startF - tempF) / self.fallFs
+                rampMs = int(rampMs * (1.5 if self.shape == SCURVE else 1.0))
+                if count == size:
+                    raise ValueError("profile too long")
+                endMs += rampMs + 1
+                self.put(count, endMs, startF, tempF, self.shape)
+                count += 1
+            if holdS > 0 and n < last:
+                if count == size:
+                    raise ValueError("profile too long")
+                endMs += int(holdS * 1000)
+                self.put(count, endMs, tempF, tempF, LINEAR)
+                count += 1
+            startF = tempF
+        self.count = count
+        self.cursor = 0
+        self.startMs = ms
+        self.finalF = float(startF)
+
+    def put(self, k, endMs, fromF, toF, shape):
+        self.endMs[k] = endMs
+        self.fromF[k] = fromF
+        self.toF[k] = toF
+        self.shapes[k] = shape
+
+    def target(self, ms, tempF=None):
+        # F to regulate to at ticks_ms ms, with the oil at tempF. Calls go
+        # forward in time. Without a temperature nothing waits
+        k = self.cursor
+        if k >= self.count:
+            return self.finalF
+        t = ticks_diff(ms, self.startMs)
+        endMs = self.endMs
+        while t >= endMs[k]:
+            if self.shapes[k] == WAIT and tempF is not None and tempF > self.toF[k]:
+                # the clock stops here until the oil is down to it
+                self.cursor = k
+                self.startMs = ticks_add(ms, -endMs[k])
+                return self.toF[k]
+            k += 1
+            if k == self.count:
+                self.cursor = k
+                return self.finalF
+        self.cursor = k
+        beginMs = endMs[k - 1] if k > 0 else 0
+        x = (t - beginMs) / (endMs[k] - beginMs)
+        if x < 0.0:
+            x = 0.0
+        if self.shapes[k] == SCURVE:
+            x = x * x * (3.0 - 2.0 * x)
+        return self.fromF[k] + (self.toF[k] - self.fromF[k]) * x
+
+    def done(self):
+        # True once the last target() was the final value
+        return self.cursor >= self.count